@@ -0,0 +1,355 @@
+"""
+Допуск запросов к backend-у и сброс нагрузки.
+
+Когда backend тормозит, каждый хендлер ждёт свой таймаут целиком, и
+корутины копятся без ограничений. AdmissionController стоит перед
+HTTP-пулом BackendClient: эндпоинты делятся на классы (дешёвые чтения,
+записи, тяжёлые вызовы), у каждого класса свой лимит одновременных
+запросов и своя очередь с дедлайном ожидания. Сумма лимитов классов не
+больше общего лимита (пула соединений), так что тяжёлые вызовы не могут
+занять места дешёвых чтений вроде /wb/auth/status.
+
+Длина очереди считается по закону Литтла: класс с лимитом N и средним
+временем ответа T успевает до дедлайна D обслужить N·D/T ожидающих.
+Кто встаёт в очередь сверх этого, всё равно не дождётся места, поэтому
+получает отказ сразу. T — скользящее среднее по ответам, так что при
+медленном backend-е очередь сама укорачивается.
+
+Если очередь класса полна или дедлайн ожидания вышел, вызов сразу
+получает BackendBusy с оценкой, через сколько стоит повторить. Хендлеры
+ловят её общим except и показывают свой экран ошибки, поэтому после сброса
+апдейт забирает AdmissionMiddleware: ShedGuard (request-middleware сессии
+бота) не пропускает ответы хендлера пользователю, а поднимает BackendBusy,
+и вместо них показывается один экран «сервис перегружен».
+"""
+import asyncio
+import contextvars
+import logging
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterable, NamedTuple
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import (
+    AnswerCallbackQuery,
+    EditMessageReplyMarkup,
+    EditMessageText,
+    Response,
+    SendMessage,
+    TelegramMethod,
+)
+from aiogram.types import TelegramObject
+
+logger = logging.getLogger(__name__)
+
+READ = "read"
+WRITE = "write"
+HEAVY = "heavy"
+
+# Эндпоинты (шаблоны endpoint_label), которые держат backend десятки секунд
+HEAVY_ENDPOINTS = frozenset(
+    {
+        "/auth/start",
+        "/wb/accounts",
+        "/wb/accounts/sync",
+        "/wb/overview",
+        "/supplies/load",
+    }
+)
+
+# Доли пула соединений по умолчанию для классов эндпоинтов
+DEFAULT_SHARES = {READ: 0.5, WRITE: 0.3, HEAVY: 0.2}
+
+# Запросы к Telegram, которые после сброса не доходят до пользователя
+USER_FACING_METHODS = (SendMessage, EditMessageText, EditMessageReplyMarkup)
+
+
+class BackendBusy(Exception):
+    """
+    Вызов не допущен к backend-у: очередь класса полна или вышел дедлайн ожидания.
+    retry_after — через сколько секунд есть смысл повторить.
+    """
+
+    def __init__(self, endpoint_class: str, reason: str, retry_after: float = 0.0) -> None:
+        super().__init__(f"backend is busy: {endpoint_class} queue {reason}")
+        self.endpoint_class = endpoint_class
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _UpdateShed:
+    """
+    Сбросы за время одного апдейта. Учитываются только в задаче хендлера:
+    фоновые задачи, созданные из него, наследуют контекст, но не апдейт.
+    """
+
+    __slots__ = ("task", "calls")
+
+    def __init__(self) -> None:
+        self.task = asyncio.current_task()
+        self.calls: list[BackendBusy] = []
+
+
+_update_shed: contextvars.ContextVar[_UpdateShed | None] = contextvars.ContextVar("update_shed", default=None)
+
+
+def _current_shed() -> _UpdateShed | None:
+    shed = _update_shed.get()
+    if shed is None or shed.task is not asyncio.current_task():
+        return None
+    return shed
+
+
+def note_shed(exc: BackendBusy) -> None:
+    """
+    Отмечает сброшенный вызов в текущем апдейте (и для ведомых single-flight GET).
+    """
+    shed = _current_shed()
+    if shed is not None:
+        shed.calls.append(exc)
+
+
+class EndpointClass(NamedTuple):
+    name: str
+    priority: int  # чем меньше, тем раньше получает освободившееся место
+    limit: int  # одновременных запросов класса
+    max_queue: int  # верхняя граница очереди, сколько бы ни успевал класс
+    queue_timeout: float  # сколько ждать места в очереди, секунд
+    service_time: float  # ожидаемое время ответа до первых замеров, секунд
+
+
+def split_limit(total_limit: int, shares: dict[str, float] = DEFAULT_SHARES) -> dict[str, int]:
+    """
+    Делит общий лимит между классами по долям так, чтобы сумма не вышла
+    за total_limit; каждому классу достаётся хотя бы одно место.
+    """
+    if total_limit < len(shares):
+        raise ValueError(f"total_limit={total_limit} is less than the number of endpoint classes")
+    limits = {name: max(1, int(total_limit * share)) for name, share in shares.items()}
+    # при крошечном лимите минимум в одно место может дать перебор — забираем у самого большого
+    while sum(limits.values()) > total_limit:
+        limits[max(limits, key=limits.get)] -= 1
+    return limits
+
+
+class _ClassState:
+    __slots__ = ("spec", "active", "waiters", "admitted", "shed", "service_time")
+
+    # вес нового замера в скользящем среднем времени ответа
+    SERVICE_TIME_ALPHA = 0.1
+
+    def __init__(self, spec: EndpointClass) -> None:
+        self.spec = spec
+        self.active = 0
+        self.waiters: deque[asyncio.Future] = deque()
+        self.admitted = 0
+        self.shed = {"queue_full": 0, "deadline": 0}
+        self.service_time = spec.service_time
+
+    @property
+    def queued(self) -> int:
+        return len(self.waiters)
+
+    @property
+    def queue_limit(self) -> int:
+        """
+        Сколько ожидающих класс успеет обслужить до дедлайна очереди.
+        """
+        served = math.ceil(self.spec.limit * self.spec.queue_timeout / max(self.service_time, 1e-3))
+        return max(1, min(self.spec.max_queue, served))
+
+    def observe(self, duration: float) -> None:
+        self.service_time += self.SERVICE_TIME_ALPHA * (duration - self.service_time)
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        classes: Iterable[EndpointClass],
+        *,
+        total_limit: int,
+        heavy_endpoints: Iterable[str] = HEAVY_ENDPOINTS,
+    ) -> None:
+        self.total_limit = total_limit
+        self.heavy_endpoints = frozenset(heavy_endpoints)
+        self._classes = {spec.name: _ClassState(spec) for spec in classes}
+        self._by_priority = sorted(self._classes.values(), key=lambda state: state.spec.priority)
+        self._active = 0
+        for name in (READ, WRITE, HEAVY):
+            if name not in self._classes:
+                raise ValueError(f"endpoint class {name!r} is not configured")
+        limits = sum(state.spec.limit for state in self._classes.values())
+        if limits > total_limit:
+            raise ValueError(f"endpoint class limits add up to {limits}, more than total_limit={total_limit}")
+
+    def classify(self, method: str, endpoint: str) -> str:
+        if endpoint in self.heavy_endpoints:
+            return HEAVY
+        return READ if method == "GET" else WRITE
+
+    def _has_room(self, state: _ClassState) -> bool:
+        return state.active < state.spec.limit and self._active < self.total_limit
+
+    def _grant(self, state: _ClassState) -> None:
+        state.active += 1
+        state.admitted += 1
+        self._active += 1
+
+    def _queue_ahead(self, state: _ClassState) -> bool:
+        """
+        Есть ли очередь своего класса или более приоритетного, которая
+        ждёт места в общем лимите (а не в лимите своего класса).
+        """
+        for other in self._by_priority:
+            if other.spec.priority > state.spec.priority:
+                return False
+            if other.waiters and (other is state or other.active < other.spec.limit):
+                return True
+        return False
+
+    async def acquire(self, name: str) -> None:
+        state = self._classes[name]
+        if self._has_room(state) and not self._queue_ahead(state):
+            self._grant(state)
+            return
+        if state.queued >= state.queue_limit:
+            state.shed["queue_full"] += 1
+            raise BackendBusy(name, "full", self._drain_time(state))
+
+        waiter = asyncio.get_running_loop().create_future()
+        state.waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, state.spec.queue_timeout)
+        except asyncio.TimeoutError:
+            state.shed["deadline"] += 1
+            raise BackendBusy(name, "deadline", self._drain_time(state)) from None
+        except asyncio.CancelledError:
+            # место уже выдано, а вызывающего отменили — отдаём следующему
+            if waiter.done() and not waiter.cancelled():
+                self.release(name)
+            raise
+        finally:
+            if not waiter.done() or waiter.cancelled():
+                try:
+                    state.waiters.remove(waiter)
+                except ValueError:
+                    pass
+
+    @staticmethod
+    def _drain_time(state: _ClassState) -> float:
+        """
+        За сколько класс разберёт текущую очередь при нынешнем времени ответа.
+        """
+        return (state.queued + 1) * state.service_time / state.spec.limit
+
+    def release(self, name: str, duration: float | None = None) -> None:
+        state = self._classes[name]
+        if duration is not None:
+            state.observe(duration)
+        state.active -= 1
+        self._active -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        for state in self._by_priority:
+            while state.waiters and self._has_room(state):
+                waiter = state.waiters.popleft()
+                if waiter.done():
+                    continue
+                self._grant(state)
+                waiter.set_result(None)
+            if self._active >= self.total_limit:
+                return
+
+    @asynccontextmanager
+    async def slot(self, method: str, endpoint: str) -> AsyncIterator[None]:
+        name = self.classify(method, endpoint)
+        try:
+            await self.acquire(name)
+        except BackendBusy as e:
+            note_shed(e)
+            logger.warning("Backend call shed: %s %s (%s)", method, endpoint, e.reason)
+            raise
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(name, time.monotonic() - started)
+
+    def stats(self) -> dict[str, dict[str, Any]]:
+        return {
+            name: {
+                "in_flight": state.active,
+                "queued": state.queued,
+                "queue_limit": state.queue_limit,
+                "admitted": state.admitted,
+                "shed": dict(state.shed),
+            }
+            for name, state in self._classes.items()
+        }
+
+
+class AdmissionMiddleware(BaseMiddleware):
+    """
+    Inner-middleware: если за время апдейта хоть один вызов backend-а был
+    сброшен, вызывает on_busy (экран «сервис перегружен»). BackendBusy,
+    которую поднял ShedGuard на ответе хендлера, здесь гасится: экран
+    ошибки хендлера так и не ушёл, вместо него показывается on_busy.
+    Регистрировать после FSMSessionMiddleware, чтобы on_busy писал в ту же
+    FSM-сессию, что и хендлер.
+    """
+
+    def __init__(self, on_busy: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]]) -> None:
+        self.on_busy = on_busy
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        shed = _UpdateShed()
+        token = _update_shed.set(shed)
+        try:
+            return await handler(event, data)
+        except BackendBusy:
+            if not shed.calls:
+                raise
+            return None
+        finally:
+            _update_shed.reset(token)
+            if shed.calls:
+                try:
+                    await self.on_busy(event, data)
+                except Exception as e:
+                    logger.error("Error showing backend busy screen: %s", e)
+
+
+class ShedGuard(BaseRequestMiddleware):
+    """
+    Request-middleware сессии бота: после сброса в текущем апдейте не
+    отправляет сообщения и правки экранов (USER_FACING_METHODS, а также
+    всплывающие ответы на callback), а поднимает BackendBusy. Удаления
+    сообщений и пустые ответы на callback проходят как обычно.
+    """
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType,
+        bot: Bot,
+        method: TelegramMethod,
+    ) -> Response:
+        shed = _current_shed()
+        if shed is not None and shed.calls and _user_facing(method):
+            last = shed.calls[-1]
+            raise BackendBusy(last.endpoint_class, last.reason, last.retry_after)
+        return await make_request(bot, method)
+
+
+def _user_facing(method: TelegramMethod) -> bool:
+    if isinstance(method, AnswerCallbackQuery):
+        return bool(method.text)
+    return isinstance(method, USER_FACING_METHODS)
@@ -0,0 +1,756 @@
+"""
+Клиент backend-а бота.
+
+Один httpx.AsyncClient с пулом keep-alive соединений на весь процесс:
+main() открывает его перед стартом polling и закрывает при остановке,
+а хендлеры ходят в backend только через методы BackendClient.
+"""
+import asyncio
+import logging
+import random
+import re
+import time
+import uuid
+from collections import deque
+from functools import partial
+from typing import Any, NamedTuple, Protocol
+
+import httpx
+
+from admission import AdmissionController, BackendBusy, note_shed
+from circuit import CircuitBreakers
+
+_ID_SEGMENT = re.compile(r"^(\d+|[0-9a-fA-F-]{16,})$")
+
+logger = logging.getLogger(__name__)
+
+
+def endpoint_label(path: str) -> str:
+    """
+    Шаблон пути для метрик: числовые и uuid-подобные сегменты заменяются на {id}.
+    """
+    return "/".join("{id}" if _ID_SEGMENT.match(part) else part for part in path.split("/"))
+
+
+class RequestPolicy(NamedTuple):
+    """
+    Таймауты и повторы эндпоинта. connect/read — на одну попытку,
+    total — на весь вызов вместе с повторами и паузами между ними.
+    """
+
+    connect: float = 3.0
+    read: float = 10.0
+    total: float = 10.0
+    retries: int = 0
+    backoff: float = 0.2  # базовая пауза перед повтором, удваивается с каждой попыткой
+    hedge: bool = False  # идемпотентное чтение: можно дублировать медленный запрос
+
+
+# GET-ы по умолчанию повторяются; POST повторяется, только если в таблице
+# у него есть retries, и тогда уходит с Idempotency-Key, общим для всех попыток
+DEFAULT_GET_POLICY = RequestPolicy(read=10.0, total=15.0, retries=2)
+DEFAULT_POLICY = RequestPolicy(read=10.0, total=10.0)
+
+ENDPOINT_POLICIES: dict[tuple[str, str], RequestPolicy] = {
+    ("POST", "/users/register"): RequestPolicy(read=5.0, total=5.0),
+    ("POST", "/auth/start"): RequestPolicy(read=60.0, total=60.0),
+    ("POST", "/auth/code"): RequestPolicy(read=15.0, total=15.0),
+    ("POST", "/logout"): RequestPolicy(read=5.0, total=5.0),
+    ("GET", "/requests/history"): RequestPolicy(read=15.0, total=20.0, retries=1, hedge=True),
+    ("POST", "/slots/search"): RequestPolicy(read=20.0, total=30.0, retries=1),
+    ("GET", "/wb/accounts"): RequestPolicy(read=30.0, total=40.0, retries=1, hedge=True),
+    ("GET", "/slots/search/{id}"): RequestPolicy(read=10.0, total=15.0, retries=2, hedge=True),
+    ("POST", "/wb/accounts/sync"): RequestPolicy(read=30.0, total=30.0),
+    ("GET", "/wb/overview"): RequestPolicy(read=30.0, total=40.0, retries=1, hedge=True),
+    # повторы /wb/autobooking делает очередь задач со своим ключом
+    ("POST", "/wb/autobooking"): RequestPolicy(read=20.0, total=20.0),
+    ("POST", "/autobook/create"): RequestPolicy(read=10.0, total=15.0, retries=2),
+    ("POST", "/supplies/load"): RequestPolicy(read=120.0, total=120.0),
+    ("POST", "/supplies/load/jobs"): RequestPolicy(read=15.0, total=15.0),
+}
+
+# Ответы, после которых повтор имеет смысл: backend перезапускается или перегружен
+RETRY_STATUSES = frozenset({502, 503, 504})
+
+
+class RetryBudget:
+    """
+    Бюджет повторов эндпоинта: каждый первый вызов добавляет ratio
+    токена, каждый повтор тратит один. Пока backend лежит, повторы
+    быстро кончаются и не удваивают нагрузку на него. Тем же бюджетом
+    (со своим ratio) ограничиваются hedge-запросы.
+    """
+
+    def __init__(self, ratio: float = 0.1, reserve: float = 10.0) -> None:
+        self.ratio = ratio
+        self.capacity = reserve
+        self.tokens = reserve
+
+    def deposit(self) -> None:
+        self.tokens = min(self.capacity, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class LatencyWindow:
+    """
+    Латентности последних ответов эндпоинта для порога hedge-запроса.
+    Квантиль пересчитывается не на каждый вызов, а раз в recompute ответов.
+    """
+
+    def __init__(self, size: int = 200, min_samples: int = 20, recompute: int = 20) -> None:
+        self._samples: deque[float] = deque(maxlen=size)
+        self.min_samples = min_samples
+        self.recompute = recompute
+        self._stale = 0
+        self._cached: tuple[float, float] | None = None  # (q, значение)
+
+    def observe(self, duration: float) -> None:
+        self._samples.append(duration)
+        self._stale += 1
+
+    def quantile(self, q: float) -> float | None:
+        if len(self._samples) < self.min_samples:
+            return None
+        if self._cached is None or self._cached[0] != q or self._stale >= self.recompute:
+            ordered = sorted(self._samples)
+            self._cached = (q, ordered[min(len(ordered) - 1, int(q * len(ordered)))])
+            self._stale = 0
+        return self._cached[1]
+
+
+class _Flight:
+    """
+    GET в полёте и число вызывающих, которые ждут его ответ.
+    """
+
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Future) -> None:
+        self.task = task
+        self.waiters = 0
+
+
+class BackendInstrumentation(Protocol):
+    def observe(
+        self,
+        method: str,
+        endpoint: str,
+        status: str,
+        duration: float,
+        request_bytes: int,
+        response_bytes: int,
+    ) -> None: ...
+
+    def retry(self, method: str, endpoint: str) -> None: ...
+
+    def hedge(self, method: str, endpoint: str, result: str) -> None: ...
+
+
+class BackendRecorder(Protocol):
+    def backend_call(
+        self,
+        method: str,
+        path: str,
+        params: Any,
+        status: str,
+        duration: float,
+        body: bytes | None,
+    ) -> None: ...
+
+
+class BackendClient:
+    """
+    Типизированный фасад над HTTP API backend-а.
+
+    Методы повторяют эндпоинты backend-а один к одному, возвращают уже
+    разобранный JSON и бросают httpx.HTTPStatusError на ответах 4xx/5xx,
+    поэтому обработка ошибок в хендлерах остаётся прежней.
+
+    Таймауты и повторы берутся из ENDPOINT_POLICIES: GET-ы и POST-ы с
+    Idempotency-Key повторяются с jitter-паузой на таймаутах, сетевых
+    ошибках и 502/503/504, пока не вышел total и есть бюджет повторов.
+    Чтения с hedge в политике при hedge_percentile дублируются, если
+    ответа нет дольше этого квантиля латентности эндпоинта: берётся тот
+    ответ, что пришёл первым, второй запрос отменяется.
+
+    Одинаковые GET-запросы (путь + параметры), которые уже летят в backend,
+    не дублируются: все вызывающие ждут один upstream-запрос и получают
+    его ответ, каждый со своей копией JSON.
+
+    С admission каждый поход в backend сначала получает место у
+    AdmissionController; если backend перегружен, вызов сразу падает с
+    BackendBusy вместо ожидания своего таймаута. С circuits эндпоинт,
+    который часто падает, на время cooldown отвечает CircuitOpen без
+    похода в backend.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        *,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        timeout: float = 10.0,
+        policies: dict[tuple[str, str], RequestPolicy] | None = None,
+        retry_budget_ratio: float = 0.1,
+        hedge_percentile: float | None = None,
+        hedge_budget_ratio: float = 0.05,
+        instrumentation: BackendInstrumentation | None = None,
+        slow_call_threshold: float | None = None,
+        recorder: BackendRecorder | None = None,
+        transport: httpx.AsyncBaseTransport | None = None,
+        admission: AdmissionController | None = None,
+        circuits: CircuitBreakers | None = None,
+    ) -> None:
+        self.base_url = base_url
+        self.admission = admission
+        self.circuits = circuits
+        self.instrumentation = instrumentation
+        self.recorder = recorder
+        # подменяемый транспорт: replay.py отвечает записанными ответами
+        self.transport = transport
+        self.slow_call_threshold = slow_call_threshold
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = timeout
+        self.policies = ENDPOINT_POLICIES if policies is None else policies
+        self.retry_budget_ratio = retry_budget_ratio
+        self._retry_budgets: dict[tuple[str, str], RetryBudget] = {}
+        self.hedge_percentile = hedge_percentile
+        self.hedge_budget_ratio = hedge_budget_ratio
+        self._hedge_budgets: dict[tuple[str, str], RetryBudget] = {}
+        self._latencies: dict[tuple[str, str], LatencyWindow] = {}
+        self._client: httpx.AsyncClient | None = None
+        self._inflight: dict[tuple, _Flight] = {}
+        self.upstream_gets = 0
+        self.coalesced_gets = 0
+
+    async def open(self) -> None:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                limits=self.limits,
+                timeout=self.timeout,
+                transport=self.transport,
+            )
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            raise RuntimeError("BackendClient is not opened, call open() in main() first")
+        return self._client
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        *,
+        timeout: float | httpx.Timeout | None = None,
+        attempt: int = 1,
+        **kwargs: Any,
+    ) -> httpx.Response:
+        """
+        Одна попытка запроса без проверки статуса и без повторов;
+        таймаут по умолчанию — connect/read из политики эндпоинта.
+
+        Каждый поход в backend попадает в метрики (латентность, статус, байты;
+        attempt > 1 считается повтором), а вызовы дольше slow_call_threshold
+        пишутся в лог медленных запросов. Если задан recorder, ответ
+        (или таймаут/ошибка) уходит ещё и в запись для replay.py.
+        """
+        endpoint = endpoint_label(path)
+        if timeout is None:
+            policy = self.policy(method, endpoint)
+            timeout = httpx.Timeout(policy.read, connect=policy.connect)
+        kwargs["timeout"] = timeout
+
+        if attempt > 1 and self.instrumentation is not None:
+            self.instrumentation.retry(method, endpoint)
+
+        if self.circuits is None:
+            return await self._admit(method, path, endpoint, kwargs)
+
+        circuit = self.circuits.get(endpoint)
+        probe = circuit.allow()
+        ok = None
+        try:
+            resp = await self._admit(method, path, endpoint, kwargs)
+        except httpx.TransportError:
+            ok = False
+            raise
+        else:
+            ok = resp.status_code < 500
+            return resp
+        finally:
+            circuit.record(ok, probe)
+
+    async def _admit(self, method: str, path: str, endpoint: str, kwargs: dict[str, Any]) -> httpx.Response:
+        if self.admission is None:
+            return await self._send(method, path, endpoint, kwargs)
+        async with self.admission.slot(method, endpoint):
+            return await self._send(method, path, endpoint, kwargs)
+
+    async def _send(self, method: str, path: str, endpoint: str, kwargs: dict[str, Any]) -> httpx.Response:
+        started = time.perf_counter()
+        status = "error"
+        request_bytes = response_bytes = 0
+        resp = None
+        try:
+            resp = await self.client.request(method, path, **kwargs)
+        except httpx.TimeoutException:
+            status = "timeout"
+            raise
+        except asyncio.CancelledError:
+            # в том числе проигравший hedge-запрос
+            status = "cancelled"
+            raise
+        else:
+            status = str(resp.status_code)
+            request_bytes = len(resp.request.content)
+            response_bytes = len(resp.content)
+            return resp
+        finally:
+            duration = time.perf_counter() - started
+            if self.instrumentation is not None:
+                self.instrumentation.observe(method, endpoint, status, duration, request_bytes, response_bytes)
+            window = self._latencies.get((method, endpoint))
+            if window is not None and resp is not None:
+                window.observe(duration)
+            if self.recorder is not None and status != "cancelled":
+                self.recorder.backend_call(
+                    method,
+                    path,
+                    kwargs.get("params"),
+                    status,
+                    duration,
+                    resp.content if resp is not None else None,
+                )
+            if self.slow_call_threshold is not None and duration >= self.slow_call_threshold:
+                logger.warning(
+                    "Slow backend call: %s %s took %.2fs",
+                    method,
+                    path,
+                    duration,
+                    extra={
+                        "endpoint": endpoint,
+                        "status": status,
+                        "duration": round(duration, 3),
+                        "request_bytes": request_bytes,
+                        "response_bytes": response_bytes,
+                    },
+                )
+
+    def policy(self, method: str, endpoint: str) -> RequestPolicy:
+        policy = self.policies.get((method, endpoint))
+        if policy is not None:
+            return policy
+        return DEFAULT_GET_POLICY if method == "GET" else DEFAULT_POLICY
+
+    async def request_with_retries(self, method: str, path: str, **kwargs: Any) -> httpx.Response:
+        """
+        Запрос по политике эндпоинта: каждая попытка вместе с ожиданием
+        допуска обрывается по остатку total, повторы — с паузой full jitter
+        и в пределах бюджета.
+        POST с повторами получает Idempotency-Key, один на все попытки.
+        """
+        endpoint = endpoint_label(path)
+        policy = self.policy(method, endpoint)
+        budget = self._retry_budgets.get((method, endpoint))
+        if budget is None:
+            budget = self._retry_budgets[(method, endpoint)] = RetryBudget(self.retry_budget_ratio)
+        budget.deposit()
+        if method != "GET" and policy.retries:
+            kwargs["headers"] = {"Idempotency-Key": uuid.uuid4().hex, **(kwargs.get("headers") or {})}
+
+        deadline = time.monotonic() + policy.total
+        attempt = 1
+        while True:
+            remaining = max(deadline - time.monotonic(), 0.1)
+            timeout = httpx.Timeout(
+                min(policy.read, remaining), connect=min(policy.connect, remaining)
+            )
+            if policy.hedge and method == "GET" and self.hedge_percentile:
+                call = self._hedged(method, path, endpoint, timeout=timeout, attempt=attempt, **kwargs)
+            else:
+                call = self.request(method, path, timeout=timeout, attempt=attempt, **kwargs)
+            try:
+                # таймауты httpx — на каждую операцию с сокетом, а медленный
+                # ответ по кусочку и ожидание в очереди допуска их не трогают
+                try:
+                    resp = await asyncio.wait_for(call, remaining)
+                except asyncio.TimeoutError:
+                    raise httpx.TimeoutException(
+                        f"{method} {endpoint}: no response within total={policy.total}s"
+                    ) from None
+            except httpx.TransportError as e:
+                error: Exception | None = e
+                resp = None
+            else:
+                if resp.status_code not in RETRY_STATUSES:
+                    return resp
+                error = None
+
+            pause = random.uniform(0, policy.backoff * 2 ** (attempt - 1))
+            if (
+                attempt > policy.retries
+                or deadline - time.monotonic() <= pause
+                or not budget.withdraw()
+            ):
+                if error is not None:
+                    raise error
+                return resp
+            logger.info(
+                "Retrying %s %s after %s (attempt %s)",
+                method,
+                endpoint,
+                type(error).__name__ if error is not None else resp.status_code,
+                attempt + 1,
+            )
+            await asyncio.sleep(pause)
+            attempt += 1
+
+    async def _hedged(self, method: str, path: str, endpoint: str, **kwargs: Any) -> httpx.Response:
+        """
+        Попытка с hedge-запросом: если первый запрос не ответил за
+        hedge_percentile-квантиль латентности эндпоинта и бюджет позволяет,
+        отправляется второй. Возвращается первый ответ не из RETRY_STATUSES,
+        иначе — результат последнего завершившегося запроса.
+        """
+        key = (method, endpoint)
+        window = self._latencies.get(key)
+        if window is None:
+            window = self._latencies[key] = LatencyWindow()
+        budget = self._hedge_budgets.get(key)
+        if budget is None:
+            budget = self._hedge_budgets[key] = RetryBudget(self.hedge_budget_ratio)
+        budget.deposit()
+
+        primary = asyncio.ensure_future(self.request(method, path, **kwargs))
+        hedge = None
+        pending = {primary}
+        try:
+            delay = window.quantile(self.hedge_percentile)
+            if delay is not None:
+                done, _ = await asyncio.wait(pending, timeout=delay)
+                if not done and budget.withdraw():
+                    # hedge — не повтор: с attempt=1 он не попадёт в backend_retries_total
+                    hedge = asyncio.ensure_future(self.request(method, path, **{**kwargs, "attempt": 1}))
+                    pending.add(hedge)
+
+            last = primary
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    last = task
+                    if task.exception() is None and task.result().status_code not in RETRY_STATUSES:
+                        if hedge is not None:
+                            self._hedge_result(method, endpoint, "won" if task is hedge else "lost")
+                        return task.result()
+            if hedge is not None:
+                self._hedge_result(method, endpoint, "failed")
+            return last.result()
+        finally:
+            for task in (primary, hedge):
+                if task is None:
+                    continue
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    # проигравший мог упасть одновременно с победителем
+                    task.exception()
+
+    def _hedge_result(self, method: str, endpoint: str, result: str) -> None:
+        if self.instrumentation is not None:
+            self.instrumentation.hedge(method, endpoint, result)
+
+    async def _get_coalesced(
+        self,
+        path: str,
+        *,
+        params: dict | None = None,
+        **kwargs: Any,
+    ) -> httpx.Response:
+        """
+        GET с single-flight: пока запрос с тем же путём и параметрами в полёте,
+        повторные вызовы ждут его результат вместо нового похода в backend.
+
+        Upstream-запрос идёт отдельной задачей, а каждый вызывающий ждёт её
+        через shield: отмена одного хендлера не обрывает запрос остальным.
+        Задача отменяется, только когда её больше никто не ждёт.
+        """
+        key = (path, tuple(sorted((k, str(v)) for k, v in (params or {}).items())))
+        flight = self._inflight.get(key)
+        if flight is not None:
+            self.coalesced_gets += 1
+        else:
+            self.upstream_gets += 1
+            task = asyncio.ensure_future(self.request_with_retries("GET", path, params=params, **kwargs))
+            flight = self._inflight[key] = _Flight(task)
+            task.add_done_callback(partial(self._land, key, flight))
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except BackendBusy as e:
+            note_shed(e)
+            raise
+        except asyncio.CancelledError:
+            if not flight.task.done() and flight.waiters == 1:
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+
+    def _land(self, key: tuple, flight: _Flight, task: asyncio.Future) -> None:
+        if self._inflight.get(key) is flight:
+            del self._inflight[key]
+        if not flight.waiters and not task.cancelled():
+            # ответ никому не нужен: помечаем ошибку прочитанной
+            task.exception()
+
+    def coalescing_stats(self) -> dict:
+        return {
+            "upstream_gets": self.upstream_gets,
+            "coalesced_gets": self.coalesced_gets,
+            "inflight_gets": len(self._inflight),
+        }
+
+    async def _call(self, method: str, path: str, **kwargs: Any) -> Any:
+        if method == "GET":
+            resp = await self._get_coalesced(path, **kwargs)
+        else:
+            resp = await self.request_with_retries(method, path, **kwargs)
+        resp.raise_for_status()
+        if not resp.content:
+            return None
+        return resp.json()
+
+    # --- пользователи и авторизация WB ---
+
+    async def register_user(self, telegram_id: int, username: str | None) -> None:
+        await self._call(
+            "POST",
+            "/users/register",
+            json={"telegram_id": telegram_id, "username": username},
+        )
+
+    async def get_user_id(self, telegram_id: int) -> int | None:
+        payload = await self._call("GET", "/users/get-id", params={"telegram_id": telegram_id})
+        return (payload or {}).get("user_id")
+
+    async def auth_start(self, telegram_id: int, username: str | None, phone: str) -> dict:
+        return await self._call(
+            "POST",
+            "/auth/start",
+            json={"telegram_id": telegram_id, "username": username, "phone": phone},
+        ) or {}
+
+    async def auth_code(self, session_id: str, code: str) -> dict:
+        return await self._call(
+            "POST",
+            "/auth/code",
+            json={"session_id": session_id, "code": code},
+        ) or {}
+
+    async def wb_auth_status(self, telegram_id: int) -> dict:
+        return await self._call("GET", "/wb/auth/status", params={"telegram_id": telegram_id}) or {}
+
+    async def logout(self, telegram_id: int) -> httpx.Response:
+        return await self.request_with_retries("POST", "/logout", json={"telegram_id": telegram_id})
+
+    # --- склады ---
+
+    async def warehouses(self, page: int, limit: int = 10) -> dict:
+        return await self._call("GET", "/warehouses", params={"page": page, "limit": limit}) or {}
+
+    async def warehouses_availability(self, supply_type: str, warehouses: list[str]) -> dict:
+        return await self._call(
+            "POST",
+            "/warehouses/availability",
+            json={"supply_type": supply_type, "warehouses": warehouses},
+        ) or {}
+
+    # --- поиск слотов ---
+
+    async def requests_history(
+        self,
+        user_id: int,
+        req_type: str,
+        page: int,
+        page_size: int,
+        statuses: list[str] | None = None,
+    ) -> dict:
+        params = {
+            "user_id": user_id,
+            "req_type": req_type,
+            "page": page,
+            "page_size": page_size,
+        }
+        if statuses:
+            params["statuses"] = ",".join(statuses)
+        return await self._call("GET", "/requests/history", params=params) or {}
+
+    async def create_slot_search(self, payload: dict) -> dict:
+        return await self._call("POST", "/slots/search", json=payload) or {}
+
+    async def slot_search_result(self, request_id: int) -> dict:
+        return await self._call("GET", f"/slots/search/{request_id}") or {}
+
+    async def cancel_slot_search_request(self, request_id: int) -> None:
+        await self._call("POST", f"/slots/search/{request_id}/cancel")
+
+    async def slot_search_cancel(self, telegram_id: int, task_id: int) -> dict:
+        return await self._call(
+            "POST", "/slot-search/cancel", json={"telegram_id": telegram_id, "task_id": task_id}
+        ) or {}
+
+    async def slot_search_restart(self, telegram_id: int, task_id: int) -> dict:
+        return await self._call(
+            "POST", "/slot-search/restart", json={"telegram_id": telegram_id, "task_id": task_id}
+        ) or {}
+
+    async def slot_search_delete(self, telegram_id: int, task_id: int) -> None:
+        await self._call(
+            "POST",
+            "/slot-search/delete",
+            json={"telegram_id": telegram_id, "slot_search_task_id": task_id},
+        )
+
+    # --- аккаунты WB и автобронь ---
+
+    async def wb_accounts(self, user_id: int, page: int, per_page: int) -> dict:
+        return await self._call(
+            "GET",
+            "/wb/accounts",
+            params={"user_id": user_id, "page": page, "per_page": per_page},
+        ) or {}
+
+    async def sync_wb_accounts(self, user_id: int) -> None:
+        await self._call(
+            "POST",
+            "/wb/accounts/sync",
+            params={"user_id": user_id},
+            headers={"accept": "application/json"},
+            content=b"",
+        )
+
+    async def wb_overview(self, user_id: int, seller_account_id: int, page: int, per_page: int) -> dict:
+        return await self._call(
+            "GET",
+            "/wb/overview",
+            params={
+                "user_id": user_id,
+                "seller_account_id": seller_account_id,
+                "page": page,
+                "per_page": per_page,
+            },
+        ) or {}
+
+    async def wb_autobooking(
+        self, payload: dict, idempotency_key: str | None = None, attempt: int = 1
+    ) -> httpx.Response:
+        headers = {"Idempotency-Key": idempotency_key} if idempotency_key else None
+        resp = await self.request(
+            "POST", "/wb/autobooking", json=payload, headers=headers, attempt=attempt
+        )
+        resp.raise_for_status()
+        return resp
+
+    async def autobook_options(self, telegram_id: int, slot_search_task_id: int) -> dict:
+        return await self._call(
+            "POST",
+            "/autobook/options",
+            json={"telegram_id": telegram_id, "slot_search_task_id": slot_search_task_id},
+        ) or {}
+
+    async def autobook_create(
+        self, telegram_id: int, slot_search_task_id: int, logistics_accept_mode: str = "any"
+    ) -> dict:
+        return await self._call(
+            "POST",
+            "/autobook/create",
+            json={
+                "telegram_id": telegram_id,
+                "slot_search_task_id": slot_search_task_id,
+                "logistics_accept_mode": logistics_accept_mode,
+            },
+        ) or {}
+
+    async def autobook_start(self, telegram_id: int, autobook_task_id: int) -> dict:
+        return await self._call(
+            "POST",
+            "/autobook/start",
+            json={"telegram_id": telegram_id, "autobook_task_id": autobook_task_id},
+        ) or {}
+
+    async def autobook_stop(self, telegram_id: int, autobook_task_id: int) -> dict:
+        return await self._call(
+            "POST",
+            "/autobook/stop",
+            json={"telegram_id": telegram_id, "autobook_task_id": autobook_task_id},
+        ) or {}
+
+    async def autobook_delete(self, telegram_id: int, autobook_task_id: int) -> None:
+        await self._call(
+            "POST",
+            "/autobook/delete",
+            json={"telegram_id": telegram_id, "autobook_task_id": autobook_task_id},
+        )
+
+    async def supplies_load(self, user_id: int, request_id: int, debug: bool = False) -> dict:
+        return await self._call(
+            "POST",
+            "/supplies/load",
+            params={"user_id": user_id, "request_id": request_id, "debug": debug},
+        ) or {}
+
+    async def supplies_load_submit(self, user_id: int, request_id: int, debug: bool = False) -> dict:
+        """
+        Ставит /supplies/load в очередь backend-а; ответ — {"job_id", "status"}.
+        """
+        return await self._call(
+            "POST",
+            "/supplies/load/jobs",
+            params={"user_id": user_id, "request_id": request_id, "debug": debug},
+        ) or {}
+
+    async def supplies_load_status(self, job_id: str) -> dict:
+        """
+        Статус задачи: status (queued/running/done/failed), progress, stage, result, error.
+        """
+        return await self._call("GET", f"/supplies/load/jobs/{job_id}") or {}
+
+    # --- перераспределения остатков ---
+
+    async def stock_move_list(self, telegram_id: int) -> list:
+        return await self._call("GET", "/stock-move/list", params={"telegram_id": telegram_id}) or []
+
+    async def stock_move_options(self) -> dict:
+        return await self._call("GET", "/stock-move/options") or {}
+
+    async def stock_move_create(self, payload: dict) -> dict:
+        return await self._call("POST", "/stock-move/create", json=payload) or {}
+
+    async def stock_move_cancel(self, telegram_id: int, task_id: int) -> None:
+        await self._call(
+            "POST", "/stock-move/cancel", json={"telegram_id": telegram_id, "task_id": task_id}
+        )
+
+    async def stock_move_restart(self, telegram_id: int, task_id: int) -> None:
+        await self._call(
+            "POST", "/stock-move/restart", json={"telegram_id": telegram_id, "task_id": task_id}
+        )
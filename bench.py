@@ -0,0 +1,331 @@
+"""
+Нагрузочный стенд: тысячи виртуальных пользователей проходят визарды бота.
+
+Поднимает в процессе эмулятор Telegram (fake_telegram.py) и заглушку
+backend-а (fake_backend.py) с заданной задержкой, собирает тот же
+диспетчер, что и main() (front.build_dispatcher), и кормит его апдейтами
+напрямую через feed_raw_update. Каждый пользователь шлёт /start и дальше
+нажимает кнопки из клавиатур, которые бот ему реально прислал, по
+сценарию поиска слотов или автоброни.
+
+В конце печатает пропускную способность (апдейты/с), p50/p99 латентности
+обработки по маршрутам, число вызовов Telegram и backend-а и память.
+
+Пример:
+    python bench.py --users 2000 --concurrency 500 --backend-latency 0.05
+    python bench.py --users 500 --scenario autobook --json before.json
+    python bench.py --users 200 --record recording.jsonl   # запись для replay.py
+"""
+import argparse
+import asyncio
+import collections
+import itertools
+import json
+import os
+import random
+import re
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any
+
+from aiohttp import web
+
+from callback_codec import codec as callback_codec
+from fake_backend import FakeBackend
+from fake_telegram import FakeTelegram
+
+USER_ID_BASE = 10_000_000
+
+# шаги сценария: регулярка для callback_data кнопки, которую надо нажать;
+# компактные кнопки сравниваются в развёрнутом виде "prefix:args"
+SCENARIOS: dict[str, tuple[str, ...]] = {
+    "slot": (
+        "menu_search",
+        r"slot_wh_id:\d+",
+        r"slot_supply:\w+",
+        r"slot_coef:\d+",
+        r"slot_log:\w+",
+        r"slot_period:\d+",
+        r"slot_lead:\d+",
+        r"slot_day:(mon|tue|wed|thu|fri|sat|sun)",
+        "slot_day:done",
+        "slot_confirm:create",
+    ),
+    "autobook": (
+        "menu_autobook",
+        "autobook_menu:create",
+        r"autobook_new_account:\d+",
+        r"autobook_new_draft:\d+",
+        "autobook_new_manual",
+        r"autobook_wh_id:\d+",
+        "autobook_wh_done",
+        r"autobook_supply:\w+",
+        r"autobook_coef:\d+",
+        r"autobook_log:\w+",
+        r"autobook_period:\d+",
+        r"autobook_lead:\d+",
+        r"autobook_day:(mon|tue|wed|thu|fri|sat|sun)",
+        "autobook_day:done",
+        "autobook_new_confirm",
+    ),
+}
+
+
+def percentile(values: list[float], q: float) -> float:
+    """
+    Квантиль методом ближайшего ранга; values должен быть отсортирован.
+    """
+    if not values:
+        return 0.0
+    rank = max(0, min(len(values) - 1, int(q * len(values) + 0.5) - 1))
+    return values[rank]
+
+
+def max_rss_mb() -> float:
+    # ru_maxrss на Linux в килобайтах, на macOS — в байтах
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+async def start_server(app: web.Application, host: str = "127.0.0.1") -> tuple[web.AppRunner, str]:
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host=host, port=0)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f"http://{host}:{port}"
+
+
+class Simulation:
+    """
+    Виртуальные пользователи и замеры. Пользователь действует
+    последовательно: следующий апдейт — только после обработки предыдущего,
+    как человек, который ждёт ответа бота.
+    """
+
+    def __init__(self, dp: Any, bot: Any, telegram: FakeTelegram, *, think_time: float = 0.0) -> None:
+        self.dp = dp
+        self.bot = bot
+        self.telegram = telegram
+        self.think_time = think_time
+        self.latencies: dict[str, list[float]] = collections.defaultdict(list)
+        self.errors: collections.Counter[str] = collections.Counter()
+        self.completed: collections.Counter[str] = collections.Counter()
+        # на каком шаге пользователь не нашёл нужную кнопку
+        self.stuck: collections.Counter[str] = collections.Counter()
+        self._update_ids = itertools.count(1)
+
+    async def feed(self, route: str, update: dict) -> None:
+        started = time.perf_counter()
+        try:
+            await self.dp.feed_raw_update(self.bot, update)
+        except Exception as e:
+            self.errors[f"{route}: {type(e).__name__}"] += 1
+        finally:
+            self.latencies[route].append(time.perf_counter() - started)
+
+    async def run_user(self, index: int, scenario: str) -> None:
+        user_id = USER_ID_BASE + index
+        user = {"id": user_id, "is_bot": False, "first_name": f"bench{index}", "username": f"bench{index}"}
+
+        message = self.telegram.user_message(user_id, user, "/start")
+        await self.feed("/start", {"update_id": next(self._update_ids), "message": message})
+
+        for step in SCENARIOS[scenario]:
+            if self.think_time:
+                await asyncio.sleep(random.expovariate(1 / self.think_time))
+            found = self.telegram.find_button(user_id, re.compile(step), callback_codec.expand)
+            if found is None:
+                self.stuck[f"{scenario}: {step}"] += 1
+                return
+            message, data = found
+            update_id = next(self._update_ids)
+            callback_query = {
+                "id": str(update_id),
+                "from": user,
+                "chat_instance": str(user_id),
+                "data": data,
+                "message": message,
+            }
+            await self.feed("cb:" + callback_codec.route(data), {"update_id": update_id, "callback_query": callback_query})
+        self.completed[scenario] += 1
+
+    def updates(self) -> int:
+        return sum(len(v) for v in self.latencies.values())
+
+
+def configure_env(backend_url: str, workdir: str) -> None:
+    """
+    front.py читает конфиг при импорте, поэтому окружение выставляется
+    до него. Уже заданные переменные (FSM_STORAGE и т.п.) не трогаем.
+    """
+    os.environ["BACKEND_URL"] = backend_url
+    os.environ.setdefault("BOT_TOKEN", "123456:BENCH")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ.setdefault("FSM_STORAGE", "memory")
+    os.environ["FSM_SQLITE_PATH"] = os.path.join(workdir, "fsm.sqlite3")
+    os.environ["JOBS_DB_PATH"] = os.path.join(workdir, "jobs.sqlite3")
+
+
+async def wait_jobs(front: Any, timeout: float) -> dict:
+    deadline = time.monotonic() + timeout
+    while True:
+        stats = await front.job_queue.stats()
+        if not stats.get("pending") and not stats.get("running") or time.monotonic() > deadline:
+            return stats
+        await asyncio.sleep(0.1)
+
+
+async def run(args: argparse.Namespace) -> dict:
+    telegram = FakeTelegram(latency=args.tg_latency, jitter=args.tg_jitter)
+    fake_backend = FakeBackend(latency=args.backend_latency, jitter=args.backend_jitter)
+    tg_runner, tg_url = await start_server(telegram.app())
+    backend_runner, backend_url = await start_server(fake_backend.app())
+    workdir = tempfile.TemporaryDirectory(prefix="bench-")
+    configure_env(backend_url, workdir.name)
+    if args.record:
+        os.environ["UPDATE_RECORD_PATH"] = args.record
+
+    import front
+    from aiogram import Bot
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+
+    front.setup_logging(front.LOG_LEVEL, queue_size=front.LOG_QUEUE_SIZE)
+    session = AiohttpSession(api=TelegramAPIServer.from_base(tg_url), limit=args.tg_connections)
+    bot = Bot(front.BOT_TOKEN, session=session)
+    bot.session.middleware(front.shed_guard)
+    if args.rate_limit:
+        bot.session.middleware(front.outbound_scheduler)
+    dp = front.build_dispatcher()
+    front.register_jobs(bot)
+    if front.update_recorder is not None:
+        front.update_recorder.start()
+        dp.update.outer_middleware(front.update_recorder)
+
+    await front.backend.open()
+    await front.job_queue.start()
+    try:
+        await front.warehouse_catalog.load()
+
+        scenarios = list(SCENARIOS) if args.scenario == "mixed" else [args.scenario]
+        sim = Simulation(dp, bot, telegram, think_time=args.think_time)
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def user(index: int) -> None:
+            async with semaphore:
+                await sim.run_user(index, scenarios[index % len(scenarios)])
+
+        if args.tracemalloc:
+            tracemalloc.start()
+        rss_before = max_rss_mb()
+        started = time.perf_counter()
+        await asyncio.gather(*(user(i) for i in range(args.users)))
+        elapsed = time.perf_counter() - started
+        traced_peak = tracemalloc.get_traced_memory()[1] if args.tracemalloc else None
+        rss_after = max_rss_mb()
+
+        jobs = await wait_jobs(front, args.jobs_timeout)
+    finally:
+        await front.supplies_load_tracker.stop()
+        await front.job_queue.stop()
+        await front.backend.aclose()
+        await bot.session.close()
+        await dp.storage.close()
+        if front.update_recorder is not None:
+            front.update_recorder.close()
+        await backend_runner.cleanup()
+        await tg_runner.cleanup()
+        front.shutdown_logging()
+        workdir.cleanup()
+
+    all_latencies = sorted(itertools.chain.from_iterable(sim.latencies.values()))
+    routes = {}
+    for route, values in sorted(sim.latencies.items()):
+        values.sort()
+        routes[route] = {
+            "count": len(values),
+            "p50_ms": round(percentile(values, 0.5) * 1000, 2),
+            "p99_ms": round(percentile(values, 0.99) * 1000, 2),
+            "max_ms": round(values[-1] * 1000, 2),
+        }
+
+    return {
+        "users": args.users,
+        "concurrency": args.concurrency,
+        "scenario": args.scenario,
+        "elapsed_s": round(elapsed, 3),
+        "updates": sim.updates(),
+        "updates_per_s": round(sim.updates() / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(all_latencies, 0.5) * 1000, 2),
+        "p99_ms": round(percentile(all_latencies, 0.99) * 1000, 2),
+        "completed": dict(sim.completed),
+        "stuck": dict(sim.stuck),
+        "errors": dict(sim.errors),
+        "routes": routes,
+        "telegram_calls": dict(telegram.calls),
+        "telegram_errors": dict(telegram.errors),
+        "backend_calls": dict(fake_backend.calls),
+        "jobs": jobs,
+        "max_rss_mb": round(rss_after, 1),
+        "rss_growth_mb": round(rss_after - rss_before, 1),
+        "tracemalloc_peak_mb": round(traced_peak / (1024 * 1024), 1) if traced_peak is not None else None,
+        "log_records_dropped": front.dropped_records(),
+    }
+
+
+def print_report(result: dict) -> None:
+    print(
+        f"users={result['users']} concurrency={result['concurrency']} scenario={result['scenario']}\n"
+        f"updates={result['updates']} in {result['elapsed_s']}s -> {result['updates_per_s']} updates/s\n"
+        f"latency p50={result['p50_ms']}ms p99={result['p99_ms']}ms\n"
+        f"completed={result['completed']} stuck={result['stuck']} errors={result['errors']}\n"
+        f"memory: max_rss={result['max_rss_mb']}MB (+{result['rss_growth_mb']}MB during run)"
+        + (f", tracemalloc peak={result['tracemalloc_peak_mb']}MB" if result["tracemalloc_peak_mb"] is not None else "")
+    )
+    print(f"\n{'route':<32}{'count':>8}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for route, row in result["routes"].items():
+        print(f"{route:<32}{row['count']:>8}{row['p50_ms']:>10}{row['p99_ms']:>10}{row['max_ms']:>10}")
+    print(f"\ntelegram calls: {result['telegram_calls']}")
+    if result["telegram_errors"]:
+        print(f"telegram errors: {result['telegram_errors']}")
+    print(f"backend calls: {result['backend_calls']}")
+    print(f"jobs: {result['jobs']}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=200, help="сколько пользователей активны одновременно")
+    parser.add_argument("--scenario", choices=("mixed", *SCENARIOS), default="mixed")
+    parser.add_argument("--think-time", type=float, default=0.0, help="средняя пауза между нажатиями, с")
+    parser.add_argument("--backend-latency", type=float, default=0.02)
+    parser.add_argument("--backend-jitter", type=float, default=0.01)
+    parser.add_argument("--tg-latency", type=float, default=0.0)
+    parser.add_argument("--tg-jitter", type=float, default=0.0)
+    parser.add_argument("--tg-connections", type=int, default=100, help="лимит соединений сессии бота")
+    parser.add_argument(
+        "--rate-limit",
+        action="store_true",
+        help="включить OutboundScheduler (лимиты Telegram); по умолчанию меряется сам бот",
+    )
+    parser.add_argument("--tracemalloc", action="store_true", help="пик аллокаций (замедляет прогон)")
+    parser.add_argument("--jobs-timeout", type=float, default=30.0, help="сколько ждать фоновые задачи")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", dest="json_path", help="сохранить результат в файл для сравнения версий")
+    parser.add_argument("--record", help="записать прогон в JSONL для replay.py")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    result = asyncio.run(run(args))
+    print_report(result)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
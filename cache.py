@@ -0,0 +1,272 @@
+"""
+Внутрипроцессные кэши бота.
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """
+    Ограниченный по числу записей словарь с вытеснением давно не используемых.
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        if maxsize <= 0:
+            raise ValueError("maxsize must be positive")
+        self.maxsize = maxsize
+        self._data: OrderedDict[Hashable, Any] = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        try:
+            value = self._data[key]
+        except KeyError:
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        return self._data.pop(key, default)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+def approx_size(value: Any) -> int:
+    """
+    Грубая оценка размера значения в байтах по его JSON-представлению.
+    """
+    try:
+        return len(json.dumps(value, ensure_ascii=False, default=str).encode("utf-8"))
+    except Exception:
+        return len(repr(value))
+
+
+class TTLCache:
+    """
+    LRU-кэш с временем жизни записей и бюджетом по памяти.
+
+    Запись вытесняется, когда истёк её TTL, когда записей больше maxsize
+    или когда суммарный оценочный размер превышает max_bytes. Счётчики
+    hits/misses/evictions/expirations отдаются через stats().
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        *,
+        ttl: float,
+        max_bytes: int | None = None,
+        sizeof: Callable[[Any], int] = approx_size,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        if maxsize <= 0:
+            raise ValueError("maxsize must be positive")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._clock = clock
+        # key -> (expires_at, size, value)
+        self._data: OrderedDict[Hashable, tuple[float, int, Any]] = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+
+        expires_at, _, value = entry
+        if expires_at <= self._clock():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None) -> None:
+        self._remove(key)
+
+        size = self._sizeof(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            # значение само по себе больше бюджета — не кэшируем
+            return
+
+        expires_at = self._clock() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (expires_at, size, value)
+        self.total_bytes += size
+
+        while len(self._data) > self.maxsize or (
+            self.max_bytes is not None and self.total_bytes > self.max_bytes
+        ):
+            old_key = next(iter(self._data))
+            self._remove(old_key)
+            self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._remove(key)
+        return default if entry is None else entry[2]
+
+    def clear(self) -> None:
+        self._data.clear()
+        self.total_bytes = 0
+
+    def _remove(self, key: Hashable) -> tuple[float, int, Any] | None:
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry[1]
+        return entry
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._data),
+            "bytes": self.total_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class WarehouseCatalog:
+    """
+    Справочник складов, общий для всех пользователей.
+
+    Список складов глобальный и меняется редко, поэтому загружаем его
+    целиком один раз, держим в памяти индекс id -> name и обновляем
+    в фоне раз в refresh_interval секунд. Пагинация в визардах режет
+    локальный список и в backend не ходит.
+
+    Пока справочник не загружен, его грузит один вызывающий, остальные
+    ждут на блокировке и получают готовый индекс. После неудачной
+    загрузки failure_backoff секунд сразу отдаётся та же ошибка, а не
+    новый полный проход по страницам на каждый клик.
+    """
+
+    def __init__(
+        self,
+        fetch_page: Callable[[int, int], Awaitable[dict]],
+        *,
+        fetch_limit: int = 100,
+        refresh_interval: float = 3600.0,
+        failure_backoff: float = 5.0,
+    ) -> None:
+        self._fetch_page = fetch_page
+        self.fetch_limit = fetch_limit
+        self.refresh_interval = refresh_interval
+        self.failure_backoff = failure_backoff
+        self._items: list[dict] = []
+        self._names: dict[int, str] = {}
+        self._lock = asyncio.Lock()
+        self._refresh_task: asyncio.Task | None = None
+        self.loaded_at: float | None = None
+        self._failed_at: float | None = None
+        self._last_error: Exception | None = None
+
+    @property
+    def loaded(self) -> bool:
+        return self.loaded_at is not None
+
+    async def load(self) -> None:
+        """
+        Выкачивает все страницы /warehouses и атомарно подменяет индекс.
+        """
+        async with self._lock:
+            await self._load_locked()
+
+    async def _load_locked(self) -> None:
+        items: list[dict] = []
+        page = 0
+        try:
+            while True:
+                data = await self._fetch_page(page, self.fetch_limit)
+                page_items = data.get("items") or []
+                items.extend(page_items)
+                page += 1
+                if not page_items or page >= (data.get("pages") or 1):
+                    break
+        except Exception as e:
+            self._failed_at = time.monotonic()
+            self._last_error = e
+            raise
+
+        self._items = [w for w in items if w.get("id") is not None]
+        self._names = {w["id"]: w.get("name") for w in self._items}
+        self.loaded_at = time.monotonic()
+        self._failed_at = self._last_error = None
+
+    async def ensure_loaded(self) -> None:
+        if self.loaded:
+            return
+        async with self._lock:
+            # пока ждали блокировку, справочник мог загрузить другой вызов
+            if self.loaded:
+                return
+            if self._failed_at is not None and time.monotonic() - self._failed_at < self.failure_backoff:
+                raise self._last_error
+            await self._load_locked()
+
+    def name(self, wh_id: int) -> str | None:
+        return self._names.get(wh_id)
+
+    def page(self, page: int, per_page: int) -> tuple[list[dict], int, int]:
+        """
+        Возвращает (склады страницы, номер страницы, всего страниц); страницы с нуля.
+        """
+        pages = max(1, (len(self._items) - 1) // per_page + 1)
+        page = max(0, min(page, pages - 1))
+        start = page * per_page
+        return self._items[start:start + per_page], page, pages
+
+    def start_refresh(self) -> None:
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def stop_refresh(self) -> None:
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.load()
+            except Exception as e:
+                # оставляем прежний индекс, попробуем на следующем круге
+                logger.warning("Error refreshing warehouses catalog: %s", e)
+
+    def __len__(self) -> int:
+        return len(self._items)
@@ -0,0 +1,403 @@
+"""
+Компактный версионируемый формат callback_data.
+
+Вместо строки вида "tasks_history_slot_search_open:123" кнопка несёт
+"~" + base64url(версия, opcode, аргументы): opcode — один байт из
+таблицы ниже, int упаковывается zigzag-varint, str — varint-длиной и
+UTF-8. Так callback_data с запасом укладывается в 64 байта Telegram, а
+разбирается один раз в роутере (routing.py): хендлер получает готовый
+объект в callback_args вместо split(":").
+
+Opcode и порядок полей — часть формата: менять или переиспользовать
+их можно только вместе с CODEC_VERSION. Кнопки чужой версии роутер
+считает устаревшими, а строки "prefix:args" из уже отправленных
+сообщений разбирает по legacy-префиксу, как раньше.
+"""
+import base64
+from typing import Any, Callable, NamedTuple, TypeVar
+
+CODEC_VERSION = 1
+MARK = "~"
+MAX_CALLBACK_DATA = 64  # байт, ограничение Telegram
+
+T = TypeVar("T", bound=type)
+
+
+class CallbackSpec(NamedTuple):
+    opcode: int
+    legacy: str
+    args_type: type
+    fields: tuple[tuple[str, type], ...]
+
+    @property
+    def route(self) -> str:
+        """
+        Имя маршрута для метрик — тот же префикс, что у старой строки.
+        """
+        return self.legacy.rstrip(":_")
+
+
+def _put_varint(buf: bytearray, value: int) -> None:
+    while value >= 0x80:
+        buf.append(value & 0x7F | 0x80)
+        value >>= 7
+    buf.append(value)
+
+
+def _get_varint(raw: bytes, pos: int) -> tuple[int, int]:
+    value = shift = 0
+    while shift < 64:
+        if pos >= len(raw):
+            raise ValueError("truncated varint")
+        byte = raw[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+    raise ValueError("varint is too long")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+class CallbackCodec:
+    def __init__(self, version: int = CODEC_VERSION) -> None:
+        self.version = version
+        self._by_opcode: dict[int, CallbackSpec] = {}
+        self._by_type: dict[type, CallbackSpec] = {}
+        self._by_legacy: list[CallbackSpec] = []  # длинные префиксы первыми
+
+    def register(self, opcode: int, legacy: str) -> Callable[[T], T]:
+        """
+        Декоратор NamedTuple-класса аргументов кнопки. legacy — префикс
+        старой строки callback_data, которую этот класс заменяет.
+        """
+
+        def decorator(cls: T) -> T:
+            if not 0 < opcode < 256:
+                raise ValueError(f"opcode {opcode} does not fit in one byte")
+            if opcode in self._by_opcode:
+                raise ValueError(
+                    f"opcode {opcode:#04x} is already used by {self._by_opcode[opcode].args_type.__name__}"
+                )
+            fields = tuple((name, cls.__annotations__[name]) for name in cls._fields)
+            for name, kind in fields:
+                if kind not in (int, str):
+                    raise TypeError(f"{cls.__name__}.{name}: only int and str fields can be packed")
+            spec = CallbackSpec(opcode, legacy, cls, fields)
+            self._by_opcode[opcode] = spec
+            self._by_type[cls] = spec
+            self._by_legacy.append(spec)
+            self._by_legacy.sort(key=lambda s: len(s.legacy), reverse=True)
+            return cls
+
+        return decorator
+
+    def spec(self, args_type: type) -> CallbackSpec:
+        return self._by_type[args_type]
+
+    def pack(self, args: Any) -> str:
+        spec = self._by_type[type(args)]
+        buf = bytearray((self.version, spec.opcode))
+        for (name, kind), value in zip(spec.fields, args):
+            if kind is int:
+                value = int(value)
+                _put_varint(buf, value << 1 if value >= 0 else (-value << 1) - 1)
+            else:
+                raw = str(value).encode()
+                _put_varint(buf, len(raw))
+                buf += raw
+        data = MARK + base64.urlsafe_b64encode(buf).rstrip(b"=").decode()
+        if len(data) > MAX_CALLBACK_DATA:
+            raise ValueError(
+                f"callback_data for {type(args).__name__} is {len(data)} bytes, "
+                f"Telegram allows {MAX_CALLBACK_DATA}"
+            )
+        return data
+
+    def unpack(self, data: str) -> Any:
+        """
+        Разбирает компактную callback_data; на любое несоответствие
+        (версия, opcode, длина) — ValueError.
+        """
+        if not data.startswith(MARK):
+            raise ValueError("not a packed callback_data")
+        raw = _b64decode(data[1:])
+        if len(raw) < 2:
+            raise ValueError("callback_data header is truncated")
+        if raw[0] != self.version:
+            raise ValueError(f"callback_data version {raw[0]}, expected {self.version}")
+        spec = self._by_opcode.get(raw[1])
+        if spec is None:
+            raise ValueError(f"unknown callback opcode {raw[1]:#04x}")
+
+        pos = 2
+        values: list[Any] = []
+        for name, kind in spec.fields:
+            value, pos = _get_varint(raw, pos)
+            if kind is int:
+                values.append(value >> 1 if not value & 1 else -((value + 1) >> 1))
+            else:
+                end = pos + value
+                if end > len(raw):
+                    raise ValueError(f"{spec.args_type.__name__}.{name} is truncated")
+                values.append(raw[pos:end].decode())
+                pos = end
+        if pos != len(raw):
+            raise ValueError("trailing bytes in callback_data")
+        return spec.args_type(*values)
+
+    def parse_legacy(self, args_type: type, rest: str) -> Any:
+        """
+        Аргументы из хвоста старой строки "prefix:a:b" (после префикса).
+        """
+        fields = self._by_type[args_type].fields
+        parts = rest.split(":", len(fields) - 1)
+        if len(parts) != len(fields):
+            raise ValueError(f"{args_type.__name__} expects {len(fields)} arguments")
+        return args_type(*(kind(part) for (_, kind), part in zip(fields, parts)))
+
+    def expand(self, data: str) -> str:
+        """
+        Компактная строка в старом виде "prefix:a:b" — для стенда и отладки.
+        """
+        if not data.startswith(MARK):
+            return data
+        args = self.unpack(data)
+        return self._by_type[type(args)].legacy + ":".join(str(value) for value in args)
+
+    def route(self, data: str) -> str:
+        """
+        Метка маршрута без аргументов: для компактной строки достаточно
+        заголовка, для старой — legacy-префикса зарегистрированной кнопки
+        (в том числе без ':', как "slot_auto_<id>") или префикса до ':'.
+        """
+        if not data.startswith(MARK):
+            for spec in self._by_legacy:
+                if data.startswith(spec.legacy):
+                    return spec.route
+            return data.split(":", 1)[0]
+        try:
+            raw = _b64decode(data[1:5])
+        except ValueError:
+            return "~invalid"
+        spec = self._by_opcode.get(raw[1]) if len(raw) >= 2 and raw[0] == self.version else None
+        return spec.route if spec is not None else "~invalid"
+
+
+codec = CallbackCodec()
+
+
+# --- перераспределение товара ---
+
+
+@codec.register(0x01, "moves_page:")
+class MovesPage(NamedTuple):
+    page: int
+
+
+@codec.register(0x02, "moves_open:")
+class MovesOpen(NamedTuple):
+    task_id: int
+
+
+@codec.register(0x03, "moves_stop:")
+class MovesStop(NamedTuple):
+    task_id: int
+
+
+@codec.register(0x04, "moves_start:")
+class MovesStart(NamedTuple):
+    task_id: int
+
+
+@codec.register(0x05, "moves_acc:")
+class MovesAccount(NamedTuple):
+    account_id: str
+
+
+@codec.register(0x06, "moves_art:")
+class MovesArticle(NamedTuple):
+    article_id: str
+
+
+# склад передаётся индексом в списке из FSM: названия не влезают в 64 байта
+@codec.register(0x07, "moves_from:")
+class MovesFrom(NamedTuple):
+    index: int
+
+
+@codec.register(0x08, "moves_to:")
+class MovesTo(NamedTuple):
+    index: int
+
+
+@codec.register(0x09, "moves_qty:")
+class MovesQty(NamedTuple):
+    qty: int
+
+
+# --- поиск слотов ---
+
+
+@codec.register(0x10, "slot_tasks_page:")
+class SlotTasksPage(NamedTuple):
+    page: int
+
+
+@codec.register(0x11, "slot_task_open:")
+class SlotTaskOpen(NamedTuple):
+    task_id: int
+
+
+@codec.register(0x12, "slot_cancel:")
+class SlotCancel(NamedTuple):
+    task_id: int
+
+
+@codec.register(0x13, "slot_restart:")
+class SlotRestart(NamedTuple):
+    task_id: int
+
+
+@codec.register(0x14, "slot_delete:")
+class SlotDelete(NamedTuple):
+    task_id: int
+
+
+@codec.register(0x15, "slot_auto_")
+class SlotAuto(NamedTuple):
+    task_id: int
+
+
+@codec.register(0x16, "slot_wh_id:")
+class SlotWarehouse(NamedTuple):
+    warehouse_id: int
+
+
+@codec.register(0x17, "wh_page:")
+class WarehousePage(NamedTuple):
+    page: int
+
+
+# --- автобронирование ---
+
+
+@codec.register(0x20, "autobook_page:")
+class AutobookPage(NamedTuple):
+    page: int
+
+
+@codec.register(0x21, "autobook_open:")
+class AutobookOpen(NamedTuple):
+    task_id: int
+
+
+@codec.register(0x22, "autobook_stop:")
+class AutobookStop(NamedTuple):
+    task_id: int
+
+
+@codec.register(0x23, "autobook_start:")
+class AutobookStart(NamedTuple):
+    task_id: int
+
+
+@codec.register(0x24, "autobook_delete:")
+class AutobookDelete(NamedTuple):
+    task_id: int
+
+
+@codec.register(0x25, "autobook_from_search:")
+class AutobookFromSearch(NamedTuple):
+    task_id: int
+
+
+@codec.register(0x26, "autobook_choose_account:")
+class AutobookChooseAccount(NamedTuple):
+    account_id: str
+
+
+@codec.register(0x27, "autobook_transit:")
+class AutobookTransit(NamedTuple):
+    transit_id: str
+
+
+@codec.register(0x28, "autobook_choose_draft:")
+class AutobookChooseDraft(NamedTuple):
+    draft_id: str
+
+
+@codec.register(0x29, "autobook_wh_page:")
+class AutobookWarehousePage(NamedTuple):
+    page: int
+
+
+@codec.register(0x2A, "autobook_wh_id:")
+class AutobookWarehouse(NamedTuple):
+    warehouse_id: int
+
+
+@codec.register(0x30, "autobook_accounts_page:")
+class AutobookAccountsPage(NamedTuple):
+    page: int
+
+
+@codec.register(0x31, "autobook_new_account:")
+class AutobookNewAccount(NamedTuple):
+    account_id: int
+
+
+@codec.register(0x32, "autobook_drafts_page:")
+class AutobookDraftsPage(NamedTuple):
+    page: int
+
+
+@codec.register(0x33, "autobook_new_draft:")
+class AutobookNewDraft(NamedTuple):
+    draft_id: int
+
+
+@codec.register(0x34, "autobook_requests_page:")
+class AutobookRequestsPage(NamedTuple):
+    page: int
+
+
+@codec.register(0x35, "autobook_new_request:")
+class AutobookNewRequest(NamedTuple):
+    request_id: int
+
+
+# --- история задач ---
+
+
+@codec.register(0x40, "tasks_history_slot_search_filter:")
+class TasksHistoryFilter(NamedTuple):
+    code: str
+
+
+@codec.register(0x41, "tasks_history_slot_search_open:")
+class TasksHistorySearchOpen(NamedTuple):
+    item_id: int
+
+
+@codec.register(0x42, "tasks_history_slot_search_cancel:")
+class TasksHistorySearchCancel(NamedTuple):
+    request_id: int
+
+
+@codec.register(0x43, "tasks_history_auto_booking_open:")
+class TasksHistoryAutobookOpen(NamedTuple):
+    item_id: int
+
+
+@codec.register(0x44, "tasks_history_slot_search_page:")
+class TasksHistorySearchPage(NamedTuple):
+    page: int
+
+
+@codec.register(0x45, "tasks_history_auto_booking_page:")
+class TasksHistoryAutobookPage(NamedTuple):
+    page: int
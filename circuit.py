@@ -0,0 +1,160 @@
+"""
+Circuit breaker на каждый эндпоинт backend-а.
+
+Когда эндпоинт падает, пользователи жмут кнопку ещё раз, и каждое
+нажатие честно ждёт полный таймаут. CircuitBreaker считает исходы
+вызовов за скользящее окно: если доля неудач (таймауты, сетевые ошибки,
+5xx) превысила порог, цепь размыкается (open) и вызовы сразу получают
+CircuitOpen — хендлер показывает свой обычный экран ошибки без ожидания.
+Через cooldown цепь пропускает пробные вызовы (half-open): удачный
+замыкает её (closed), неудачный снова размыкает.
+
+4xx — ошибка запроса, а не backend-а, и в неудачи не считается.
+"""
+import logging
+import time
+from collections import deque
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+
+# Числовое значение состояния для гейджа
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpen(Exception):
+    """
+    Вызов не отправлен: цепь эндпоинта разомкнута.
+    """
+
+    def __init__(self, endpoint: str, retry_after: float) -> None:
+        super().__init__(f"circuit for {endpoint} is open, retry in {retry_after:.0f}s")
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        endpoint: str,
+        *,
+        window: float = 30.0,
+        min_calls: int = 10,
+        failure_rate: float = 0.5,
+        cooldown: float = 15.0,
+        half_open_calls: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.endpoint = endpoint
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.cooldown = cooldown
+        self.half_open_calls = half_open_calls
+        self._clock = clock
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self._outcomes: deque[tuple[float, bool]] = deque()  # (время, неудача)
+        self._failures = 0
+        self._probes = 0
+        self.rejected = 0
+        self.opened = 0
+
+    def _trim(self, now: float) -> None:
+        while self._outcomes and self._outcomes[0][0] <= now - self.window:
+            _, failed = self._outcomes.popleft()
+            self._failures -= failed
+
+    def allow(self) -> bool:
+        """
+        Пропускает вызов или бросает CircuitOpen. Возвращает, пробный ли
+        это вызов; исход обязательно сообщается через record().
+        """
+        if self.state == OPEN:
+            now = self._clock()
+            retry_after = self.opened_at + self.cooldown - now
+            if retry_after > 0:
+                self.rejected += 1
+                raise CircuitOpen(self.endpoint, retry_after)
+            self._transition(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            if self._probes >= self.half_open_calls:
+                self.rejected += 1
+                raise CircuitOpen(self.endpoint, self.cooldown)
+            self._probes += 1
+            return True
+        return False
+
+    def record(self, ok: bool | None, probe: bool = False) -> None:
+        """
+        Исход вызова: True — успех, False — неудача backend-а, None — не
+        считается (отмена, сброс нагрузки, ошибка на нашей стороне).
+        Вызовы, пропущенные ещё при замкнутой цепи, после её размыкания
+        не учитываются.
+        """
+        if probe:
+            self._probes -= 1
+            if ok is not None and self.state == HALF_OPEN:
+                self._transition(CLOSED if ok else OPEN)
+            return
+        if ok is None or self.state != CLOSED:
+            return
+
+        now = self._clock()
+        self._trim(now)
+        self._outcomes.append((now, not ok))
+        self._failures += not ok
+        calls = len(self._outcomes)
+        if calls >= self.min_calls and self._failures / calls >= self.failure_rate:
+            self._transition(OPEN)
+
+    def _transition(self, state: str) -> None:
+        if state == self.state:
+            return
+        if state == OPEN:
+            self.opened_at = self._clock()
+            self.opened += 1
+            if self.state == HALF_OPEN:
+                logger.warning("Circuit for %s reopened: probe call failed", self.endpoint)
+            else:
+                logger.warning(
+                    "Circuit for %s opened: %s of %s calls failed",
+                    self.endpoint,
+                    self._failures,
+                    len(self._outcomes),
+                )
+        elif state == CLOSED:
+            logger.info("Circuit for %s closed", self.endpoint)
+        self._outcomes.clear()
+        self._failures = 0
+        self.state = state
+
+
+class CircuitBreakers:
+    """
+    Лениво создаёт CircuitBreaker на каждый эндпоинт с общими настройками.
+    """
+
+    def __init__(self, **settings: float) -> None:
+        self.settings = settings
+        self._breakers: dict[str, CircuitBreaker] = {}
+
+    def get(self, endpoint: str) -> CircuitBreaker:
+        breaker = self._breakers.get(endpoint)
+        if breaker is None:
+            breaker = self._breakers[endpoint] = CircuitBreaker(endpoint, **self.settings)
+        return breaker
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        return {
+            endpoint: {
+                "state": STATE_VALUES[breaker.state],
+                "rejected": breaker.rejected,
+                "opened": breaker.opened,
+            }
+            for endpoint, breaker in self._breakers.items()
+        }
@@ -0,0 +1,249 @@
+"""
+Локальная заглушка backend-а для ручной проверки бота без настоящего сервера.
+
+Запуск:
+    python fake_backend.py --port 8001 --load-seconds 20
+
+Реализует эндпоинты, которых хватает для сквозной проверки долгих
+сценариев (/supplies/load — как синхронный вызов и как фоновую задачу с
+опросом статуса /supplies/load/jobs) и для прохода визардов поиска слотов
+и автоброни: пользователи, склады, аккаунты и черновики WB, создание задач.
+Ответы детерминированы; --latency/--jitter добавляют задержку к каждому
+запросу, чтобы нагрузочный стенд (bench.py) видел реалистичный backend.
+"""
+import argparse
+import asyncio
+import collections
+import itertools
+import random
+import time
+
+from aiohttp import web
+
+LOAD_STAGES = (
+    "Проверяю доступные слоты",
+    "Создаю поставку в кабинете WB",
+    "Загружаю файл поставки",
+    "Бронирую дату",
+)
+
+
+def _load_result(request_id: str) -> dict:
+    return {
+        "warehouse": "Коледино",
+        "supply_type": "box",
+        "file_saved": f"supply_{request_id}.xlsx",
+        "chosen_date": time.strftime("%Y-%m-%d"),
+    }
+
+
+WAREHOUSE_NAMES = (
+    "Коледино", "Подольск", "Электросталь", "Тула", "Казань", "Краснодар",
+    "Екатеринбург", "Новосибирск", "Хабаровск", "Санкт-Петербург", "Невинномысск",
+    "Рязань", "Котовск", "Белые Столбы", "Вёшки", "Чехов",
+)
+
+
+class FakeBackend:
+    def __init__(
+        self,
+        *,
+        load_seconds: float = 20.0,
+        fail_every: int = 0,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        warehouses: int = 48,
+    ) -> None:
+        self.load_seconds = load_seconds
+        self.fail_every = fail_every
+        self.latency = latency
+        self.jitter = jitter
+        self._job_ids = itertools.count(1)
+        self._jobs: dict[str, dict] = {}
+        # ссылки на фоновые задачи, иначе сборщик мусора может снять их на полпути
+        self._job_tasks: set[asyncio.Task] = set()
+        self._task_ids = itertools.count(1)
+        self._warehouses = [
+            {
+                "id": 1000 + i,
+                "name": WAREHOUSE_NAMES[i % len(WAREHOUSE_NAMES)]
+                + ("" if i < len(WAREHOUSE_NAMES) else f" {i // len(WAREHOUSE_NAMES) + 1}"),
+            }
+            for i in range(warehouses)
+        ]
+        # число вызовов по маршруту: "GET /warehouses" -> n
+        self.calls: collections.Counter[str] = collections.Counter()
+
+    def app(self) -> web.Application:
+        app = web.Application(middlewares=[self._delay])
+        app.router.add_post("/users/register", self.register_user)
+        app.router.add_get("/users/get-id", self.get_user_id)
+        app.router.add_get("/wb/auth/status", self.wb_auth_status)
+        app.router.add_get("/warehouses", self.warehouses)
+        app.router.add_post("/warehouses/availability", self.warehouses_availability)
+        app.router.add_post("/slots/search", self.create_slot_search)
+        app.router.add_get("/slots/search/{request_id}", self.slot_search_result)
+        app.router.add_get("/requests/history", self.requests_history)
+        app.router.add_get("/wb/accounts", self.wb_accounts)
+        app.router.add_post("/wb/accounts/sync", self.empty)
+        app.router.add_get("/wb/overview", self.wb_overview)
+        app.router.add_post("/wb/autobooking", self.wb_autobooking)
+        app.router.add_post("/supplies/load", self.supplies_load)
+        app.router.add_post("/supplies/load/jobs", self.supplies_load_submit)
+        app.router.add_get("/supplies/load/jobs/{job_id}", self.supplies_load_status)
+        return app
+
+    @web.middleware
+    async def _delay(self, request: web.Request, handler) -> web.StreamResponse:
+        resource = request.match_info.route.resource
+        self.calls[f"{request.method} {resource.canonical if resource else request.path}"] += 1
+        delay = self.latency + random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return await handler(request)
+
+    async def empty(self, request: web.Request) -> web.Response:
+        return web.json_response({})
+
+    async def register_user(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        return web.json_response({"user_id": body["telegram_id"]})
+
+    async def get_user_id(self, request: web.Request) -> web.Response:
+        return web.json_response({"user_id": int(request.query["telegram_id"])})
+
+    async def wb_auth_status(self, request: web.Request) -> web.Response:
+        return web.json_response({"authorized": True})
+
+    async def warehouses(self, request: web.Request) -> web.Response:
+        # страницы /warehouses нумеруются с нуля
+        page = int(request.query.get("page", 0))
+        limit = int(request.query.get("limit", 10))
+        pages = max(1, (len(self._warehouses) - 1) // limit + 1)
+        start = page * limit
+        return web.json_response(
+            {"items": self._warehouses[start:start + limit], "page": page, "pages": pages}
+        )
+
+    async def warehouses_availability(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        return web.json_response({"available": body.get("warehouses") or [], "unavailable": []})
+
+    async def create_slot_search(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        request_id = next(self._task_ids)
+        return web.json_response(
+            {"request_id": request_id, "status": "active", "found": 3, "slots": _slots(body)}
+        )
+
+    async def slot_search_result(self, request: web.Request) -> web.Response:
+        request_id = int(request.match_info["request_id"])
+        return web.json_response({"request_id": request_id, "found": 3, "slots": _slots({})})
+
+    async def requests_history(self, request: web.Request) -> web.Response:
+        page = int(request.query.get("page", 1))
+        return web.json_response({"items": [], "page": page, "pages": 1, "total": 0})
+
+    async def wb_accounts(self, request: web.Request) -> web.Response:
+        user_id = int(request.query["user_id"])
+        items = [
+            {"id": user_id * 10 + i, "user_id": user_id, "name": f"ИП Продавец {i}"}
+            for i in range(1, 3)
+        ]
+        return web.json_response(
+            {"items": items, "page": 1, "per_page": int(request.query.get("per_page", 10)), "total": len(items)}
+        )
+
+    async def wb_overview(self, request: web.Request) -> web.Response:
+        account_id = int(request.query["seller_account_id"])
+        page = int(request.query.get("page", 1))
+        drafts = [
+            {
+                "id": account_id * 100 + i,
+                "created_at": time.strftime("%Y-%m-%d"),
+                "barcode_quantity": 4 * i,
+                "good_quantity": 10 * i,
+                "author": "Менеджер",
+            }
+            for i in range(1, 4)
+        ]
+        return web.json_response({"drafts": drafts, "pagination": {"page": page, "pages": 1}})
+
+    async def wb_autobooking(self, request: web.Request) -> web.Response:
+        await request.json()
+        return web.json_response({"id": next(self._task_ids), "status": "active"})
+
+    async def supplies_load(self, request: web.Request) -> web.Response:
+        await asyncio.sleep(self.load_seconds)
+        return web.json_response(_load_result(request.query["request_id"]))
+
+    async def supplies_load_submit(self, request: web.Request) -> web.Response:
+        number = next(self._job_ids)
+        job_id = str(number)
+        job = {
+            "job_id": job_id,
+            "status": "queued",
+            "progress": 0,
+            "stage": None,
+            "result": None,
+            "error": None,
+        }
+        self._jobs[job_id] = job
+        fail = bool(self.fail_every) and number % self.fail_every == 0
+        task = asyncio.create_task(self._run_load(job, request.query["request_id"], fail))
+        self._job_tasks.add(task)
+        task.add_done_callback(self._job_tasks.discard)
+        return web.json_response({"job_id": job_id, "status": job["status"]}, status=202)
+
+    async def supplies_load_status(self, request: web.Request) -> web.Response:
+        job = self._jobs.get(request.match_info["job_id"])
+        if job is None:
+            return web.json_response({"detail": "job not found"}, status=404)
+        return web.json_response(job)
+
+    async def _run_load(self, job: dict, request_id: str, fail: bool) -> None:
+        job["status"] = "running"
+        step = self.load_seconds / len(LOAD_STAGES)
+        for i, stage in enumerate(LOAD_STAGES):
+            job["stage"] = stage
+            job["progress"] = int(100 * i / len(LOAD_STAGES))
+            await asyncio.sleep(step)
+        if fail:
+            job["status"] = "failed"
+            job["error"] = "WB rejected the supply"
+            return
+        job["status"] = "done"
+        job["progress"] = 100
+        job["stage"] = None
+        job["result"] = _load_result(request_id)
+
+
+def _slots(query: dict) -> list[dict]:
+    day = query.get("search_period_from") or time.strftime("%Y-%m-%d")
+    return [
+        {"date": day, "coefficient": coef, "logistics": 100 + 20 * coef}
+        for coef in range(3)
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--load-seconds", type=float, default=20.0, help="длительность /supplies/load")
+    parser.add_argument("--fail-every", type=int, default=0, help="каждая N-я задача завершается ошибкой")
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка каждого ответа, с")
+    parser.add_argument("--jitter", type=float, default=0.0, help="разброс задержки ±, с")
+    args = parser.parse_args()
+
+    backend = FakeBackend(
+        load_seconds=args.load_seconds,
+        fail_every=args.fail_every,
+        latency=args.latency,
+        jitter=args.jitter,
+    )
+    web.run_app(backend.app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""
+Эмулятор Telegram Bot API для нагрузочного стенда (bench.py).
+
+Отвечает на /bot{token}/{method} как настоящий api.telegram.org для
+методов, которыми пользуется бот: sendMessage, editMessageText,
+editMessageReplyMarkup, deleteMessage(s), answerCallbackQuery, getMe.
+Сообщения хранятся по чатам вместе с клавиатурами, так что стенд может
+«нажимать» кнопки, которые бот реально отправил. Ошибки (сообщение не
+найдено, не изменено) возвращаются в формате Telegram; с strict=False
+неизвестные сообщения считаются существующими — так replay.py может
+проигрывать апдейты, которые ссылаются на сообщения из записи.
+
+Можно запустить отдельно и направить на него бота:
+    python fake_telegram.py --port 8081 --latency 0.05
+"""
+import argparse
+import asyncio
+import collections
+import itertools
+import json
+import random
+import re
+import time
+from typing import Any, Callable
+
+from aiohttp import web
+
+BOT_USER = {"id": 100000, "is_bot": True, "first_name": "Bench Bot", "username": "bench_bot"}
+
+
+class TelegramError(Exception):
+    def __init__(self, code: int, description: str) -> None:
+        super().__init__(description)
+        self.code = code
+        self.description = description
+
+
+class FakeTelegram:
+    def __init__(self, *, latency: float = 0.0, jitter: float = 0.0, strict: bool = True) -> None:
+        self.latency = latency
+        self.jitter = jitter
+        self.strict = strict
+        # chat_id -> {message_id: message}; порядок вставки = порядок отправки
+        self.chats: dict[int, dict[int, dict]] = collections.defaultdict(dict)
+        self._message_ids: dict[int, itertools.count] = collections.defaultdict(lambda: itertools.count(1))
+        self.calls: collections.Counter[str] = collections.Counter()
+        self.errors: collections.Counter[str] = collections.Counter()
+        self._methods = {
+            "getme": self.get_me,
+            "sendmessage": self.send_message,
+            "editmessagetext": self.edit_message_text,
+            "editmessagereplymarkup": self.edit_message_reply_markup,
+            "deletemessage": self.delete_message,
+            "deletemessages": self.delete_messages,
+            "answercallbackquery": self.answer_callback_query,
+        }
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_route("*", "/bot{token}/{method}", self.handle)
+        return app
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        if request.content_type == "application/json":
+            params = await request.json()
+        else:
+            params = dict(await request.post())
+
+        delay = self.latency + random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return web.json_response(self.call(method, params))
+
+    def call(self, method: str, params: dict) -> dict:
+        """
+        Выполняет метод API и возвращает тело ответа Telegram ({"ok": ...}).
+        """
+        self.calls[method] += 1
+        fn = self._methods.get(method.lower())
+        if fn is None:
+            self.errors[method] += 1
+            return {"ok": False, "error_code": 404, "description": "Not Found"}
+        try:
+            result = fn(params)
+        except TelegramError as e:
+            self.errors[method] += 1
+            return {"ok": False, "error_code": e.code, "description": e.description}
+        return {"ok": True, "result": result}
+
+    # --- методы API ---
+
+    def get_me(self, params: dict) -> dict:
+        return BOT_USER
+
+    def send_message(self, params: dict) -> dict:
+        chat_id = int(params["chat_id"])
+        message = {
+            "message_id": next(self._message_ids[chat_id]),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+            "text": params.get("text", ""),
+        }
+        markup = _json_param(params.get("reply_markup"))
+        if markup and "inline_keyboard" in markup:
+            message["reply_markup"] = markup
+        self.chats[chat_id][message["message_id"]] = message
+        return message
+
+    def edit_message_text(self, params: dict) -> dict:
+        message = self._find(params, "edit")
+        markup = _json_param(params.get("reply_markup"))
+        text = params.get("text", "")
+        if text == message["text"] and markup == message.get("reply_markup"):
+            raise TelegramError(400, "Bad Request: message is not modified")
+        message["text"] = text
+        message["edit_date"] = int(time.time())
+        if markup:
+            message["reply_markup"] = markup
+        else:
+            message.pop("reply_markup", None)
+        return message
+
+    def edit_message_reply_markup(self, params: dict) -> dict:
+        message = self._find(params, "edit")
+        markup = _json_param(params.get("reply_markup"))
+        if markup == message.get("reply_markup"):
+            raise TelegramError(400, "Bad Request: message is not modified")
+        if markup:
+            message["reply_markup"] = markup
+        else:
+            message.pop("reply_markup", None)
+        message["edit_date"] = int(time.time())
+        return message
+
+    def delete_message(self, params: dict) -> bool:
+        self._find(params, "delete")
+        del self.chats[int(params["chat_id"])][int(params["message_id"])]
+        return True
+
+    def delete_messages(self, params: dict) -> bool:
+        chat = self.chats[int(params["chat_id"])]
+        for message_id in _json_param(params["message_ids"]):
+            chat.pop(int(message_id), None)
+        return True
+
+    def answer_callback_query(self, params: dict) -> bool:
+        return True
+
+    def _find(self, params: dict, action: str) -> dict:
+        if "inline_message_id" in params:
+            raise TelegramError(400, "Bad Request: inline messages are not emulated")
+        chat_id = int(params["chat_id"])
+        message_id = int(params["message_id"])
+        message = self.chats[chat_id].get(message_id)
+        if message is None:
+            if self.strict:
+                raise TelegramError(400, f"Bad Request: message to {action} not found")
+            message = self.chats[chat_id][message_id] = {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": BOT_USER,
+                "text": "",
+            }
+        return message
+
+    # --- для стенда ---
+
+    def find_button(
+        self,
+        chat_id: int,
+        pattern: re.Pattern,
+        normalize: Callable[[str], str] | None = None,
+    ) -> tuple[dict, str] | None:
+        """
+        Ищет в чате (начиная с последних сообщений) кнопку, callback_data
+        которой целиком совпадает с pattern. Из нескольких подходящих кнопок
+        одного сообщения выбирается случайная. normalize приводит
+        callback_data к виду, с которым сравнивается pattern.
+        """
+        for message in reversed(list(self.chats[chat_id].values())):
+            rows = (message.get("reply_markup") or {}).get("inline_keyboard") or []
+            matches = [
+                button["callback_data"]
+                for row in rows
+                for button in row
+                if button.get("callback_data")
+                and pattern.fullmatch(normalize(button["callback_data"]) if normalize else button["callback_data"])
+            ]
+            if matches:
+                return message, random.choice(matches)
+        return None
+
+    def user_message(self, chat_id: int, user: dict, text: str) -> dict:
+        """
+        Сообщение от пользователя: берёт message_id из общей с ботом
+        нумерации чата, как в настоящем Telegram.
+        """
+        message = {
+            "message_id": next(self._message_ids[chat_id]),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": user,
+            "text": text,
+        }
+        if text.startswith("/"):
+            command = text.split(maxsplit=1)[0]
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(command)}]
+        self.chats[chat_id][message["message_id"]] = message
+        return message
+
+    def stored_messages(self) -> int:
+        return sum(len(chat) for chat in self.chats.values())
+
+
+def _json_param(value: Any) -> Any:
+    if isinstance(value, str):
+        return json.loads(value) if value else None
+    return value
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка каждого ответа, с")
+    parser.add_argument("--jitter", type=float, default=0.0, help="разброс задержки ±, с")
+    args = parser.parse_args()
+
+    telegram = FakeTelegram(latency=args.latency, jitter=args.jitter)
+    web.run_app(telegram.app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
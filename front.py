@@ -1,13 +1,16 @@
 import os
 import re
 import asyncio
+import logging
+import uuid
+from functools import partial
 from datetime import datetime, date, timedelta
 
 from dotenv import load_dotenv
 import httpx
 import json
 
-from aiogram import Bot, Dispatcher, F
+from aiogram import Bot, Dispatcher
 from aiogram.types import (
     Message,
     ReplyKeyboardMarkup,
@@ -20,7 +23,42 @@ from aiogram.types import (
 from aiogram.filters import CommandStart, Command, CommandObject
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.fsm.context import FSMContext
-from aiogram.fsm.storage.memory import MemoryStorage
+
+from admission import (
+    HEAVY,
+    READ,
+    WRITE,
+    AdmissionController,
+    AdmissionMiddleware,
+    EndpointClass,
+    ShedGuard,
+    split_limit,
+)
+from backend import BackendClient
+from cache import LRUCache, TTLCache, WarehouseCatalog
+from callback_codec import (
+    codec, AutobookAccountsPage, AutobookChooseAccount, AutobookChooseDraft, AutobookDelete,
+    AutobookDraftsPage, AutobookFromSearch, AutobookNewAccount, AutobookNewDraft,
+    AutobookNewRequest, AutobookOpen, AutobookPage, AutobookRequestsPage, AutobookStart,
+    AutobookStop, AutobookTransit, AutobookWarehouse, AutobookWarehousePage, MovesAccount,
+    MovesArticle, MovesFrom, MovesOpen, MovesPage, MovesQty, MovesStart, MovesStop, MovesTo,
+    SlotAuto, SlotCancel, SlotDelete, SlotRestart, SlotTaskOpen, SlotTasksPage, SlotWarehouse,
+    TasksHistoryAutobookOpen, TasksHistoryAutobookPage, TasksHistoryFilter,
+    TasksHistorySearchCancel, TasksHistorySearchOpen, TasksHistorySearchPage, WarehousePage,
+)
+from circuit import CircuitBreakers
+from jobs import DONE, JobQueue, JobStore, RemoteJobTracker
+from lifecycle import Lifecycle
+from logs import LogContextMiddleware, dropped_records, setup_logging, shutdown_logging
+from metrics import HandlerMetricsMiddleware, backend_metrics, registry, start_metrics_server
+from middlewares import FSMSessionMiddleware
+from ratelimit import PRIORITY_BULK, OutboundScheduler, outbound_priority
+from replay import UpdateRecorder
+from routing import CallbackRouter
+from storage import build_fsm_storage
+from webhook import run_webhook
+
+logger = logging.getLogger("bot")
 
 
 PAGE_SIZE = 5
@@ -29,9 +67,10 @@ AUTBOOK_PAGE_SIZE = 5
 AUTBOOK_ACCOUNTS_PAGE_SIZE = 5
 MOVES_PAGE_SIZE = 5
 OVERVIEW_PAGE_SIZE = 10
+WAREHOUSES_PAGE_SIZE = 10
 SLOT_RESULTS_MAX_CHARS = 3500
+TASKS_HISTORY_PAGES = {"slot_search": TasksHistorySearchPage, "auto_booking": TasksHistoryAutobookPage}
 user_sessions = {} # ЗАМЕНИТЬ НА РЕАЛЬНУЮ БД
-slot_results_cache = {}
 
 def _log_http_error(prefix: str, exc: Exception) -> None:
     """
@@ -39,17 +78,293 @@ def _log_http_error(prefix: str, exc: Exception) -> None:
     """
     if isinstance(exc, httpx.HTTPStatusError):
         try:
-            print(f"{prefix}: status={exc.response.status_code}, body={exc.response.text}")
+            logger.error(
+                "%s: status=%s",
+                prefix,
+                exc.response.status_code,
+                extra={"body": exc.response.text},
+            )
         except Exception:
-            print(f"{prefix}: {exc}")
+            logger.error("%s: %s", prefix, exc)
     else:
-        print(f"{prefix}: {exc}")
+        logger.error("%s: %s", prefix, exc)
 
 # Загружаем переменные окружения
 load_dotenv()
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
-BACKEND_URL = "http://127.0.0.1:8001"
+
+# Логи: JSON-строки в stdout из фоновой очереди
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+BACKEND_URL = os.getenv("BACKEND_URL", "http://127.0.0.1:8001")
+
+# Запись апдейтов и ответов backend-а для replay.py; пустой путь — не пишем
+UPDATE_RECORD_PATH = os.getenv("UPDATE_RECORD_PATH")
+UPDATE_RECORD_SALT = os.getenv("UPDATE_RECORD_SALT")  # без соли псевдонимы меняются при рестарте
+update_recorder = (
+    UpdateRecorder(UPDATE_RECORD_PATH, salt=UPDATE_RECORD_SALT) if UPDATE_RECORD_PATH else None
+)
+
+# Пул соединений к backend-у, общий для всех хендлеров
+BACKEND_MAX_CONNECTIONS = int(os.getenv("BACKEND_MAX_CONNECTIONS", "100"))
+BACKEND_MAX_KEEPALIVE = int(os.getenv("BACKEND_MAX_KEEPALIVE", "20"))
+BACKEND_KEEPALIVE_EXPIRY = float(os.getenv("BACKEND_KEEPALIVE_EXPIRY", "30"))
+# Вызовы backend-а дольше порога пишутся в лог медленных запросов
+BACKEND_SLOW_CALL_SECONDS = float(os.getenv("BACKEND_SLOW_CALL_SECONDS", "2"))
+
+# Допуск к backend-у: одновременных запросов на класс эндпоинтов (в сумме не
+# больше пула соединений; по умолчанию — 50/30/20% пула) и сколько секунд
+# ждать места в очереди. Длина очереди — сколько класс успеет обслужить до
+# дедлайна, но не больше BACKEND_QUEUE_SIZE; дальше — экран «сервис занят»
+_backend_class_limits = split_limit(BACKEND_MAX_CONNECTIONS)
+BACKEND_READ_LIMIT = int(os.getenv("BACKEND_READ_LIMIT", _backend_class_limits[READ]))
+BACKEND_WRITE_LIMIT = int(os.getenv("BACKEND_WRITE_LIMIT", _backend_class_limits[WRITE]))
+BACKEND_HEAVY_LIMIT = int(os.getenv("BACKEND_HEAVY_LIMIT", _backend_class_limits[HEAVY]))
+BACKEND_QUEUE_SIZE = int(os.getenv("BACKEND_QUEUE_SIZE", "1000"))
+BACKEND_QUEUE_TIMEOUT = float(os.getenv("BACKEND_QUEUE_TIMEOUT", "3"))
+backend_admission = AdmissionController(
+    [
+        EndpointClass(READ, 0, BACKEND_READ_LIMIT, BACKEND_QUEUE_SIZE, BACKEND_QUEUE_TIMEOUT, 0.3),
+        EndpointClass(WRITE, 1, BACKEND_WRITE_LIMIT, BACKEND_QUEUE_SIZE, BACKEND_QUEUE_TIMEOUT, 0.5),
+        EndpointClass(HEAVY, 2, BACKEND_HEAVY_LIMIT, BACKEND_QUEUE_SIZE, BACKEND_QUEUE_TIMEOUT, 5.0),
+    ],
+    total_limit=BACKEND_MAX_CONNECTIONS,
+)
+# после сброса вызова экран ошибки хендлера заменяется экраном «сервис занят»
+shed_guard = ShedGuard()
+
+# Circuit breaker на эндпоинт: доля неудач за окно, после которой цепь
+# размыкается, и сколько секунд до пробного вызова
+BACKEND_CIRCUIT_WINDOW = float(os.getenv("BACKEND_CIRCUIT_WINDOW", "30"))
+BACKEND_CIRCUIT_MIN_CALLS = int(os.getenv("BACKEND_CIRCUIT_MIN_CALLS", "10"))
+BACKEND_CIRCUIT_FAILURE_RATE = float(os.getenv("BACKEND_CIRCUIT_FAILURE_RATE", "0.5"))
+BACKEND_CIRCUIT_COOLDOWN = float(os.getenv("BACKEND_CIRCUIT_COOLDOWN", "15"))
+backend_circuits = CircuitBreakers(
+    window=BACKEND_CIRCUIT_WINDOW,
+    min_calls=BACKEND_CIRCUIT_MIN_CALLS,
+    failure_rate=BACKEND_CIRCUIT_FAILURE_RATE,
+    cooldown=BACKEND_CIRCUIT_COOLDOWN,
+)
+
+# Повторы сверх этой доли от числа вызовов эндпоинта не делаются (бюджет повторов)
+BACKEND_RETRY_BUDGET_RATIO = float(os.getenv("BACKEND_RETRY_BUDGET_RATIO", "0.1"))
+# Hedge для медленных идемпотентных чтений: второй запрос уходит, если первый
+# дольше этого квантиля латентности (0 — выключено); доля дополнительных запросов
+BACKEND_HEDGE_PERCENTILE = float(os.getenv("BACKEND_HEDGE_PERCENTILE", "0.95"))
+BACKEND_HEDGE_BUDGET_RATIO = float(os.getenv("BACKEND_HEDGE_BUDGET_RATIO", "0.05"))
+
+backend = BackendClient(
+    BACKEND_URL,
+    max_connections=BACKEND_MAX_CONNECTIONS,
+    max_keepalive_connections=BACKEND_MAX_KEEPALIVE,
+    keepalive_expiry=BACKEND_KEEPALIVE_EXPIRY,
+    retry_budget_ratio=BACKEND_RETRY_BUDGET_RATIO,
+    hedge_percentile=BACKEND_HEDGE_PERCENTILE or None,
+    hedge_budget_ratio=BACKEND_HEDGE_BUDGET_RATIO,
+    instrumentation=backend_metrics,
+    slow_call_threshold=BACKEND_SLOW_CALL_SECONDS or None,
+    recorder=update_recorder,
+    admission=backend_admission,
+    circuits=backend_circuits,
+)
+
+USER_ID_CACHE_SIZE = int(os.getenv("USER_ID_CACHE_SIZE", "10000"))
+user_id_cache = LRUCache(maxsize=USER_ID_CACHE_SIZE)  # telegram_id -> user_id
+
+# Найденные слоты по задаче поиска: (telegram_id, request_ref) -> {"slots", "found"}
+SLOT_RESULTS_CACHE_SIZE = int(os.getenv("SLOT_RESULTS_CACHE_SIZE", "2000"))
+SLOT_RESULTS_CACHE_MAX_BYTES = int(os.getenv("SLOT_RESULTS_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+SLOT_RESULTS_CACHE_TTL = float(os.getenv("SLOT_RESULTS_CACHE_TTL", "300"))
+slot_results_cache = TTLCache(
+    SLOT_RESULTS_CACHE_SIZE,
+    ttl=SLOT_RESULTS_CACHE_TTL,
+    max_bytes=SLOT_RESULTS_CACHE_MAX_BYTES,
+)
+
+# Флаг авторизации WB по telegram_id; живёт недолго, сбрасывается при входе/выходе
+WB_AUTH_STATUS_TTL = float(os.getenv("WB_AUTH_STATUS_TTL", "30"))
+wb_auth_status_cache = TTLCache(
+    int(os.getenv("WB_AUTH_STATUS_CACHE_SIZE", "10000")),
+    ttl=WB_AUTH_STATUS_TTL,
+)
+
+# Справочник складов: грузится один раз и обновляется в фоне
+WAREHOUSES_REFRESH_INTERVAL = float(os.getenv("WAREHOUSES_REFRESH_INTERVAL", "3600"))
+warehouse_catalog = WarehouseCatalog(
+    lambda page, limit: backend.warehouses(page, limit=limit),
+    refresh_interval=WAREHOUSES_REFRESH_INTERVAL,
+)
+
+# FSM-хранилище: memory (по умолчанию), redis или sqlite
+FSM_STORAGE = os.getenv("FSM_STORAGE", "memory")
+FSM_REDIS_URL = os.getenv("FSM_REDIS_URL")
+FSM_SQLITE_PATH = os.getenv("FSM_SQLITE_PATH", "fsm.sqlite3")
+FSM_STATE_TTL = int(os.getenv("FSM_STATE_TTL", "0")) or None
+
+# Приём апдейтов: polling (по умолчанию) или webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # публичный URL; если пуст, webhook не регистрируем
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")  # обязателен в режиме webhook, одинаковый у всех реплик
+WEBHOOK_MAX_CONCURRENCY = int(os.getenv("WEBHOOK_MAX_CONCURRENCY", "100"))
+WEBHOOK_MAX_PENDING = int(os.getenv("WEBHOOK_MAX_PENDING", "1000"))
+
+# Персистентная очередь фоновых задач (создание автоброней)
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "jobs.sqlite3")
+AUTOBOOKING_WORKERS = int(os.getenv("AUTOBOOKING_WORKERS", "4"))
+AUTOBOOKING_MAX_ATTEMPTS = int(os.getenv("AUTOBOOKING_MAX_ATTEMPTS", "5"))
+job_queue = JobQueue(
+    JobStore(JOBS_DB_PATH),
+    workers=AUTOBOOKING_WORKERS,
+    max_attempts=AUTOBOOKING_MAX_ATTEMPTS,
+)
+
+# Отслеживание /supplies/load, который backend выполняет как фоновую задачу
+SUPPLIES_LOAD_POLL_INTERVAL = float(os.getenv("SUPPLIES_LOAD_POLL_INTERVAL", "2"))
+SUPPLIES_LOAD_TIMEOUT = float(os.getenv("SUPPLIES_LOAD_TIMEOUT", "900"))
+# синхронных /supplies/load (backend без очереди задач) одновременно
+SUPPLIES_LOAD_MAX_SYNC = int(os.getenv("SUPPLIES_LOAD_MAX_SYNC", "5"))
+supplies_load_tracker = RemoteJobTracker(
+    poll_interval=SUPPLIES_LOAD_POLL_INTERVAL,
+    timeout=SUPPLIES_LOAD_TIMEOUT,
+    max_concurrent_runs=SUPPLIES_LOAD_MAX_SYNC,
+)
+
+# Лимиты исходящих запросов к Telegram (сообщений в секунду)
+TG_GLOBAL_RATE = float(os.getenv("TG_GLOBAL_RATE", "30"))
+TG_PRIVATE_CHAT_RATE = float(os.getenv("TG_PRIVATE_CHAT_RATE", "1"))
+TG_GROUP_CHAT_RATE = float(os.getenv("TG_GROUP_CHAT_RATE", str(20 / 60)))
+TG_CHAT_BURST = float(os.getenv("TG_CHAT_BURST", "5"))
+TG_RETRY_AFTER_ATTEMPTS = int(os.getenv("TG_RETRY_AFTER_ATTEMPTS", "3"))
+outbound_scheduler = OutboundScheduler(
+    global_rate=TG_GLOBAL_RATE,
+    global_burst=TG_GLOBAL_RATE,
+    private_chat_rate=TG_PRIVATE_CHAT_RATE,
+    group_chat_rate=TG_GROUP_CHAT_RATE,
+    chat_burst=TG_CHAT_BURST,
+    max_retries=TG_RETRY_AFTER_ATTEMPTS,
+)
+
+# Плавная остановка: сколько ждать апдейты и фоновые задачи после SIGTERM
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "25"))
+SHUTDOWN_STEP_TIMEOUT = float(os.getenv("SHUTDOWN_STEP_TIMEOUT", "10"))
+lifecycle = Lifecycle(drain_timeout=SHUTDOWN_DRAIN_TIMEOUT, step_timeout=SHUTDOWN_STEP_TIMEOUT)
+
+# HTTP-эндпоинт /metrics (Prometheus); METRICS_PORT=0 отключает
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+
+registry.callback_gauge(
+    "bot_cache_entries",
+    "Entries in in-process caches",
+    lambda: {
+        ("user_id",): len(user_id_cache),
+        ("slot_results",): len(slot_results_cache),
+        ("wb_auth_status",): len(wb_auth_status_cache),
+        ("warehouses",): len(warehouse_catalog),
+    },
+    ("cache",),
+)
+registry.callback_gauge(
+    "bot_cache_bytes",
+    "Estimated size of byte-bounded caches",
+    lambda: {("slot_results",): slot_results_cache.total_bytes},
+    ("cache",),
+)
+registry.callback_gauge(
+    "bot_outbound_queue_depth",
+    "Telegram requests waiting for a global rate-limit token",
+    lambda: {
+        (str(priority),): depth
+        for priority, depth in outbound_scheduler.stats()["global_queue_by_priority"].items()
+    },
+    ("priority",),
+)
+registry.callback_gauge(
+    "bot_outbound_chat_waiters",
+    "Telegram requests waiting for their chat's rate-limit token",
+    lambda: {(): outbound_scheduler.stats()["chat_waiters"]},
+)
+registry.callback_counter(
+    "backend_coalesced_gets_total",
+    "Backend GETs served from an identical request already in flight",
+    lambda: {(): backend.coalescing_stats()["coalesced_gets"]},
+)
+registry.callback_gauge(
+    "backend_admission_in_flight",
+    "Backend calls admitted and running, by endpoint class",
+    lambda: {(name,): s["in_flight"] for name, s in backend_admission.stats().items()},
+    ("class",),
+)
+registry.callback_gauge(
+    "backend_admission_queued",
+    "Backend calls waiting for an admission slot, by endpoint class",
+    lambda: {(name,): s["queued"] for name, s in backend_admission.stats().items()},
+    ("class",),
+)
+registry.callback_gauge(
+    "backend_admission_queue_limit",
+    "Queue length each endpoint class can serve before the wait deadline",
+    lambda: {(name,): s["queue_limit"] for name, s in backend_admission.stats().items()},
+    ("class",),
+)
+registry.callback_counter(
+    "backend_admission_shed_total",
+    "Backend calls rejected because the class queue was full or the wait deadline passed",
+    lambda: {
+        (name, reason): count
+        for name, s in backend_admission.stats().items()
+        for reason, count in s["shed"].items()
+    },
+    ("class", "reason"),
+)
+registry.callback_gauge(
+    "backend_circuit_state",
+    "Circuit breaker state per backend endpoint: 0 closed, 1 half-open, 2 open",
+    lambda: {(endpoint,): s["state"] for endpoint, s in backend_circuits.stats().items()},
+    ("endpoint",),
+)
+registry.callback_counter(
+    "backend_circuit_rejected_total",
+    "Backend calls failed fast by an open circuit",
+    lambda: {(endpoint,): s["rejected"] for endpoint, s in backend_circuits.stats().items()},
+    ("endpoint",),
+)
+registry.callback_counter(
+    "backend_circuit_opened_total",
+    "Times the circuit of a backend endpoint has opened",
+    lambda: {(endpoint,): s["opened"] for endpoint, s in backend_circuits.stats().items()},
+    ("endpoint",),
+)
+registry.callback_counter(
+    "bot_log_records_dropped_total",
+    "Log records dropped because the log queue was full",
+    lambda: {(): dropped_records()},
+)
+if update_recorder is not None:
+    registry.callback_counter(
+        "bot_update_records_dropped_total",
+        "Recorded updates/backend calls dropped because the record queue was full",
+        lambda: {(): update_recorder.dropped},
+    )
+registry.callback_gauge(
+    "bot_in_flight",
+    "Updates being handled and background tasks the shutdown will wait for",
+    lambda: {
+        ("updates",): lifecycle.stats()["updates_in_flight"],
+        ("background_tasks",): lifecycle.stats()["background_tasks"],
+    },
+    ("kind",),
+)
+registry.callback_gauge(
+    "bot_supplies_load_tracked_jobs",
+    "Backend /supplies/load jobs being polled",
+    lambda: {(): supplies_load_tracker.stats()["tracked_jobs"]},
+)
 
 
 STATUS_RU = {
@@ -424,10 +739,13 @@ def _cache_slot_results(
     slots_raw: list | None,
     found_count: int | None,
 ) -> None:
-    slot_results_cache[_slot_cache_key(telegram_id, request_ref)] = {
-        "slots": slots_raw or [],
-        "found": found_count if found_count is not None else len(slots_raw or []),
-    }
+    slot_results_cache.set(
+        _slot_cache_key(telegram_id, request_ref),
+        {
+            "slots": slots_raw or [],
+            "found": found_count if found_count is not None else len(slots_raw or []),
+        },
+    )
 
 
 async def _get_slot_results(
@@ -451,12 +769,9 @@ async def _get_slot_results(
 
     payload = None
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            resp = await client.get(f"{BACKEND_URL}/slots/search/{request_id_int}")
-            resp.raise_for_status()
-            payload = resp.json()
+        payload = await backend.slot_search_result(request_id_int)
     except Exception as e:
-        print(f"Error calling /slots/search/{request_id_int} for slots preview:", e)
+        logger.error("Error calling /slots/search/%s for slots preview: %s", request_id_int, e)
         if cached:
             slots_cached = cached.get("slots") or []
             found_cached = cached.get("found")
@@ -470,18 +785,71 @@ async def _get_slot_results(
 
 
 async def _get_user_id(telegram_id: int) -> int | None:
+    """
+    user_id по telegram_id. Связка не меняется после /users/register,
+    поэтому backend спрашиваем один раз, дальше отдаём из user_id_cache.
+    """
+    user_id = user_id_cache.get(telegram_id)
+    if user_id is not None:
+        return user_id
+
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            resp = await client.get(
-                f"{BACKEND_URL}/users/get-id",
-                params={"telegram_id": telegram_id},
-            )
-            resp.raise_for_status()
-            return resp.json().get("user_id")
+        user_id = await backend.get_user_id(telegram_id)
     except Exception as e:
-        print("Error calling /users/get-id:", e)
+        logger.error("Error calling /users/get-id: %s", e)
         return None
 
+    if user_id is not None:
+        user_id_cache.set(telegram_id, user_id)
+    return user_id
+
+
+# Telegram принимает в deleteMessages не больше 100 id за вызов
+DELETE_MESSAGES_CHUNK = 100
+
+UI_MESSAGE_KEYS = ("ui_message_ids", "slot_tasks_message_ids", "autobook_message_ids")
+
+async def _delete_messages(bot: Bot, chat_id: int, message_ids: list[int]) -> None:
+    """
+    Удаляет сообщения пачками через deleteMessages. Если пачка не прошла,
+    удаляем её сообщения по одному, но параллельно.
+    """
+    for start in range(0, len(message_ids), DELETE_MESSAGES_CHUNK):
+        chunk = message_ids[start:start + DELETE_MESSAGES_CHUNK]
+        try:
+            await bot.delete_messages(chat_id=chat_id, message_ids=chunk)
+        except Exception:
+            await asyncio.gather(
+                *(bot.delete_message(chat_id=chat_id, message_id=mid) for mid in chunk),
+                return_exceptions=True,
+            )
+
+
+def _schedule_delete_messages(bot: Bot, chat_id: int, message_ids: list[int]) -> None:
+    """
+    Запускает удаление в фоне, чтобы следующий экран не ждал Telegram.
+    """
+    ids = list(dict.fromkeys(message_ids))
+    if not ids:
+        return
+    lifecycle.spawn(_delete_messages(bot, chat_id, ids), name="ui-delete")
+
+
+async def _clear_tracked_messages(message: Message, state: FSMContext, keys: tuple[str, ...]) -> None:
+    """
+    Снимает с учёта id сообщений под ключами FSM keys и удаляет их в фоне.
+    Один и тот же id может лежать сразу под несколькими ключами — удаляем его один раз.
+    """
+    data = await state.get_data()
+    ids: list[int] = []
+    for key in keys:
+        ids.extend(data.get(key) or [])
+    if not ids:
+        return
+
+    await state.update_data({key: [] for key in keys})
+    _schedule_delete_messages(message.bot, message.chat.id, ids)
+
 
 async def _autobook_add_message_id(message_obj: Message, state: FSMContext) -> None:
     data = await state.get_data()
@@ -492,20 +860,13 @@ async def _autobook_add_message_id(message_obj: Message, state: FSMContext) -> N
 
 
 async def _autobook_clear_messages(message_obj: Message, state: FSMContext) -> None:
-    data = await state.get_data()
-    ids = data.get("autobook_message_ids") or []
-    for mid in ids:
-        try:
-            await message_obj.bot.delete_message(chat_id=message_obj.chat.id, message_id=mid)
-        except Exception:
-            continue
-    await state.update_data(autobook_message_ids=[])
+    await _clear_tracked_messages(message_obj, state, ("autobook_message_ids",))
 
 
 async def _drop_ui_message_id(state: FSMContext, mid: int) -> None:
     data = await state.get_data()
     modified = False
-    for key in ("ui_message_ids", "autobook_message_ids", "slot_tasks_message_ids"):
+    for key in UI_MESSAGE_KEYS:
         ids = data.get(key)
         if ids and mid in ids:
             data[key] = [i for i in ids if i != mid]
@@ -515,14 +876,7 @@ async def _drop_ui_message_id(state: FSMContext, mid: int) -> None:
 
 
 async def _clear_slot_tasks_messages(message_obj: Message, state: FSMContext) -> None:
-    data = await state.get_data()
-    ids = data.get("slot_tasks_message_ids") or []
-    for mid in ids:
-        try:
-            await message_obj.bot.delete_message(chat_id=message_obj.chat.id, message_id=mid)
-        except Exception:
-            continue
-    await state.update_data(slot_tasks_message_ids=[])
+    await _clear_tracked_messages(message_obj, state, ("slot_tasks_message_ids",))
 
 
 async def _add_slot_tasks_message_id(message_obj: Message, state: FSMContext) -> None:
@@ -538,14 +892,7 @@ async def _clear_autobook_messages(message: Message, state: FSMContext) -> None:
     Удаляет ранее отправленные ботом сообщения раздела 'Мои автоброни'.
     id сообщений храним в FSM под ключом 'autobook_message_ids'.
     """
-    data = await state.get_data()
-    ids = data.get("autobook_message_ids") or []
-    for mid in ids:
-        try:
-            await message.bot.delete_message(chat_id=message.chat.id, message_id=mid)
-        except Exception:
-            continue
-    await state.update_data(autobook_message_ids=[])
+    await _clear_tracked_messages(message, state, ("autobook_message_ids",))
 
 
 async def _add_autobook_message_id(msg: Message, state: FSMContext) -> None:
@@ -561,32 +908,7 @@ async def clear_ui(message: Message, state: FSMContext) -> None:
     Очищает UI-сообщения основных разделов (Мои задачи, Мои автоброни и т.п.).
     Удаляет сообщения бота, id которых хранятся в FSM под известными ключами.
     """
-    data = await state.get_data()
-
-    keys = [
-        "slot_tasks_message_ids",
-        "autobook_message_ids",
-        "ui_message_ids",
-    ]
-
-    modified = False
-
-    for key in keys:
-        ids = data.get(key) or []
-        if not ids:
-            continue
-
-        for mid in ids:
-            try:
-                await message.bot.delete_message(chat_id=message.chat.id, message_id=mid)
-            except Exception:
-                continue
-
-        data[key] = []
-        modified = True
-
-    if modified:
-        await state.update_data(**data)
+    await _clear_tracked_messages(message, state, UI_MESSAGE_KEYS)
 
 
 async def add_ui_message(state: FSMContext, mid: int):
@@ -642,26 +964,7 @@ async def clear_all_ui(message: Message, state: FSMContext) -> None:
     """
     Глобальная очистка UI: удаляет все сообщения, ID которых бот хранит в FSM.
     """
-    data = await state.get_data()
-    keys = [
-        "ui_message_ids",
-        "slot_tasks_message_ids",
-        "autobook_message_ids",
-    ]
-    modified = False
-    for key in keys:
-        ids = data.get(key) or []
-        if not ids:
-            continue
-        for mid in ids:
-            try:
-                await message.bot.delete_message(chat_id=message.chat.id, message_id=mid)
-            except Exception:
-                continue
-        data[key] = []
-        modified = True
-    if modified:
-        await state.update_data(**data)
+    await _clear_tracked_messages(message, state, UI_MESSAGE_KEYS)
 
 
 async def show_moves_list(message: Message, state: FSMContext, telegram_id: int, page: int = 1) -> None:
@@ -671,29 +974,9 @@ async def show_moves_list(message: Message, state: FSMContext, telegram_id: int,
     await clear_all_ui(message, state)
 
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            resp = await client.post(
-                f"{BACKEND_URL}/slots/search",
-                json={
-                    "warehouse": warehouse,
-                    "supply_type": {
-                        "box": "Короба",
-                        "mono": "Монопаллеты",
-                        "postal": "Поштучная паллета",
-                        "safe": "Суперсейф"
-                    }[supply_type],
-                    "max_booking_coefficient": str(max_coef),
-                    "max_logistics_percent": max_logistics_coef_percent or 9999,
-                    "search_period_days": period_days if period_days is not None else 30,
-                    "lead_time_days": lead_time_days,
-                    "weekdays_only": (weekdays_code == "weekdays"),
-                    "telegram_chat_id": telegram_id,
-                    "user_id": payload.get("user_id", telegram_id)
-                },
-            )
-            resp.raise_for_status()
+        tasks = await backend.stock_move_list(telegram_id)
     except Exception as e:
-        print("Error calling /stock-move/list:", e)
+        logger.error("Error calling /stock-move/list: %s", e)
         kb_err = InlineKeyboardMarkup(
             inline_keyboard=[[InlineKeyboardButton(text="🏠 Главное меню", callback_data="menu_main")]]
         )
@@ -743,7 +1026,7 @@ async def show_moves_list(message: Message, state: FSMContext, telegram_id: int,
                 [
                     InlineKeyboardButton(
                         text=f"Открыть задачу #{idx}",
-                        callback_data=f"moves_open:{task_id}",
+                        callback_data=codec.pack(MovesOpen(task_id)),
                     )
                 ]
             )
@@ -751,11 +1034,11 @@ async def show_moves_list(message: Message, state: FSMContext, telegram_id: int,
     nav_buttons = []
     if page > 1:
         nav_buttons.append(
-            InlineKeyboardButton(text="◀️", callback_data=f"moves_page:{page-1}")
+            InlineKeyboardButton(text="◀️", callback_data=codec.pack(MovesPage(page - 1)))
         )
     if page < total_pages:
         nav_buttons.append(
-            InlineKeyboardButton(text="▶️", callback_data=f"moves_page:{page+1}")
+            InlineKeyboardButton(text="▶️", callback_data=codec.pack(MovesPage(page + 1)))
         )
     if nav_buttons:
         kb_rows.append(nav_buttons)
@@ -777,16 +1060,10 @@ async def show_move_card(message: Message, state: FSMContext, telegram_id: int,
 
     task = None
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            resp = await client.get(
-                f"{BACKEND_URL}/stock-move/list",
-                params={"telegram_id": telegram_id},
-            )
-            resp.raise_for_status()
-            tasks = resp.json()
-            task = next((t for t in tasks if t.get("id") == task_id), None)
+        tasks = await backend.stock_move_list(telegram_id)
+        task = next((t for t in tasks if t.get("id") == task_id), None)
     except Exception as e:
-        print("Error calling /stock-move/list for card:", e)
+        logger.error("Error calling /stock-move/list for card: %s", e)
         task = None
 
     if not task:
@@ -820,7 +1097,7 @@ async def show_move_card(message: Message, state: FSMContext, telegram_id: int,
         kb_rows.append(
             [
                 InlineKeyboardButton(
-                    text="⏸ Остановить", callback_data=f"moves_stop:{task_id}"
+                    text="⏸ Остановить", callback_data=codec.pack(MovesStop(task_id))
                 )
             ]
         )
@@ -828,7 +1105,7 @@ async def show_move_card(message: Message, state: FSMContext, telegram_id: int,
         kb_rows.append(
             [
                 InlineKeyboardButton(
-                    text="▶️ Запустить", callback_data=f"moves_start:{task_id}"
+                    text="▶️ Запустить", callback_data=codec.pack(MovesStart(task_id))
                 )
             ]
         )
@@ -869,7 +1146,7 @@ async def show_move_accounts(message: Message, state: FSMContext) -> None:
         kb_rows.append(
             [
                 InlineKeyboardButton(
-                    text=acc_name or acc_id, callback_data=f"moves_acc:{acc_id}"
+                    text=acc_name or acc_id, callback_data=codec.pack(MovesAccount(acc_id))
                 )
             ]
         )
@@ -898,7 +1175,7 @@ async def show_move_articles(message: Message, state: FSMContext) -> None:
             [
                 InlineKeyboardButton(
                     text=f"{art_name} (остаток {total_qty} шт.)",
-                    callback_data=f"moves_art:{art_id}",
+                    callback_data=codec.pack(MovesArticle(art_id)),
                 )
             ]
         )
@@ -911,29 +1188,35 @@ async def show_move_articles(message: Message, state: FSMContext) -> None:
     await add_ui_message(state, msg.message_id)
 
 
-async def show_move_from_warehouses(message: Message, state: FSMContext) -> None:
+def _move_article_stocks(data: dict) -> list[dict]:
     """
-    Шаг 3: выбор склада-источника (где есть остаток).
+    Остатки выбранного товара по складам из move_options в FSM. Кнопки
+    склада-источника ссылаются на индекс в этом списке.
     """
-    await clear_all_ui(message, state)
-    data = await state.get_data()
     options = data.get("move_options") or {}
     article_id = data.get("article_id")
-
     articles = options.get("articles") or []
     article = next((a for a in articles if a.get("id") == article_id), None)
-    stocks = article.get("stocks") if article else []
+    return (article.get("stocks") if article else None) or []
+
+
+async def show_move_from_warehouses(message: Message, state: FSMContext) -> None:
+    """
+    Шаг 3: выбор склада-источника (где есть остаток).
+    """
+    await clear_all_ui(message, state)
+    stocks = _move_article_stocks(await state.get_data())
 
     text = "Шаг 3 из 6 — склад-источник.\n\nВыбери склад, с которого будем забирать товар:"
     kb_rows = []
-    for st in stocks:
+    for index, st in enumerate(stocks):
         wh = st.get("warehouse")
         qty = st.get("qty")
         if qty and qty > 0:
             kb_rows.append(
                 [
                     InlineKeyboardButton(
-                        text=f"{wh} (доступно {qty} шт.)", callback_data=f"moves_from:{wh}"
+                        text=f"{wh} (доступно {qty} шт.)", callback_data=codec.pack(MovesFrom(index))
                     )
                 ]
             )
@@ -959,13 +1242,13 @@ async def show_move_to_warehouses(message: Message, state: FSMContext) -> None:
 
     text = "Шаг 4 из 6 — склад-получатель.\n\nВыбери склад, на который отправим товар:"
     kb_rows = []
-    for wh in warehouses:
+    for index, wh in enumerate(warehouses):
         wh_name = wh.get("name")
         if wh_name and wh_name != from_warehouse:
             kb_rows.append(
                 [
                     InlineKeyboardButton(
-                        text=wh_name, callback_data=f"moves_to:{wh_name}"
+                        text=wh_name, callback_data=codec.pack(MovesTo(index))
                     )
                 ]
             )
@@ -989,12 +1272,9 @@ async def start_move_wizard(message: Message, state: FSMContext, telegram_id: in
     """
     await clear_all_ui(message, state)
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            resp = await client.get(f"{BACKEND_URL}/stock-move/options")
-            resp.raise_for_status()
-            options = resp.json()
+        options = await backend.stock_move_options()
     except Exception as e:
-        print("Error calling /stock-move/options:", e)
+        logger.error("Error calling /stock-move/options: %s", e)
         kb_err = InlineKeyboardMarkup(
             inline_keyboard=[[InlineKeyboardButton(text="🏠 Главное меню", callback_data="menu_main")]]
         )
@@ -1018,7 +1298,7 @@ async def show_move_qty(message: Message, state: FSMContext) -> None:
 
     text = "Шаг 4 из 4 — количество.\n\nВыбери, сколько единиц товара перераспределить:"
     qty_options = [10, 50, 100, 200]
-    kb_rows = [[InlineKeyboardButton(text=f"{q} шт.", callback_data=f"moves_qty:{q}")] for q in qty_options]
+    kb_rows = [[InlineKeyboardButton(text=f"{q} шт.", callback_data=codec.pack(MovesQty(q)))] for q in qty_options]
     kb_rows.append(
         [InlineKeyboardButton(text="⬅️ Назад, выбрать другой склад", callback_data="moves_back_to")]
     )
@@ -1119,7 +1399,7 @@ async def _send_autobook_page(message: Message, state: FSMContext, page: int = 0
             [
                 InlineKeyboardButton(
                     text=f"Открыть автобронь #{task_id}",
-                    callback_data=f"autobook_open:{task_id}",
+                    callback_data=codec.pack(AutobookOpen(task_id)),
                 )
             ]
         )
@@ -1129,14 +1409,14 @@ async def _send_autobook_page(message: Message, state: FSMContext, page: int = 0
         nav_buttons.append(
             InlineKeyboardButton(
                 text="◀️ Назад",
-                callback_data=f"autobook_page:{page-1}",
+                callback_data=codec.pack(AutobookPage(page - 1)),
             )
         )
     if page < total_pages - 1:
         nav_buttons.append(
             InlineKeyboardButton(
                 text="▶️ Далее",
-                callback_data=f"autobook_page:{page+1}",
+                callback_data=codec.pack(AutobookPage(page + 1)),
             )
         )
     if nav_buttons:
@@ -1206,7 +1486,7 @@ async def _render_autobook_card(message: Message, state: FSMContext, autobook_id
             [
                 InlineKeyboardButton(
                     text="⏸ Остановить",
-                    callback_data=f"autobook_stop:{autobook_id}",
+                    callback_data=codec.pack(AutobookStop(autobook_id)),
                 )
             ]
         )
@@ -1215,7 +1495,7 @@ async def _render_autobook_card(message: Message, state: FSMContext, autobook_id
             [
                 InlineKeyboardButton(
                     text="▶️ Запустить",
-                    callback_data=f"autobook_start:{autobook_id}",
+                    callback_data=codec.pack(AutobookStart(autobook_id)),
                 )
             ]
         )
@@ -1224,7 +1504,7 @@ async def _render_autobook_card(message: Message, state: FSMContext, autobook_id
         [
             InlineKeyboardButton(
                 text="🗑 Удалить",
-                callback_data=f"autobook_delete:{autobook_id}",
+                callback_data=codec.pack(AutobookDelete(autobook_id)),
             )
         ]
     )
@@ -1312,9 +1592,9 @@ async def _send_slot_tasks_page(message: Message, state: FSMContext, page: int =
 
     nav_buttons = []
     if page > 0:
-        nav_buttons.append(InlineKeyboardButton(text="◀️ Назад", callback_data=f"slot_tasks_page:{page-1}"))
+        nav_buttons.append(InlineKeyboardButton(text="◀️ Назад", callback_data=codec.pack(SlotTasksPage(page - 1))))
     if page < total_pages - 1:
-        nav_buttons.append(InlineKeyboardButton(text="▶️ Далее", callback_data=f"slot_tasks_page:{page+1}"))
+        nav_buttons.append(InlineKeyboardButton(text="▶️ Далее", callback_data=codec.pack(SlotTasksPage(page + 1))))
 
     kb_rows = []
     for t in page_tasks:
@@ -1322,7 +1602,7 @@ async def _send_slot_tasks_page(message: Message, state: FSMContext, page: int =
         kb_rows.append(
             [
                 InlineKeyboardButton(
-                    text=f"Открыть задачу #{task_id}", callback_data=f"slot_task_open:{task_id}"
+                    text=f"Открыть задачу #{task_id}", callback_data=codec.pack(SlotTaskOpen(task_id))
                 )
             ]
         )
@@ -1416,27 +1696,27 @@ async def _render_slot_task_card(message: Message, state: FSMContext, task_id: i
         action_buttons.append(
             InlineKeyboardButton(
                 text="🤖 Автобронировать",
-                callback_data=f"autobook_from_search:{task_id}",
+                callback_data=codec.pack(AutobookFromSearch(task_id)),
             )
         )
         action_buttons.append(
             InlineKeyboardButton(
                 text="❌ Отменить",
-                callback_data=f"slot_cancel:{task_id}",
+                callback_data=codec.pack(SlotCancel(task_id)),
             )
         )
     elif status == "cancelled":
         action_buttons.append(
             InlineKeyboardButton(
                 text="🔁 Запустить заново",
-                callback_data=f"slot_restart:{task_id}",
+                callback_data=codec.pack(SlotRestart(task_id)),
             )
         )
 
     action_buttons.append(
         InlineKeyboardButton(
             text="🗑 Удалить",
-            callback_data=f"slot_delete:{task_id}",
+            callback_data=codec.pack(SlotDelete(task_id)),
         )
     )
 
@@ -1449,7 +1729,7 @@ async def _render_slot_task_card(message: Message, state: FSMContext, task_id: i
     kb_rows.append(
         [
             InlineKeyboardButton(
-                text="🤖 Настроить автоброни", callback_data=f"slot_auto_{task_id}"
+                text="🤖 Настроить автоброни", callback_data=codec.pack(SlotAuto(task_id))
             )
         ]
     )
@@ -1478,19 +1758,14 @@ async def cmd_start(message: Message, state: FSMContext) -> None:
     2) шлём приветствие
     """
     await clear_all_ui(message, state)
-    async with httpx.AsyncClient() as client:
-        try:
-            await client.post(
-                f"{BACKEND_URL}/users/register",
-                json={
-                    "telegram_id": message.from_user.id,
-                    "username": message.from_user.username,
-                },
-                timeout=5.0,
-            )
-        except Exception as e:
-            # На этом спринте можно просто залогировать, но не падать
-            print(f"Error calling /users/register: {e}")
+    try:
+        await backend.register_user(message.from_user.id, message.from_user.username)
+    except Exception as e:
+        # На этом спринте можно просто залогировать, но не падать
+        logger.error("Error calling /users/register: %s", e)
+    else:
+        # прогреваем кэш user_id, чтобы следующие экраны не ходили в /users/get-id
+        await _get_user_id(message.from_user.id)
 
     await send_main_menu(message, state)
 
@@ -1524,19 +1799,9 @@ async def wb_auth_phone_step(message: Message, state: FSMContext) -> None:
         )
         await add_ui_message(state, waiting_msg.message_id)
 
-        async with httpx.AsyncClient(timeout=60) as client:
-            resp = await client.post(
-                f"{BACKEND_URL}/auth/start",
-                json={
-                    "telegram_id": telegram_id,
-                    "username": message.from_user.username,
-                    "phone": normalized
-                },
-            )
-            resp.raise_for_status()
-            payload = resp.json()
+        payload = await backend.auth_start(telegram_id, message.from_user.username, normalized)
     except Exception as e:
-        print("Error calling /auth/start:", e)
+        logger.error("Error calling /auth/start: %s", e)
         msg = await message.answer("Сервер не отвечает. Попробуй позже.", reply_markup=kb_main)
         await add_ui_message(state, msg.message_id)
         return
@@ -1607,18 +1872,12 @@ async def wb_auth_code_step(message: Message, state: FSMContext) -> None:
         )
         await add_ui_message(state, waiting_msg.message_id)
 
-        async with httpx.AsyncClient(timeout=15) as client:
-            resp = await client.post(
-                f"{BACKEND_URL}/auth/code",
-                json={"session_id": session_id, "code": code},
-            )
-            resp.raise_for_status()
-            payload = resp.json()
-            user_sessions[telegram_id] = session_id
+        payload = await backend.auth_code(session_id, code)
+        user_sessions[telegram_id] = session_id
     except Exception as e:
         if waiting_msg:
             await delete_ui_message(message, state, waiting_msg.message_id)
-        print("Error calling /auth/code:", e)
+        logger.error("Error calling /auth/code: %s", e)
         msg_err = await message.answer("Ошибка подтверждения кода. Попробуй снова.", reply_markup=kb_main)
         await add_ui_message(state, msg_err.message_id)
         return
@@ -1641,6 +1900,7 @@ async def wb_auth_code_step(message: Message, state: FSMContext) -> None:
     if payload.get("status") in ("authorized", "ok"):
         # сохраняем session id навсегда
         user_sessions[telegram_id] = session_id
+        wb_auth_status_cache.pop(telegram_id)
 
         await state.clear()
         msg = await message.answer("Готово! Ты успешно авторизован в WB ✅", reply_markup=kb_main)
@@ -1650,18 +1910,25 @@ async def wb_auth_code_step(message: Message, state: FSMContext) -> None:
 
 
 async def _fetch_wb_auth_status(telegram_id: int) -> bool | None:
+    """
+    Статус авторизации WB с коротким кэшем (WB_AUTH_STATUS_TTL).
+    None — backend не ответил, такой результат не кэшируем.
+    """
+    authorized = wb_auth_status_cache.get(telegram_id)
+    if authorized is not None:
+        return authorized
+
     try:
-        async with httpx.AsyncClient(timeout=10) as client:
-            resp = await client.get(
-                f"{BACKEND_URL}/wb/auth/status", params={"telegram_id": telegram_id}
-            )
-            resp.raise_for_status()
-            payload = resp.json()
-            return payload.get("authorized")
+        payload = await backend.wb_auth_status(telegram_id)
     except Exception as e:
-        print("Error calling /wb/auth/status:", e)
+        logger.error("Error calling /wb/auth/status: %s", e)
         return None
 
+    authorized = payload.get("authorized")
+    if authorized is not None:
+        wb_auth_status_cache.set(telegram_id, bool(authorized))
+    return authorized
+
 
 async def _do_wb_status(message: Message, state: FSMContext, telegram_id: int) -> None:
     authorized = await _fetch_wb_auth_status(telegram_id)
@@ -1698,30 +1965,28 @@ async def _do_wb_logout(message: Message, state: FSMContext, telegram_id: int) -
         await add_ui_message(state, msg.message_id)
         return
 
-    async with httpx.AsyncClient() as client:
-        try:
-            resp = await client.post(
-                f"{BACKEND_URL}/logout",
-                json={"telegram_id": telegram_id},
-                timeout=5.0,
+    try:
+        resp = await backend.logout(telegram_id)
+        wb_auth_status_cache.pop(telegram_id)
+        if resp.status_code == 404:
+            msg = await message.answer("Ты и так не авторизован в WB.")
+            await add_ui_message(state, msg.message_id)
+            return
+        if resp.status_code == 422:
+            detail = resp.json().get("detail")
+            detail_text = "Неверные данные запроса." if detail is None else str(detail)
+            msg = await message.answer(
+                f"Не удалось выполнить выход из WB: {detail_text}"
             )
-            if resp.status_code == 404:
-                msg = await message.answer("Ты и так не авторизован в WB.")
-                await add_ui_message(state, msg.message_id)
-                return
-            if resp.status_code == 422:
-                detail = resp.json().get("detail")
-                detail_text = "Неверные данные запроса." if detail is None else str(detail)
-                msg = await message.answer(
-                    f"Не удалось выполнить выход из WB: {detail_text}"
-                )
-                await add_ui_message(state, msg.message_id)
-                return
-            resp.raise_for_status()
-        except Exception:
-            msg = await message.answer("Не удалось выполнить выход из WB, попробуй позже.")
             await add_ui_message(state, msg.message_id)
             return
+        resp.raise_for_status()
+    except Exception:
+        msg = await message.answer("Не удалось выполнить выход из WB, попробуй позже.")
+        await add_ui_message(state, msg.message_id)
+        return
+
+    user_id_cache.pop(telegram_id)
 
     msg = await message.answer(
         "Ты вышел из кабинета WB. При необходимости можешь заново авторизоваться через меню «Авторизация WB».",
@@ -1737,66 +2002,41 @@ async def cmd_wb_logout(message: Message, state: FSMContext) -> None:
     await _do_wb_logout(message, state, message.from_user.id)
 
 
-async def on_warehouse_page(callback: CallbackQuery, state: FSMContext):
+async def on_warehouse_page(callback: CallbackQuery, state: FSMContext, callback_args: WarehousePage):
     await callback.answer()
 
-    _, page_str = callback.data.split(":")
-    page = int(page_str)
+    page = callback_args.page
 
-    # Загружаем новую страницу
+    # Страницы режем из общего справочника складов, backend не трогаем
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            resp = await client.get(
-                f"{BACKEND_URL}/warehouses",
-                params={"page": page, "limit": 10}
-            )
-            resp.raise_for_status()
-            data = resp.json()
+        await warehouse_catalog.ensure_loaded()
     except Exception as e:
-        print("Error /warehouses:", e)
+        logger.error("Error /warehouses: %s", e)
         return
 
-    # Берём старый wh_map (может содержать данные прошлых страниц)
-    fs = await state.get_data()
-    old_map = fs.get("wh_map", {})
-
-    # Создаем map для новой страницы
-    new_map = {w["id"]: w["name"] for w in data["items"]}
-
-    # Объединяем, НЕ перезаписывая прежние данные
-    combined_map = {**old_map, **new_map}
-
-    # Сохраняем ВСЁ
-    await state.update_data(
-        wh_items=data["items"],
-        wh_page=data["page"],
-        wh_pages=data["pages"],
-        wh_map=combined_map,
-    )
+    await state.update_data(wh_page=page)
 
     await clear_all_ui(callback.message, state)
     await _render_warehouse_page(callback.message, state)
 
 async def _render_warehouse_page(message: Message, state: FSMContext):
     data = await state.get_data()
-    items = data.get("wh_items", [])
-    page = data.get("wh_page", 0)
-    pages = data.get("wh_pages", 1)
+    items, page, pages = warehouse_catalog.page(data.get("wh_page", 0), WAREHOUSES_PAGE_SIZE)
 
     rows = []
     for w in items:
         rows.append([
             InlineKeyboardButton(
                 text=w["name"],
-                callback_data=f"slot_wh_id:{w['id']}"
+                callback_data=codec.pack(SlotWarehouse(w["id"]))
             )
         ])
 
     nav = []
     if page > 0:
-        nav.append(InlineKeyboardButton(text="◀️", callback_data=f"wh_page:{page-1}"))
+        nav.append(InlineKeyboardButton(text="◀️", callback_data=codec.pack(WarehousePage(page - 1))))
     if page < pages - 1:
-        nav.append(InlineKeyboardButton(text="▶️", callback_data=f"wh_page:{page+1}"))
+        nav.append(InlineKeyboardButton(text="▶️", callback_data=codec.pack(WarehousePage(page + 1))))
     if nav:
         rows.append(nav)
 
@@ -1813,24 +2053,16 @@ async def _render_warehouse_page(message: Message, state: FSMContext):
 async def cmd_create_search(message: Message, state: FSMContext) -> None:
     await clear_all_ui(message, state)
 
-    # грузим первую страницу складов
+    # справочник складов грузится один раз на процесс
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            resp = await client.get(f"{BACKEND_URL}/warehouses", params={"page": 0, "limit": 10})
-            resp.raise_for_status()
-            data = resp.json()
+        await warehouse_catalog.ensure_loaded()
     except Exception as e:
-        print("Error GET /warehouses:", e)
+        logger.error("Error GET /warehouses: %s", e)
         msg = await message.answer("Не удалось загрузить список складов.")
         await add_ui_message(state, msg.message_id)
         return
 
-    await state.update_data(
-        wh_items=data["items"],
-        wh_page=data["page"],
-        wh_pages=data["pages"],
-        wh_map={w["id"]: w["name"] for w in data["items"]}
-    )
+    await state.update_data(wh_page=0)
 
     await _render_warehouse_page(message, state)
     await state.set_state(SlotSearchState.warehouse)
@@ -1902,21 +2134,15 @@ async def _render_tasks_history(
         return
 
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            resp = await client.get(
-                f"{BACKEND_URL}/requests/history",
-                params={
-                    "user_id": user_id,
-                    "req_type": req_type,
-                    "page": page,
-                    "page_size": HISTORY_PAGE_SIZE,
-                    **({"statuses": ",".join(status_filter)} if status_filter else {}),
-                },
-            )
-            resp.raise_for_status()
-            data = resp.json()
+        data = await backend.requests_history(
+            user_id,
+            req_type,
+            page,
+            HISTORY_PAGE_SIZE,
+            statuses=status_filter,
+        )
     except Exception as e:
-        print("Error calling /requests/history:", e)
+        logger.error("Error calling /requests/history: %s", e)
         kb_err = InlineKeyboardMarkup(
             inline_keyboard=[
                 [InlineKeyboardButton(text="↩️ Назад", callback_data="menu_tasks")],
@@ -1980,7 +2206,7 @@ async def _render_tasks_history(
             filter_buttons.append(
                 InlineKeyboardButton(
                     text=text,
-                    callback_data=f"tasks_history_slot_search_filter:{code}",
+                    callback_data=codec.pack(TasksHistoryFilter(code)),
                 )
             )
 
@@ -2001,7 +2227,7 @@ async def _render_tasks_history(
                     [
                         InlineKeyboardButton(
                             text=button_text,
-                            callback_data=f"tasks_history_slot_search_open:{item_id}",
+                            callback_data=codec.pack(TasksHistorySearchOpen(item_id)),
                         )
                     ]
                 )
@@ -2016,7 +2242,7 @@ async def _render_tasks_history(
                     [
                         InlineKeyboardButton(
                             text=button_text,
-                            callback_data=f"tasks_history_auto_booking_open:{item_id}",
+                            callback_data=codec.pack(TasksHistoryAutobookOpen(item_id)),
                         )
                     ]
                 )
@@ -2030,13 +2256,13 @@ async def _render_tasks_history(
     if page_num > 1:
         nav_buttons.append(
             InlineKeyboardButton(
-                text="◀️", callback_data=f"tasks_history_{req_type}_page:{page_num-1}"
+                text="◀️", callback_data=codec.pack(TASKS_HISTORY_PAGES[req_type](page_num - 1))
             )
         )
     if page_num < total_pages:
         nav_buttons.append(
             InlineKeyboardButton(
-                text="▶️", callback_data=f"tasks_history_{req_type}_page:{page_num+1}"
+                text="▶️", callback_data=codec.pack(TASKS_HISTORY_PAGES[req_type](page_num + 1))
             )
         )
 
@@ -2128,12 +2354,9 @@ async def _render_slot_history_detail(
     slots_raw = _extract_slots(item)
     if not slots_raw:
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                resp = await client.get(f"{BACKEND_URL}/slots/search/{request_id}")
-                resp.raise_for_status()
-                detail_payload = resp.json()
+            detail_payload = await backend.slot_search_result(request_id)
         except Exception as e:
-            print(f"Error calling /slots/search/{request_id}:", e)
+            logger.error("Error calling /slots/search/%s: %s", request_id, e)
         slots_raw = _extract_slots(detail_payload)
 
     slot_lines = format_slot_lines(slots_raw)
@@ -2149,13 +2372,13 @@ async def _render_slot_history_detail(
             [
                 InlineKeyboardButton(
                     text="⛔️ Отменить поиск",
-                    callback_data=f"tasks_history_slot_search_cancel:{request_id}",
+                    callback_data=codec.pack(TasksHistorySearchCancel(request_id)),
                 )
             ]
         )
 
     kb_rows.append(
-        [InlineKeyboardButton(text="⬅️ Назад", callback_data=f"tasks_history_slot_search_page:{history.get('page', 1)}")]
+        [InlineKeyboardButton(text="⬅️ Назад", callback_data=codec.pack(TasksHistorySearchPage(history.get("page", 1))))]
     )
     kb_rows.append([InlineKeyboardButton(text="📋 Мои задачи", callback_data="menu_tasks")])
     kb_rows.append([InlineKeyboardButton(text="🏠 Главное меню", callback_data="menu_main")])
@@ -2203,7 +2426,7 @@ async def _render_autobook_history_detail(
     ]
 
     kb_rows = [
-        [InlineKeyboardButton(text="⬅️ Назад", callback_data=f"tasks_history_auto_booking_page:{history.get('page', 1)}")],
+        [InlineKeyboardButton(text="⬅️ Назад", callback_data=codec.pack(TasksHistoryAutobookPage(history.get("page", 1))))],
         [InlineKeyboardButton(text="📋 Мои задачи", callback_data="menu_tasks")],
         [InlineKeyboardButton(text="🏠 Главное меню", callback_data="menu_main")],
     ]
@@ -2340,36 +2563,20 @@ async def tasks_history_autobook_callback(callback: CallbackQuery, state: FSMCon
     await _render_tasks_history(callback.message, state, callback.from_user.id, "auto_booking", page=1)
 
 
-async def tasks_history_page_callback(callback: CallbackQuery, state: FSMContext) -> None:
-    data_cb = callback.data or ""
-    try:
-        prefix, page_str = data_cb.split(":", 1)
-        page = int(page_str)
-    except Exception:
-        await callback.answer("Некорректная страница.", show_alert=True)
-        return
-
-    handled = False
-    if prefix.startswith("tasks_history_slot_search_page"):
-        await _render_tasks_history(callback.message, state, callback.from_user.id, "slot_search", page=page)
-        handled = True
-    elif prefix.startswith("tasks_history_auto_booking_page"):
-        await _render_tasks_history(callback.message, state, callback.from_user.id, "auto_booking", page=page)
-        handled = True
-
-    if handled:
-        await callback.answer()
-    else:
-        await callback.answer("Неизвестный тип задач.", show_alert=True)
+async def tasks_history_page_callback(
+    callback: CallbackQuery,
+    state: FSMContext,
+    callback_args: TasksHistorySearchPage | TasksHistoryAutobookPage,
+) -> None:
+    req_type = "slot_search" if isinstance(callback_args, TasksHistorySearchPage) else "auto_booking"
+    await _render_tasks_history(callback.message, state, callback.from_user.id, req_type, page=callback_args.page)
+    await callback.answer()
 
 
-async def tasks_history_slot_search_filter_callback(callback: CallbackQuery, state: FSMContext) -> None:
-    data_cb = callback.data or ""
-    try:
-        _, raw_filter = data_cb.split(":", 1)
-    except Exception:
-        await callback.answer("Некорректный фильтр.", show_alert=True)
-        return
+async def tasks_history_slot_search_filter_callback(
+    callback: CallbackQuery, state: FSMContext, callback_args: TasksHistoryFilter
+) -> None:
+    raw_filter = callback_args.code
 
     mapping = {
         "all": [],
@@ -2394,54 +2601,34 @@ async def tasks_history_slot_search_filter_callback(callback: CallbackQuery, sta
 
 
 async def tasks_history_slot_search_open_callback(
-    callback: CallbackQuery, state: FSMContext
+    callback: CallbackQuery, state: FSMContext, callback_args: TasksHistorySearchOpen
 ) -> None:
-    data_cb = callback.data or ""
-    try:
-        _, request_id_str = data_cb.split(":", 1)
-        request_id = int(request_id_str)
-    except Exception:
-        await callback.answer("Некорректная задача.", show_alert=True)
-        return
+    request_id = callback_args.item_id
 
     await callback.answer()
     await _render_slot_history_detail(callback.message, state, request_id)
 
 
 async def tasks_history_autobook_open_callback(
-    callback: CallbackQuery, state: FSMContext
+    callback: CallbackQuery, state: FSMContext, callback_args: TasksHistoryAutobookOpen
 ) -> None:
-    data_cb = callback.data or ""
-    try:
-        _, request_id_str = data_cb.split(":", 1)
-        request_id = int(request_id_str)
-    except Exception:
-        await callback.answer("Некорректная задача.", show_alert=True)
-        return
+    request_id = callback_args.item_id
 
     await callback.answer()
     await _render_autobook_history_detail(callback.message, state, request_id)
 
 
 async def tasks_history_slot_search_cancel_callback(
-    callback: CallbackQuery, state: FSMContext
+    callback: CallbackQuery, state: FSMContext, callback_args: TasksHistorySearchCancel
 ) -> None:
-    data_cb = callback.data or ""
-    try:
-        _, request_id_str = data_cb.split(":", 1)
-        request_id = int(request_id_str)
-    except Exception:
-        await callback.answer("Некорректная задача.", show_alert=True)
-        return
+    request_id = callback_args.request_id
 
     await callback.answer()
 
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            resp = await client.post(f"{BACKEND_URL}/slots/search/{request_id}/cancel")
-            resp.raise_for_status()
+        await backend.cancel_slot_search_request(request_id)
     except Exception as e:
-        print(f"Error calling /slots/search/{request_id}/cancel:", e)
+        logger.error("Error calling /slots/search/%s/cancel: %s", request_id, e)
         msg_err = await callback.message.answer(
             "Не удалось отменить поиск. Попробуй позже.",
             reply_markup=InlineKeyboardMarkup(
@@ -2498,18 +2685,8 @@ async def autobook_menu_create_callback(callback: CallbackQuery, state: FSMConte
     wait_msg = await callback.message.answer("Загружаем ваши аккаунты, подождите..")
     await add_ui_message(state, wait_msg.message_id)
 
-    try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            resp_user = await client.get(
-                f"{BACKEND_URL}/users/get-id",
-                params={"telegram_id": telegram_id},
-            )
-            resp_user.raise_for_status()
-            user_id = resp_user.json().get("user_id")
-            if user_id is None:
-                raise ValueError("user_id is missing in /users/get-id response")
-    except Exception as e:
-        print("Error calling /users/get-id:", e)
+    user_id = await _get_user_id(telegram_id)
+    if user_id is None:
         await wait_msg.edit_text(
             "Не удалось получить данные пользователя. Попробуй позже.",
             reply_markup=InlineKeyboardMarkup(
@@ -2525,19 +2702,9 @@ async def _autobook_render_accounts(
     message_obj: Message, state: FSMContext, user_id: int, page: int = 1
 ) -> None:
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            resp = await client.get(
-                f"{BACKEND_URL}/wb/accounts",
-                params={
-                    "user_id": user_id,
-                    "page": page,
-                    "per_page": AUTBOOK_ACCOUNTS_PAGE_SIZE,
-                },
-            )
-            resp.raise_for_status()
-            accounts_resp = resp.json() or {}
+        accounts_resp = await backend.wb_accounts(user_id, page, AUTBOOK_ACCOUNTS_PAGE_SIZE)
     except Exception as e:
-        print("Error calling /wb/accounts:", e)
+        logger.error("Error calling /wb/accounts: %s", e)
         await message_obj.edit_text(
             "Не удалось загрузить аккаунты. Попробуй позже.",
             reply_markup=InlineKeyboardMarkup(
@@ -2603,20 +2770,20 @@ async def _autobook_render_accounts(
         acc_name = acc.get("name") or str(acc_id)
         text_lines.append(f"• {acc_name}")
         kb_rows.append(
-            [InlineKeyboardButton(text=acc_name, callback_data=f"autobook_new_account:{acc_id}")]
+            [InlineKeyboardButton(text=acc_name, callback_data=codec.pack(AutobookNewAccount(acc_id)))]
         )
 
     nav_buttons = []
     if page_num > 1:
         nav_buttons.append(
             InlineKeyboardButton(
-                text="◀️ Назад", callback_data=f"autobook_accounts_page:{page_num - 1}"
+                text="◀️ Назад", callback_data=codec.pack(AutobookAccountsPage(page_num - 1))
             )
         )
     if page_num < total_pages:
         nav_buttons.append(
             InlineKeyboardButton(
-                text="Вперед ▶️", callback_data=f"autobook_accounts_page:{page_num + 1}"
+                text="Вперед ▶️", callback_data=codec.pack(AutobookAccountsPage(page_num + 1))
             )
         )
     if nav_buttons:
@@ -2652,16 +2819,8 @@ async def on_autobook_new_refresh(callback: CallbackQuery, state: FSMContext) ->
         page = 1
 
     if user_id is None:
-        try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                resp_user = await client.get(
-                    f"{BACKEND_URL}/users/get-id",
-                    params={"telegram_id": callback.from_user.id},
-                )
-                resp_user.raise_for_status()
-                user_id = resp_user.json().get("user_id")
-        except Exception as e:
-            print("Error calling /users/get-id on refresh:", e)
+        user_id = await _get_user_id(callback.from_user.id)
+        if user_id is None:
             await callback.answer("Не удалось обновить аккаунты.", show_alert=True)
             return
 
@@ -2669,16 +2828,9 @@ async def on_autobook_new_refresh(callback: CallbackQuery, state: FSMContext) ->
     await callback.message.edit_text("Обновляем список аккаунтов...")
 
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            resp_sync = await client.post(
-                f"{BACKEND_URL}/wb/accounts/sync",
-                params={"user_id": user_id},
-                headers={"accept": "application/json"},
-                data="",
-            )
-            resp_sync.raise_for_status()
+        await backend.sync_wb_accounts(user_id)
     except Exception as e:
-        print("Error calling /wb/accounts/sync on refresh:", e)
+        logger.error("Error calling /wb/accounts/sync on refresh: %s", e)
         await callback.message.edit_text(
             "Не удалось обновить аккаунты. Попробуй позже.",
             reply_markup=InlineKeyboardMarkup(
@@ -2690,28 +2842,17 @@ async def on_autobook_new_refresh(callback: CallbackQuery, state: FSMContext) ->
     await _autobook_render_accounts(callback.message, state, user_id, page=page)
 
 
-async def on_autobook_accounts_page(callback: CallbackQuery, state: FSMContext) -> None:
-    data_cb = callback.data or ""
-    try:
-        _, page_raw = data_cb.split(":", 1)
-        page = int(page_raw)
-    except Exception:
-        await callback.answer("Некорректная страница.", show_alert=True)
-        return
+async def on_autobook_accounts_page(
+    callback: CallbackQuery, state: FSMContext, callback_args: AutobookAccountsPage
+) -> None:
+    page = callback_args.page
 
     data = await state.get_data()
     user_id = data.get("autobook_user_id")
 
     if user_id is None:
-        try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                resp_user = await client.get(
-                    f"{BACKEND_URL}/users/get-id",
-                    params={"telegram_id": callback.from_user.id},
-                )
-                resp_user.raise_for_status()
-                user_id = resp_user.json().get("user_id")
-        except Exception:
+        user_id = await _get_user_id(callback.from_user.id)
+        if user_id is None:
             await callback.answer("Не удалось получить пользователя.", show_alert=True)
             return
 
@@ -2777,7 +2918,7 @@ async def _autobook_send_drafts(message_obj: Message, state: FSMContext) -> None
             [
                 InlineKeyboardButton(
                     text=f"#{draft_id} — {created} ({good_qty} шт.)",
-                    callback_data=f"autobook_new_draft:{draft_id}",
+                    callback_data=codec.pack(AutobookNewDraft(draft_id)),
                 )
             ]
         )
@@ -2786,13 +2927,13 @@ async def _autobook_send_drafts(message_obj: Message, state: FSMContext) -> None
     if page_num > 1:
         nav_buttons.append(
             InlineKeyboardButton(
-                text="◀️ Назад", callback_data=f"autobook_drafts_page:{page_num - 1}"
+                text="◀️ Назад", callback_data=codec.pack(AutobookDraftsPage(page_num - 1))
             )
         )
     if total_pages and page_num < total_pages:
         nav_buttons.append(
             InlineKeyboardButton(
-                text="Вперед ▶️", callback_data=f"autobook_drafts_page:{page_num + 1}"
+                text="Вперед ▶️", callback_data=codec.pack(AutobookDraftsPage(page_num + 1))
             )
         )
     if nav_buttons:
@@ -2862,9 +3003,9 @@ async def _autobook_show_source_choice(message_obj: Message, state: FSMContext)
 
 async def _autobook_render_warehouse_page(message_obj: Message, state: FSMContext) -> None:
     data = await state.get_data()
-    items = data.get("autobook_wh_items") or []
-    page = data.get("autobook_wh_page", 0)
-    pages = data.get("autobook_wh_pages", 1)
+    items, page, pages = warehouse_catalog.page(
+        data.get("autobook_wh_page", 0), WAREHOUSES_PAGE_SIZE
+    )
     selected_ids = set(data.get("autobook_selected_warehouses") or [])
 
     rows = []
@@ -2875,15 +3016,15 @@ async def _autobook_render_warehouse_page(message_obj: Message, state: FSMContex
         rows.append([
             InlineKeyboardButton(
                 text=f"{prefix}{wh_name}",
-                callback_data=f"autobook_wh_id:{wh_id}",
+                callback_data=codec.pack(AutobookWarehouse(wh_id)),
             )
         ])
 
     nav = []
     if page > 0:
-        nav.append(InlineKeyboardButton(text="◀️", callback_data=f"autobook_wh_page:{page-1}"))
+        nav.append(InlineKeyboardButton(text="◀️", callback_data=codec.pack(AutobookWarehousePage(page - 1))))
     if page < pages - 1:
-        nav.append(InlineKeyboardButton(text="▶️", callback_data=f"autobook_wh_page:{page+1}"))
+        nav.append(InlineKeyboardButton(text="▶️", callback_data=codec.pack(AutobookWarehousePage(page + 1))))
     if nav:
         rows.append(nav)
 
@@ -2903,21 +3044,15 @@ async def _autobook_render_warehouse_page(message_obj: Message, state: FSMContex
 
 async def _autobook_load_warehouses(message_obj: Message, state: FSMContext) -> None:
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            resp = await client.get(f"{BACKEND_URL}/warehouses", params={"page": 0, "limit": 10})
-            resp.raise_for_status()
-            data = resp.json()
+        await warehouse_catalog.ensure_loaded()
     except Exception as e:
-        print("Error GET /warehouses for autobook:", e)
+        logger.error("Error GET /warehouses for autobook: %s", e)
         msg = await message_obj.answer("Не удалось загрузить список складов.")
         await add_ui_message(state, msg.message_id)
         return
 
     await state.update_data(
-        autobook_wh_items=data.get("items"),
-        autobook_wh_page=data.get("page"),
-        autobook_wh_pages=data.get("pages"),
-        autobook_wh_map={w.get("id"): w.get("name") for w in data.get("items", [])},
+        autobook_wh_page=0,
         autobook_selected_warehouses=set(),
         warehouses=[],
     )
@@ -2926,81 +3061,38 @@ async def _autobook_load_warehouses(message_obj: Message, state: FSMContext) ->
 
 
 async def _fetch_slot_search_history(user_id: int, page: int) -> dict:
-    async with httpx.AsyncClient(timeout=15.0) as client:
-        resp = await client.get(
-            f"{BACKEND_URL}/requests/history",
-            params={
-                "user_id": user_id,
-                "req_type": "slot_search",
-                "page": page,
-                "page_size": HISTORY_PAGE_SIZE,
-            },
-        )
-        resp.raise_for_status()
-        return resp.json() or {}
+    return await backend.requests_history(user_id, "slot_search", page, HISTORY_PAGE_SIZE)
 
 
 async def _fetch_overview_page(user_id: int, account_id: int, page: int) -> dict:
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        resp = await client.get(
-            f"{BACKEND_URL}/wb/overview",
-            params={
-                "user_id": user_id,
-                "seller_account_id": account_id,
-                "page": page,
-                "per_page": OVERVIEW_PAGE_SIZE,
-            },
-        )
-        resp.raise_for_status()
-        return resp.json() or {}
+    return await backend.wb_overview(user_id, account_id, page, OVERVIEW_PAGE_SIZE)
 
 
-async def on_autobook_wh_page(callback: CallbackQuery, state: FSMContext) -> None:
-    data_cb = callback.data or ""
-    try:
-        _, page_raw = data_cb.split(":", 1)
-        page = int(page_raw)
-    except Exception:
-        await callback.answer("Некорректная страница.", show_alert=True)
-        return
+async def on_autobook_wh_page(
+    callback: CallbackQuery, state: FSMContext, callback_args: AutobookWarehousePage
+) -> None:
+    page = callback_args.page
 
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            resp = await client.get(
-                f"{BACKEND_URL}/warehouses", params={"page": page, "limit": 10}
-            )
-            resp.raise_for_status()
-            data = resp.json()
+        await warehouse_catalog.ensure_loaded()
     except Exception as e:
-        print("Error paging /warehouses for autobook:", e)
+        logger.error("Error paging /warehouses for autobook: %s", e)
         await callback.answer("Не удалось обновить список складов.", show_alert=True)
         return
 
-    await state.update_data(
-        autobook_wh_items=data.get("items"),
-        autobook_wh_page=data.get("page", page),
-        autobook_wh_pages=data.get("pages", 1),
-        autobook_wh_map={w.get("id"): w.get("name") for w in data.get("items", [])},
-    )
+    await state.update_data(autobook_wh_page=page)
 
     await callback.answer()
     await _autobook_render_warehouse_page(callback.message, state)
 
 
-async def on_autobook_warehouse(callback: CallbackQuery, state: FSMContext) -> None:
+async def on_autobook_warehouse(
+    callback: CallbackQuery, state: FSMContext, callback_args: AutobookWarehouse
+) -> None:
     telegram_id = callback.from_user.id
 
-    try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            resp = await client.get(
-                f"{BACKEND_URL}/wb/auth/status",
-                params={"telegram_id": telegram_id},
-            )
-            resp.raise_for_status()
-            payload = resp.json()
-            authorized = bool(payload.get("authorized"))
-    except Exception as e:
-        print("Error checking WB auth for autobook:", e)
+    authorized = await _fetch_wb_auth_status(telegram_id)
+    if authorized is None:
         await callback.message.answer("Не удалось проверить авторизацию WB. Попробуй позже.")
         await callback.answer()
         return
@@ -3012,18 +3104,17 @@ async def on_autobook_warehouse(callback: CallbackQuery, state: FSMContext) -> N
         await callback.answer()
         return
 
-    await callback.answer()
     try:
-        _, wh_id_str = callback.data.split(":", 1)
-        wh_id = int(wh_id_str)
-    except Exception:
-        await callback.message.answer("Ошибка: неверный ID склада.")
+        await warehouse_catalog.ensure_loaded()
+    except Exception as e:
+        logger.error("Error loading /warehouses for autobook: %s", e)
+        await callback.answer("Не удалось обновить список складов.", show_alert=True)
         return
 
+    await callback.answer()
+    wh_id = callback_args.warehouse_id
     data = await state.get_data()
-    name_map = data.get("autobook_wh_map", {})
-
-    warehouse_name = name_map.get(wh_id)
+    warehouse_name = warehouse_catalog.name(wh_id)
     if not warehouse_name:
         await callback.message.answer("Ошибка: склад не найден. Попробуй снова.")
         return
@@ -3065,12 +3156,20 @@ async def _autobook_show_supply_step(message_obj: Message, state: FSMContext) ->
 
 
 async def on_autobook_wh_done(callback: CallbackQuery, state: FSMContext) -> None:
+    try:
+        await warehouse_catalog.ensure_loaded()
+    except Exception as e:
+        logger.error("Error loading /warehouses for autobook: %s", e)
+        await callback.answer("Не удалось обновить список складов.", show_alert=True)
+        return
+
     await callback.answer()
 
     data = await state.get_data()
     selected_ids = set(data.get("autobook_selected_warehouses") or [])
-    name_map = data.get("autobook_wh_map", {})
-    selected_names = sorted(name_map.get(wid) for wid in selected_ids if name_map.get(wid))
+    selected_names = sorted(
+        warehouse_catalog.name(wid) for wid in selected_ids if warehouse_catalog.name(wid)
+    )
 
     if not selected_names:
         await callback.message.answer("Выбери хотя бы один склад.")
@@ -3517,20 +3616,16 @@ async def on_autobook_week(callback: CallbackQuery, state: FSMContext) -> None:
 
         if supply_type_backend and warehouses_selected:
             try:
-                async with httpx.AsyncClient(timeout=10.0) as client:
-                    availability_payload = {
-                        "supply_type": supply_type_backend,
-                        "warehouses": warehouses_selected,
-                    }
-                    print("Debug /warehouses/availability payload:", availability_payload)
-                    resp = await client.post(
-                        f"{BACKEND_URL}/warehouses/availability",
-                        json=availability_payload,
-                    )
-                    resp.raise_for_status()
-                    availability_resp = resp.json() or {}
-                    available_warehouses = availability_resp.get("available") or warehouses_selected
-                    unavailable = availability_resp.get("unavailable") or []
+                availability_payload = {
+                    "supply_type": supply_type_backend,
+                    "warehouses": warehouses_selected,
+                }
+                logger.debug("/warehouses/availability payload", extra={"payload": availability_payload})
+                availability_resp = await backend.warehouses_availability(
+                    supply_type_backend, warehouses_selected
+                )
+                available_warehouses = availability_resp.get("available") or warehouses_selected
+                unavailable = availability_resp.get("unavailable") or []
             except Exception as e:
                 _log_http_error("Error calling /warehouses/availability", e)
 
@@ -3551,6 +3646,7 @@ async def on_autobook_week(callback: CallbackQuery, state: FSMContext) -> None:
 
         await state.update_data(
             autobook_new_payload=payload,
+            autobook_job_key=uuid.uuid4().hex,
             autobook_availability={
                 "available": available_warehouses,
                 "unavailable": unavailable,
@@ -3582,14 +3678,10 @@ async def on_autobook_week(callback: CallbackQuery, state: FSMContext) -> None:
     await callback.message.edit_reply_markup(reply_markup=kb)
 
 
-async def on_autobook_new_account(callback: CallbackQuery, state: FSMContext) -> None:
-    data_cb = callback.data or ""
-    try:
-        _, account_id = data_cb.split(":", 1)
-        account_id = int(account_id)
-    except Exception:
-        await callback.answer("Некорректный продавец.", show_alert=True)
-        return
+async def on_autobook_new_account(
+    callback: CallbackQuery, state: FSMContext, callback_args: AutobookNewAccount
+) -> None:
+    account_id = callback_args.account_id
 
     data = await state.get_data()
     accounts = data.get("autobook_accounts") or []
@@ -3601,15 +3693,8 @@ async def on_autobook_new_account(callback: CallbackQuery, state: FSMContext) ->
         return
 
     if user_id is None:
-        try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                resp_user = await client.get(
-                    f"{BACKEND_URL}/users/get-id",
-                    params={"telegram_id": callback.from_user.id},
-                )
-                resp_user.raise_for_status()
-                user_id = resp_user.json().get("user_id")
-        except Exception:
+        user_id = await _get_user_id(callback.from_user.id)
+        if user_id is None:
             await callback.answer("Не удалось обновить пользователя.", show_alert=True)
             return
 
@@ -3617,7 +3702,7 @@ async def on_autobook_new_account(callback: CallbackQuery, state: FSMContext) ->
     try:
         await callback.answer()
     except Exception as e:
-        print("Failed to answer callback in on_autobook_new_account:", e)
+        logger.warning("Failed to answer callback in on_autobook_new_account: %s", e)
 
     try:
         await callback.message.edit_text("Загружаем ваши черновики, подождите..")
@@ -3641,7 +3726,7 @@ async def on_autobook_new_account(callback: CallbackQuery, state: FSMContext) ->
             page=1,
         )
     except Exception as e:
-        print("Error calling /wb/overview:", e)
+        logger.error("Error calling /wb/overview: %s", e)
         await callback.message.edit_text(
             "Не удалось загрузить данные для аккаунта. Попробуй позже.",
             reply_markup=InlineKeyboardMarkup(
@@ -3668,14 +3753,10 @@ async def on_autobook_new_account(callback: CallbackQuery, state: FSMContext) ->
     await _autobook_send_drafts(callback.message, state)
 
 
-async def on_autobook_drafts_page(callback: CallbackQuery, state: FSMContext) -> None:
-    data_cb = callback.data or ""
-    try:
-        _, page_raw = data_cb.split(":", 1)
-        page = int(page_raw)
-    except Exception:
-        await callback.answer("Некорректная страница.", show_alert=True)
-        return
+async def on_autobook_drafts_page(
+    callback: CallbackQuery, state: FSMContext, callback_args: AutobookDraftsPage
+) -> None:
+    page = callback_args.page
 
     data = await state.get_data()
     account = data.get("autobook_account") or {}
@@ -3690,7 +3771,7 @@ async def on_autobook_drafts_page(callback: CallbackQuery, state: FSMContext) ->
     try:
         await callback.answer()
     except Exception as e:
-        print("Failed to answer callback in on_autobook_drafts_page:", e)
+        logger.warning("Failed to answer callback in on_autobook_drafts_page: %s", e)
 
     try:
         await callback.message.edit_text("Загружаем список складов, подождите..")
@@ -3712,7 +3793,7 @@ async def on_autobook_drafts_page(callback: CallbackQuery, state: FSMContext) ->
             user_id=user_id, account_id=account_id, page=page
         )
     except Exception as e:
-        print("Error calling /wb/overview:", e)
+        logger.error("Error calling /wb/overview: %s", e)
         await callback.message.edit_text(
             "Не удалось загрузить данные для аккаунта. Попробуй позже.",
             reply_markup=InlineKeyboardMarkup(
@@ -3772,17 +3853,17 @@ async def _autobook_render_requests(message_obj: Message, state: FSMContext) ->
         period_text = f"{period.get('from')} – {period.get('to')}"
         lines.append(f"• #{req_id}: {warehouse}, {supply}, {period_text}")
         kb_rows.append(
-            [InlineKeyboardButton(text=f"#{req_id} — {warehouse}", callback_data=f"autobook_new_request:{req_id}")]
+            [InlineKeyboardButton(text=f"#{req_id} — {warehouse}", callback_data=codec.pack(AutobookNewRequest(req_id)))]
         )
 
     nav_buttons = []
     if page_num > 1:
         nav_buttons.append(
-            InlineKeyboardButton(text="◀️ Назад", callback_data=f"autobook_requests_page:{page_num - 1}")
+            InlineKeyboardButton(text="◀️ Назад", callback_data=codec.pack(AutobookRequestsPage(page_num - 1)))
         )
     if total_pages and page_num < total_pages:
         nav_buttons.append(
-            InlineKeyboardButton(text="Вперед ▶️", callback_data=f"autobook_requests_page:{page_num + 1}")
+            InlineKeyboardButton(text="Вперед ▶️", callback_data=codec.pack(AutobookRequestsPage(page_num + 1)))
         )
     if nav_buttons:
         kb_rows.append(nav_buttons)
@@ -3812,22 +3893,15 @@ async def _autobook_load_requests(message_obj: Message, state: FSMContext, page:
     user_id = data.get("autobook_user_id")
 
     if user_id is None:
-        try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                resp_user = await client.get(
-                    f"{BACKEND_URL}/users/get-id",
-                    params={"telegram_id": message_obj.chat.id},
-                )
-                resp_user.raise_for_status()
-                user_id = resp_user.json().get("user_id")
-        except Exception:
+        user_id = await _get_user_id(message_obj.chat.id)
+        if user_id is None:
             await message_obj.answer("Не удалось получить пользователя.")
             return
 
     try:
         history = await _fetch_slot_search_history(user_id, page)
     except Exception as e:
-        print("Error fetching slot search history:", e)
+        logger.error("Error fetching slot search history: %s", e)
         await message_obj.answer("Не удалось загрузить поиски слотов. Попробуй позже.")
         return
 
@@ -3860,14 +3934,10 @@ async def _autobook_load_requests(message_obj: Message, state: FSMContext, page:
     await _autobook_render_requests(message_obj, state)
 
 
-async def on_autobook_new_draft(callback: CallbackQuery, state: FSMContext) -> None:
-    data_cb = callback.data or ""
-    try:
-        _, draft_id = data_cb.split(":", 1)
-        draft_id_int = int(draft_id)
-    except Exception:
-        await callback.answer("Некорректный черновик.", show_alert=True)
-        return
+async def on_autobook_new_draft(
+    callback: CallbackQuery, state: FSMContext, callback_args: AutobookNewDraft
+) -> None:
+    draft_id_int = callback_args.draft_id
 
     data = await state.get_data()
     drafts = data.get("autobook_drafts") or []
@@ -3910,27 +3980,19 @@ async def on_autobook_new_search(callback: CallbackQuery, state: FSMContext) ->
     await _autobook_load_requests(loading_msg, state, page)
 
 
-async def on_autobook_requests_page(callback: CallbackQuery, state: FSMContext) -> None:
-    data_cb = callback.data or ""
-    try:
-        _, page_raw = data_cb.split(":", 1)
-        page = int(page_raw)
-    except Exception:
-        await callback.answer("Некорректная страница.", show_alert=True)
-        return
+async def on_autobook_requests_page(
+    callback: CallbackQuery, state: FSMContext, callback_args: AutobookRequestsPage
+) -> None:
+    page = callback_args.page
 
     await callback.answer()
     await _autobook_load_requests(callback.message, state, page)
 
 
-async def on_autobook_new_request(callback: CallbackQuery, state: FSMContext) -> None:
-    data_cb = callback.data or ""
-    try:
-        _, req_id = data_cb.split(":", 1)
-        req_id_int = int(req_id)
-    except Exception:
-        await callback.answer("Некорректный поиск.", show_alert=True)
-        return
+async def on_autobook_new_request(
+    callback: CallbackQuery, state: FSMContext, callback_args: AutobookNewRequest
+) -> None:
+    req_id_int = callback_args.request_id
 
     data = await state.get_data()
     requests_list = data.get("autobook_requests") or []
@@ -4021,6 +4083,7 @@ async def on_autobook_new_request(callback: CallbackQuery, state: FSMContext) ->
     await state.update_data(
         autobook_request=selected,
         autobook_new_payload=payload,
+        autobook_job_key=uuid.uuid4().hex,
         warehouses=warehouses_list,
         supply_type=supply_type,
         max_coef=max_coef,
@@ -4095,25 +4158,56 @@ async def on_autobook_new_confirm(callback: CallbackQuery, state: FSMContext) ->
     except Exception:
         pass
 
-    status_msg = await callback.message.answer(
-        "Автобронирование в процессе, ждите!", reply_markup=get_main_menu_keyboard()
-    )
+    # один ключ на прохождение визарда: повторное нажатие не создаст вторую
+    # автобронь. Ключ ставится при открытии экрана подтверждения; если его нет
+    # (состояние из старой версии бота), заводим новый, а не ключ по
+    # содержимому — иначе такой же запрос совпал бы с давно выполненной задачей
+    job_key = data.get("autobook_job_key")
+    if not job_key:
+        job_key = uuid.uuid4().hex
+        await state.update_data(autobook_job_key=job_key)
+    try:
+        job, created = await job_queue.submit("wb_autobooking", dict(payload), key=job_key)
+    except Exception as e:
+        logger.error("Error queueing /wb/autobooking job: %s", e)
+        await _send_autobook_confirm_error(callback.message, state)
+        return
+
+    if created:
+        text = "Автобронирование в процессе, ждите!"
+    elif job.status == DONE:
+        text = "✅ Эта автобронь уже создана."
+    else:
+        text = "Эта автобронь уже создаётся, ждите!"
+    status_msg = await callback.message.answer(text, reply_markup=get_main_menu_keyboard())
     await add_ui_message(state, status_msg.message_id)
 
-    payload_to_send = dict(payload)
+    await state.clear()
 
-    async def _fire_autobooking_request(data: dict) -> None:
-        print("Debug /wb/autobooking payload:", data)
-        try:
-            async with httpx.AsyncClient(timeout=20.0) as client:
-                resp = await client.post(f"{BACKEND_URL}/wb/autobooking", json=data)
-                resp.raise_for_status()
-                print("Debug /wb/autobooking response:", resp.status_code, resp.text)
-        except Exception as e:
-            _log_http_error("Error calling /wb/autobooking", e)
 
-    asyncio.create_task(_fire_autobooking_request(payload_to_send))
-    await state.clear()
+async def _run_wb_autobooking_job(job) -> dict:
+    logger.debug("/wb/autobooking payload", extra={"payload": job.payload})
+    resp = await backend.wb_autobooking(job.payload, idempotency_key=job.key, attempt=job.attempts)
+    logger.debug("/wb/autobooking response: %s", resp.status_code, extra={"body": resp.text})
+    return {"status_code": resp.status_code}
+
+
+async def _notify_autobooking_done(bot: Bot, job) -> None:
+    with outbound_priority(PRIORITY_BULK):
+        await bot.send_message(
+            job.payload["telegram_chat_id"],
+            "✅ Автобронь создана. Как только появится подходящий слот, я забронирую его.",
+        )
+
+
+async def _notify_autobooking_failed(bot: Bot, job) -> None:
+    logger.error("Error calling /wb/autobooking (job %s): %s", job.key, job.last_error)
+    with outbound_priority(PRIORITY_BULK):
+        await bot.send_message(
+            job.payload["telegram_chat_id"],
+            "❌ Не удалось создать автобронь. Попробуй ещё раз через меню «Автобронь».",
+            reply_markup=get_main_menu_keyboard(),
+        )
 
 
 async def on_autobook_new_retry(callback: CallbackQuery, state: FSMContext) -> None:
@@ -4177,69 +4271,43 @@ async def menu_moves_callback(callback: CallbackQuery, state: FSMContext) -> Non
     await show_moves_list(callback.message, state, telegram_id, page=1)
 
 
-async def moves_page_callback(callback: CallbackQuery, state: FSMContext) -> None:
-    data_cb = callback.data or ""
-    try:
-        _, page_str = data_cb.split(":", 1)
-        page = int(page_str)
-    except Exception:
-        await callback.answer("Некорректная страница.", show_alert=True)
-        return
+async def moves_page_callback(
+    callback: CallbackQuery, state: FSMContext, callback_args: MovesPage
+) -> None:
+    page = callback_args.page
     await callback.answer()
     await show_moves_list(callback.message, state, callback.from_user.id, page=page)
 
 
-async def moves_open_callback(callback: CallbackQuery, state: FSMContext) -> None:
-    data_cb = callback.data or ""
-    try:
-        _, task_id_str = data_cb.split(":", 1)
-        task_id = int(task_id_str)
-    except Exception:
-        await callback.answer("Некорректный ID задачи.", show_alert=True)
-        return
+async def moves_open_callback(
+    callback: CallbackQuery, state: FSMContext, callback_args: MovesOpen
+) -> None:
+    task_id = callback_args.task_id
     await callback.answer()
     await show_move_card(callback.message, state, callback.from_user.id, task_id)
 
 
-async def moves_stop_callback(callback: CallbackQuery, state: FSMContext) -> None:
-    data_cb = callback.data or ""
-    try:
-        _, task_id_str = data_cb.split(":", 1)
-        task_id = int(task_id_str)
-    except Exception:
-        await callback.answer("Некорректный ID задачи.", show_alert=True)
-        return
+async def moves_stop_callback(
+    callback: CallbackQuery, state: FSMContext, callback_args: MovesStop
+) -> None:
+    task_id = callback_args.task_id
     await callback.answer()
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            resp = await client.post(
-                f"{BACKEND_URL}/stock-move/cancel",
-                json={"telegram_id": callback.from_user.id, "task_id": task_id},
-            )
-            resp.raise_for_status()
+        await backend.stock_move_cancel(callback.from_user.id, task_id)
     except Exception as e:
-        print("Error /stock-move/cancel:", e)
+        logger.error("Error /stock-move/cancel: %s", e)
     await show_move_card(callback.message, state, callback.from_user.id, task_id)
 
 
-async def moves_start_callback(callback: CallbackQuery, state: FSMContext) -> None:
-    data_cb = callback.data or ""
-    try:
-        _, task_id_str = data_cb.split(":", 1)
-        task_id = int(task_id_str)
-    except Exception:
-        await callback.answer("Некорректный ID задачи.", show_alert=True)
-        return
+async def moves_start_callback(
+    callback: CallbackQuery, state: FSMContext, callback_args: MovesStart
+) -> None:
+    task_id = callback_args.task_id
     await callback.answer()
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            resp = await client.post(
-                f"{BACKEND_URL}/stock-move/restart",
-                json={"telegram_id": callback.from_user.id, "task_id": task_id},
-            )
-            resp.raise_for_status()
+        await backend.stock_move_restart(callback.from_user.id, task_id)
     except Exception as e:
-        print("Error /stock-move/restart:", e)
+        logger.error("Error /stock-move/restart: %s", e)
     await show_move_card(callback.message, state, callback.from_user.id, task_id)
 
 
@@ -4253,14 +4321,9 @@ async def moves_create_callback(callback: CallbackQuery, state: FSMContext) -> N
     await start_move_wizard(callback.message, state, telegram_id)
 
 
-async def moves_choose_qty(callback: CallbackQuery, state: FSMContext) -> None:
+async def moves_choose_qty(callback: CallbackQuery, state: FSMContext, callback_args: MovesQty) -> None:
     await callback.answer()
-    try:
-        _, qty_str = (callback.data or "").split(":", 1)
-        qty = int(qty_str)
-    except Exception:
-        await callback.answer("Некорректное количество.", show_alert=True)
-        return
+    qty = callback_args.qty
     data = await state.get_data()
     article_id = data.get("article_id")
     from_warehouse = data.get("from_warehouse")
@@ -4307,21 +4370,17 @@ async def moves_confirm_callback(callback: CallbackQuery, state: FSMContext) ->
     await clear_all_ui(callback.message, state)
 
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            resp = await client.post(
-                f"{BACKEND_URL}/stock-move/create",
-                json={
-                    "telegram_id": telegram_id,
-                    "article": article_id,
-                    "from_warehouse": from_warehouse,
-                    "to_warehouse": to_warehouse,
-                    "qty": qty,
-                },
-            )
-            resp.raise_for_status()
-            result = resp.json()
+        result = await backend.stock_move_create(
+            {
+                "telegram_id": telegram_id,
+                "article": article_id,
+                "from_warehouse": from_warehouse,
+                "to_warehouse": to_warehouse,
+                "qty": qty,
+            }
+        )
     except Exception as e:
-        print("Error /stock-move/create:", e)
+        logger.error("Error /stock-move/create: %s", e)
         msg = await callback.message.answer("Не удалось создать задачу перераспределения. Попробуй позже.")
         await add_ui_message(state, msg.message_id)
         await state.clear()
@@ -4359,18 +4418,20 @@ async def moves_back_articles(callback: CallbackQuery, state: FSMContext) -> Non
     await show_move_articles(callback.message, state)
 
 
-async def moves_choose_account(callback: CallbackQuery, state: FSMContext) -> None:
+async def moves_choose_account(
+    callback: CallbackQuery, state: FSMContext, callback_args: MovesAccount
+) -> None:
     await callback.answer()
-    account_id = callback.data.split(":", 1)[1]
-    await state.update_data(account_id=account_id)
+    await state.update_data(account_id=callback_args.account_id)
     await state.set_state(MoveWizardState.choose_article)
     await show_move_articles(callback.message, state)
 
 
-async def moves_choose_article(callback: CallbackQuery, state: FSMContext) -> None:
+async def moves_choose_article(
+    callback: CallbackQuery, state: FSMContext, callback_args: MovesArticle
+) -> None:
     await callback.answer()
-    article_id = callback.data.split(":", 1)[1]
-    await state.update_data(article_id=article_id)
+    await state.update_data(article_id=callback_args.article_id)
     await state.set_state(MoveWizardState.choose_from_warehouse)
     await show_move_from_warehouses(callback.message, state)
 
@@ -4387,18 +4448,26 @@ async def moves_back_article(callback: CallbackQuery, state: FSMContext) -> None
     await show_move_articles(callback.message, state)
 
 
-async def moves_choose_from(callback: CallbackQuery, state: FSMContext) -> None:
+async def moves_choose_from(callback: CallbackQuery, state: FSMContext, callback_args: MovesFrom) -> None:
+    data = await state.get_data()
+    stocks = _move_article_stocks(data)
+    if not 0 <= callback_args.index < len(stocks):
+        await callback.answer("Склад не найден, выбери заново.", show_alert=True)
+        return
     await callback.answer()
-    from_wh = callback.data.split(":", 1)[1]
-    await state.update_data(from_warehouse=from_wh)
+    await state.update_data(from_warehouse=stocks[callback_args.index].get("warehouse"))
     await state.set_state(MoveWizardState.choose_to_warehouse)
     await show_move_to_warehouses(callback.message, state)
 
 
-async def moves_choose_to(callback: CallbackQuery, state: FSMContext) -> None:
+async def moves_choose_to(callback: CallbackQuery, state: FSMContext, callback_args: MovesTo) -> None:
+    data = await state.get_data()
+    warehouses = (data.get("move_options") or {}).get("warehouses") or []
+    if not 0 <= callback_args.index < len(warehouses):
+        await callback.answer("Склад не найден, выбери заново.", show_alert=True)
+        return
     await callback.answer()
-    to_wh = callback.data.split(":", 1)[1]
-    await state.update_data(to_warehouse=to_wh)
+    await state.update_data(to_warehouse=warehouses[callback_args.index].get("name"))
     await state.set_state(MoveWizardState.choose_qty)
     await show_move_qty(callback.message, state)
 async def menu_logout_callback(callback: CallbackQuery, state: FSMContext) -> None:
@@ -4416,6 +4485,31 @@ async def menu_main_callback(callback: CallbackQuery, state: FSMContext) -> None
     await send_main_menu(callback.message, state)
 
 
+async def on_invalid_callback(callback: CallbackQuery, state: FSMContext) -> None:
+    """
+    Кнопка, которую роутер не смог разобрать: старая версия формата или
+    испорченная callback_data.
+    """
+    await callback.answer("Кнопка устарела. Открой меню заново.", show_alert=True)
+
+
+async def on_backend_busy(event: Message | CallbackQuery, data: dict) -> None:
+    """
+    Экран «сервис занят»: вызов backend-а сброшен AdmissionController-ом,
+    пользователь узнаёт об этом сразу, а не после таймаута.
+    """
+    message = event.message if isinstance(event, CallbackQuery) else event
+    if message is None:
+        return
+    msg = await message.answer(
+        "⏳ Сервис сейчас перегружен. Попробуй ещё раз через минуту.",
+        reply_markup=get_main_menu_keyboard(),
+    )
+    state = data.get("state")
+    if state is not None:
+        await add_ui_message(state, msg.message_id)
+
+
 async def wb_auth_command_handler(message: Message, state: FSMContext) -> None:
     """
     Команда /wb_auth запускает новый мастер авторизации WB.
@@ -4442,15 +4536,9 @@ async def cmd_cancel_search(message: Message, command: CommandObject, state: FSM
     telegram_id = message.from_user.id
 
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            resp = await client.post(
-                f"{BACKEND_URL}/slot-search/cancel",
-                json={"telegram_id": telegram_id, "task_id": task_id},
-            )
-            resp.raise_for_status()
-            data = resp.json()
+        data = await backend.slot_search_cancel(telegram_id, task_id)
     except Exception as e:
-        print("Error calling /slot-search/cancel:", e)
+        logger.error("Error calling /slot-search/cancel: %s", e)
         await message.answer("Не удалось отменить задачу. Проверь ID и попробуй ещё раз.")
         return
 
@@ -4476,15 +4564,9 @@ async def cmd_restart_search(message: Message, command: CommandObject, state: FS
     telegram_id = message.from_user.id
 
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            resp = await client.post(
-                f"{BACKEND_URL}/slot-search/restart",
-                json={"telegram_id": telegram_id, "task_id": task_id},
-            )
-            resp.raise_for_status()
-            data = resp.json()
+        data = await backend.slot_search_restart(telegram_id, task_id)
     except Exception as e:
-        print("Error calling /slot-search/restart:", e)
+        logger.error("Error calling /slot-search/restart: %s", e)
         await message.answer("Не удалось запустить задачу заново. Проверь ID и попробуй ещё раз.")
         return
 
@@ -4492,27 +4574,17 @@ async def cmd_restart_search(message: Message, command: CommandObject, state: FS
     await message.answer(f"Задача #{task_id} теперь в статусе: {status}.")
 
 
-async def on_slot_cancel_callback(callback: CallbackQuery, state: FSMContext) -> None:
-    data = callback.data or ""
-    try:
-        _, task_id_str = data.split(":", 1)
-        task_id = int(task_id_str)
-    except Exception:
-        await callback.answer("Некорректный формат ID.", show_alert=True)
-        return
+async def on_slot_cancel_callback(
+    callback: CallbackQuery, state: FSMContext, callback_args: SlotCancel
+) -> None:
+    task_id = callback_args.task_id
 
     telegram_id = callback.from_user.id
 
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            resp = await client.post(
-                f"{BACKEND_URL}/slot-search/cancel",
-                json={"telegram_id": telegram_id, "task_id": task_id},
-            )
-            resp.raise_for_status()
-            data = resp.json()
+        data = await backend.slot_search_cancel(telegram_id, task_id)
     except Exception as e:
-        print("Error calling /slot-search/cancel (callback):", e)
+        logger.error("Error calling /slot-search/cancel (callback): %s", e)
         await callback.answer("Не удалось отменить задачу. Попробуй позже.", show_alert=True)
         return
 
@@ -4520,34 +4592,24 @@ async def on_slot_cancel_callback(callback: CallbackQuery, state: FSMContext) ->
     tasks = data_state.get("slot_tasks") or []
     for t in tasks:
         if t.get("id") == task_id:
-            t["status"] = "cancelled"
+            t["status"] = (data or {}).get("status") or "cancelled"
             break
     await state.update_data(slot_tasks=tasks)
     await _render_slot_task_card(callback.message, state, task_id)
     await callback.answer("Задача отменена.", show_alert=False)
 
 
-async def on_slot_restart_callback(callback: CallbackQuery, state: FSMContext) -> None:
-    data = callback.data or ""
-    try:
-        _, task_id_str = data.split(":", 1)
-        task_id = int(task_id_str)
-    except Exception:
-        await callback.answer("Некорректный формат ID.", show_alert=True)
-        return
+async def on_slot_restart_callback(
+    callback: CallbackQuery, state: FSMContext, callback_args: SlotRestart
+) -> None:
+    task_id = callback_args.task_id
 
     telegram_id = callback.from_user.id
 
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            resp = await client.post(
-                f"{BACKEND_URL}/slot-search/restart",
-                json={"telegram_id": telegram_id, "task_id": task_id},
-            )
-            resp.raise_for_status()
-            data = resp.json()
+        data = await backend.slot_search_restart(telegram_id, task_id)
     except Exception as e:
-        print("Error calling /slot-search/restart (callback):", e)
+        logger.error("Error calling /slot-search/restart (callback): %s", e)
         await callback.answer("Не удалось запустить задачу заново. Попробуй позже.", show_alert=True)
         return
 
@@ -4555,36 +4617,24 @@ async def on_slot_restart_callback(callback: CallbackQuery, state: FSMContext) -
     tasks = data_state.get("slot_tasks") or []
     for t in tasks:
         if t.get("id") == task_id:
-            t["status"] = "active"
+            t["status"] = (data or {}).get("status") or "active"
             break
     await state.update_data(slot_tasks=tasks)
     await _render_slot_task_card(callback.message, state, task_id)
     await callback.answer("Задача запущена.", show_alert=False)
 
 
-async def on_slot_delete(callback: CallbackQuery, state: FSMContext) -> None:
-    data_cb = callback.data or ""
-    try:
-        _, id_str = data_cb.split(":", 1)
-        task_id = int(id_str)
-    except Exception:
-        await callback.answer("Некорректный ID задачи.", show_alert=True)
-        return
+async def on_slot_delete(
+    callback: CallbackQuery, state: FSMContext, callback_args: SlotDelete
+) -> None:
+    task_id = callback_args.task_id
 
     telegram_id = callback.from_user.id
 
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            resp = await client.post(
-                f"{BACKEND_URL}/slot-search/delete",
-                json={
-                    "telegram_id": telegram_id,
-                    "slot_search_task_id": task_id,
-                },
-            )
-            resp.raise_for_status()
+        await backend.slot_search_delete(telegram_id, task_id)
     except Exception as e:
-        print("Error calling /slot-search/delete:", e)
+        logger.error("Error calling /slot-search/delete: %s", e)
         await callback.answer("Не удалось удалить задачу.", show_alert=True)
         return
 
@@ -4618,14 +4668,10 @@ async def on_autobook_task_chosen(callback: CallbackQuery, state: FSMContext) ->
     await state.clear()
 
 
-async def on_autobook_from_search(callback: CallbackQuery, state: FSMContext) -> None:
-    data = callback.data or ""
-    try:
-        _, task_id_str = data.split(":", 1)
-        slot_search_task_id = int(task_id_str)
-    except Exception:
-        await callback.answer("Некорректный ID задачи.", show_alert=True)
-        return
+async def on_autobook_from_search(
+    callback: CallbackQuery, state: FSMContext, callback_args: AutobookFromSearch
+) -> None:
+    slot_search_task_id = callback_args.task_id
 
     telegram_id = callback.from_user.id
 
@@ -4633,15 +4679,9 @@ async def on_autobook_from_search(callback: CallbackQuery, state: FSMContext) ->
     await state.update_data(autobook_message_ids=[], slot_search_task_id=slot_search_task_id)
 
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            resp = await client.post(
-                f"{BACKEND_URL}/autobook/options",
-                json={"telegram_id": telegram_id, "slot_search_task_id": slot_search_task_id},
-            )
-            resp.raise_for_status()
-            options = resp.json()
+        options = await backend.autobook_options(telegram_id, slot_search_task_id)
     except Exception as e:
-        print("Error calling /autobook/options:", e)
+        logger.error("Error calling /autobook/options: %s", e)
         await callback.answer("Не удалось получить данные для автобронирования.", show_alert=True)
         return
 
@@ -4734,7 +4774,7 @@ async def on_autobook_show_accounts(callback: CallbackQuery, state: FSMContext)
             [
                 InlineKeyboardButton(
                     text=acc_name or acc_id,
-                    callback_data=f"autobook_choose_account:{acc_id}",
+                    callback_data=codec.pack(AutobookChooseAccount(acc_id)),
                 )
             ]
         )
@@ -4746,27 +4786,17 @@ async def on_autobook_show_accounts(callback: CallbackQuery, state: FSMContext)
     await add_ui_message(state, new_msg.message_id)
 
 
-async def on_autobook_start(callback: CallbackQuery, state: FSMContext) -> None:
-    data = callback.data or ""
-    try:
-        _, task_id_str = data.split(":", 1)
-        autobook_task_id = int(task_id_str)
-    except Exception:
-        await callback.answer("Некорректный ID задачи.", show_alert=True)
-        return
+async def on_autobook_start(
+    callback: CallbackQuery, state: FSMContext, callback_args: AutobookStart
+) -> None:
+    autobook_task_id = callback_args.task_id
 
     telegram_id = callback.from_user.id
 
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            resp = await client.post(
-                f"{BACKEND_URL}/autobook/start",
-                json={"telegram_id": telegram_id, "autobook_task_id": autobook_task_id},
-            )
-            resp.raise_for_status()
-            data_json = resp.json()
+        data_json = await backend.autobook_start(telegram_id, autobook_task_id)
     except Exception as e:
-        print("Error calling /autobook/start:", e)
+        logger.error("Error calling /autobook/start: %s", e)
         await callback.answer("Не удалось запустить автобронирование.", show_alert=True)
         return
 
@@ -4782,27 +4812,17 @@ async def on_autobook_start(callback: CallbackQuery, state: FSMContext) -> None:
     await callback.answer("Запущено", show_alert=False)
 
 
-async def on_autobook_stop(callback: CallbackQuery, state: FSMContext) -> None:
-    data = callback.data or ""
-    try:
-        _, task_id_str = data.split(":", 1)
-        autobook_task_id = int(task_id_str)
-    except Exception:
-        await callback.answer("Некорректный ID задачи.", show_alert=True)
-        return
+async def on_autobook_stop(
+    callback: CallbackQuery, state: FSMContext, callback_args: AutobookStop
+) -> None:
+    autobook_task_id = callback_args.task_id
 
     telegram_id = callback.from_user.id
 
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            resp = await client.post(
-                f"{BACKEND_URL}/autobook/stop",
-                json={"telegram_id": telegram_id, "autobook_task_id": autobook_task_id},
-            )
-            resp.raise_for_status()
-            data_json = resp.json()
+        data_json = await backend.autobook_stop(telegram_id, autobook_task_id)
     except Exception as e:
-        print("Error calling /autobook/stop:", e)
+        logger.error("Error calling /autobook/stop: %s", e)
         await callback.answer("Не удалось остановить автобронирование.", show_alert=True)
         return
 
@@ -4818,14 +4838,10 @@ async def on_autobook_stop(callback: CallbackQuery, state: FSMContext) -> None:
     await callback.answer("Остановлено", show_alert=False)
 
 
-async def on_autobook_open(callback: CallbackQuery, state: FSMContext) -> None:
-    data_cb = callback.data or ""
-    try:
-        _, id_str = data_cb.split(":", 1)
-        autobook_id = int(id_str)
-    except Exception:
-        await callback.answer("Некорректный ID.", show_alert=True)
-        return
+async def on_autobook_open(
+    callback: CallbackQuery, state: FSMContext, callback_args: AutobookOpen
+) -> None:
+    autobook_id = callback_args.task_id
 
     await _render_autobook_card(callback.message, state, autobook_id)
     await callback.answer()
@@ -4843,42 +4859,26 @@ async def on_autobook_main_menu(callback: CallbackQuery, state: FSMContext) -> N
     await send_main_menu(callback.message, state)
 
 
-async def on_autobook_page(callback: CallbackQuery, state: FSMContext) -> None:
-    data_cb = callback.data or ""
-    try:
-        _, page_str = data_cb.split(":", 1)
-        page = int(page_str)
-    except Exception:
-        await callback.answer("Некорректная страница.", show_alert=True)
-        return
+async def on_autobook_page(
+    callback: CallbackQuery, state: FSMContext, callback_args: AutobookPage
+) -> None:
+    page = callback_args.page
 
     await callback.answer()
     await _send_autobook_page(callback.message, state, page=page)
 
 
-async def on_autobook_delete(callback: CallbackQuery, state: FSMContext) -> None:
-    data_cb = callback.data or ""
-    try:
-        _, id_str = data_cb.split(":", 1)
-        autobook_id = int(id_str)
-    except Exception:
-        await callback.answer("Некорректный ID задачи.", show_alert=True)
-        return
+async def on_autobook_delete(
+    callback: CallbackQuery, state: FSMContext, callback_args: AutobookDelete
+) -> None:
+    autobook_id = callback_args.task_id
 
     telegram_id = callback.from_user.id
 
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            resp = await client.post(
-                f"{BACKEND_URL}/autobook/delete",
-                json={
-                    "telegram_id": telegram_id,
-                    "autobook_task_id": autobook_id,
-                },
-            )
-            resp.raise_for_status()
+        await backend.autobook_delete(telegram_id, autobook_id)
     except Exception as e:
-        print("Error calling /autobook/delete:", e)
+        logger.error("Error calling /autobook/delete: %s", e)
         await callback.answer("Не удалось удалить задачу автобронирования.", show_alert=True)
         return
 
@@ -4910,7 +4910,7 @@ async def on_autobook_show_accounts(callback: CallbackQuery, state: FSMContext)
             [
                 InlineKeyboardButton(
                     text=acc_name or acc_id,
-                    callback_data=f"autobook_choose_account:{acc_id}",
+                    callback_data=codec.pack(AutobookChooseAccount(acc_id)),
                 )
             ]
         )
@@ -4960,7 +4960,7 @@ async def autobook_choose_account_step(message: Message, state: FSMContext) -> N
             [
                 InlineKeyboardButton(
                     text=acc_name or acc_id,
-                    callback_data=f"autobook_choose_account:{acc_id}",
+                    callback_data=codec.pack(AutobookChooseAccount(acc_id)),
                 )
             ]
         )
@@ -5015,7 +5015,7 @@ async def autobook_choose_transit_step(message: Message, state: FSMContext) -> N
             [
                 InlineKeyboardButton(
                     text=name or f"Черновик {draft_id}",
-                    callback_data=f"autobook_choose_draft:{draft_id}",
+                    callback_data=codec.pack(AutobookChooseDraft(draft_id)),
                 )
             ]
         )
@@ -5029,13 +5029,10 @@ async def autobook_choose_transit_step(message: Message, state: FSMContext) -> N
     await state.set_state(AutoBookState.choose_draft)
 
 
-async def on_autobook_choose_draft(callback: CallbackQuery, state: FSMContext) -> None:
-    data_cb = callback.data or ""
-    try:
-        _, draft_id = data_cb.split(":", 1)
-    except Exception:
-        await callback.answer("Некорректный черновик.", show_alert=True)
-        return
+async def on_autobook_choose_draft(
+    callback: CallbackQuery, state: FSMContext, callback_args: AutobookChooseDraft
+) -> None:
+    draft_id = callback_args.draft_id
 
     await clear_all_ui(callback.message, state)
     await state.update_data(draft_id=draft_id)
@@ -5111,17 +5108,12 @@ async def autobook_confirm_step(message: Message, state: FSMContext) -> None:
     return
 
 
-async def on_autobook_transit(callback: CallbackQuery, state: FSMContext) -> None:
+async def on_autobook_transit(
+    callback: CallbackQuery, state: FSMContext, callback_args: AutobookTransit
+) -> None:
     await callback.answer()
     await clear_all_ui(callback.message, state)
-    data_cb = callback.data or ""
-    try:
-        _, transit_id = data_cb.split(":", 1)
-    except Exception:
-        await send_main_menu(callback.message, state)
-        return
-
-    await state.update_data(transit_warehouse_id=transit_id)
+    await state.update_data(transit_warehouse_id=callback_args.transit_id)
 
     data = await state.get_data()
     drafts = data.get("drafts") or []
@@ -5141,7 +5133,7 @@ async def on_autobook_transit(callback: CallbackQuery, state: FSMContext) -> Non
             [
                 InlineKeyboardButton(
                     text=name or f"Черновик {draft_id}",
-                    callback_data=f"autobook_choose_draft:{draft_id}",
+                    callback_data=codec.pack(AutobookChooseDraft(draft_id)),
                 )
             ]
         )
@@ -5165,18 +5157,9 @@ async def on_autobook_confirm(callback: CallbackQuery, state: FSMContext) -> Non
     telegram_id = callback.from_user.id
 
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            resp = await client.post(
-                f"{BACKEND_URL}/autobook/create",
-                json={
-                    "telegram_id": telegram_id,
-                    "slot_search_task_id": slot_task_id,
-                    "logistics_accept_mode": "any",
-                },
-            )
-            resp.raise_for_status()
+        await backend.autobook_create(telegram_id, slot_task_id, logistics_accept_mode="any")
     except Exception as e:
-        print("Error calling /autobook/create in confirm step:", e)
+        logger.error("Error calling /autobook/create in confirm step: %s", e)
         msg_err = await callback.message.answer(
             "Не удалось создать задачу автобронирования. Попробуй позже."
         )
@@ -5189,14 +5172,10 @@ async def on_autobook_confirm(callback: CallbackQuery, state: FSMContext) -> Non
     await _do_main_menu_autobook_list(callback.message, state, callback.from_user.id)
 
 
-async def on_slot_tasks_page(callback: CallbackQuery, state: FSMContext) -> None:
-    data_cb = callback.data or ""
-    try:
-        _, page_str = data_cb.split(":", 1)
-        page = int(page_str)
-    except Exception:
-        await callback.answer("Некорректная страница.", show_alert=True)
-        return
+async def on_slot_tasks_page(
+    callback: CallbackQuery, state: FSMContext, callback_args: SlotTasksPage
+) -> None:
+    page = callback_args.page
 
     await callback.answer()
     await _send_slot_tasks_page(callback.message, state, page=page)
@@ -5209,14 +5188,10 @@ async def on_slot_tasks_main_menu(callback: CallbackQuery, state: FSMContext) ->
     await send_main_menu(callback.message, state)
 
 
-async def on_slot_task_open(callback: CallbackQuery, state: FSMContext) -> None:
-    data_cb = callback.data or ""
-    try:
-        _, id_str = data_cb.split(":", 1)
-        task_id = int(id_str)
-    except Exception:
-        await callback.answer("Некорректный ID задачи.", show_alert=True)
-        return
+async def on_slot_task_open(
+    callback: CallbackQuery, state: FSMContext, callback_args: SlotTaskOpen
+) -> None:
+    task_id = callback_args.task_id
     await callback.answer()
     await _render_slot_task_card(callback.message, state, task_id)
 
@@ -5228,18 +5203,9 @@ async def on_slot_tasks_back_to_list(callback: CallbackQuery, state: FSMContext)
     await _send_slot_tasks_page(callback.message, state, page=page)
 
 
-async def on_slot_auto(callback: CallbackQuery, state: FSMContext) -> None:
-    data_cb = callback.data or ""
-    try:
-        task_id = int(data_cb.split("_", 2)[-1])
-    except Exception:
-        await callback.answer("Некорректный ID задачи.", show_alert=True)
-        return
-
+async def on_slot_auto(callback: CallbackQuery, state: FSMContext, callback_args: SlotAuto) -> None:
     # Переиспользуем существующий поток автоброни
-    fake_data = f"autobook_from_search:{task_id}"
-    callback.data = fake_data  # перенаправляем на текущий хендлер
-    await on_autobook_from_search(callback, state)
+    await on_autobook_from_search(callback, state, AutobookFromSearch(callback_args.task_id))
 
 
 async def on_menu_slot_tasks(callback: CallbackQuery, state: FSMContext) -> None:
@@ -5343,17 +5309,12 @@ async def on_slot_back(callback: CallbackQuery, state: FSMContext) -> None:
         await state.set_state(SlotSearchState.lead_time)
 
 
-async def on_autobook_choose_account(callback: CallbackQuery, state: FSMContext) -> None:
+async def on_autobook_choose_account(
+    callback: CallbackQuery, state: FSMContext, callback_args: AutobookChooseAccount
+) -> None:
     await callback.answer()
     await clear_all_ui(callback.message, state)
-    data_cb = callback.data or ""
-    try:
-        _, account_id = data_cb.split(":", 1)
-    except Exception:
-        await send_main_menu(callback.message, state)
-        return
-
-    await state.update_data(account_id=account_id)
+    await state.update_data(account_id=callback_args.account_id)
     data = await state.get_data()
     transit_warehouses = data.get("transit_warehouses") or []
 
@@ -5374,7 +5335,7 @@ async def on_autobook_choose_account(callback: CallbackQuery, state: FSMContext)
                 [
                     InlineKeyboardButton(
                         text=name or f"Черновик {draft_id}",
-                        callback_data=f"autobook_choose_draft:{draft_id}",
+                        callback_data=codec.pack(AutobookChooseDraft(draft_id)),
                     )
                 ]
             )
@@ -5395,7 +5356,7 @@ async def on_autobook_choose_account(callback: CallbackQuery, state: FSMContext)
         name = tw.get("name")
         lines.append(f"• {name}")
         kb_rows.append(
-            [InlineKeyboardButton(text=name or tw_id, callback_data=f"autobook_transit:{tw_id}")]
+            [InlineKeyboardButton(text=name or tw_id, callback_data=codec.pack(AutobookTransit(tw_id)))]
         )
 
     kb_rows.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="autobook_show_accounts")])
@@ -5408,21 +5369,14 @@ async def on_autobook_choose_account(callback: CallbackQuery, state: FSMContext)
     await state.set_state(AutoBookState.choose_transit)
 
 
-async def on_slot_warehouse(callback: CallbackQuery, state: FSMContext) -> None:
+async def on_slot_warehouse(
+    callback: CallbackQuery, state: FSMContext, callback_args: SlotWarehouse
+) -> None:
     telegram_id = callback.from_user.id
 
     # --- проверяем авторизацию WB ---
-    try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            resp = await client.get(
-                f"{BACKEND_URL}/wb/auth/status",
-                params={"telegram_id": telegram_id},
-            )
-            resp.raise_for_status()
-            payload = resp.json()
-            authorized = bool(payload.get("authorized"))
-    except Exception as e:
-        print("Error checking WB auth:", e)
+    authorized = await _fetch_wb_auth_status(telegram_id)
+    if authorized is None:
         await callback.message.answer("Не удалось проверить авторизацию WB. Попробуй позже.")
         await callback.answer()
         return
@@ -5434,26 +5388,20 @@ async def on_slot_warehouse(callback: CallbackQuery, state: FSMContext) -> None:
         await callback.answer()
         return
 
-    await callback.answer()
-    await clear_all_ui(callback.message, state)
-
-    # ================================================================
-    # 1) ПАРСИМ CALLBACK slot_wh_id:<id>
-    # ================================================================
     try:
-        _, wh_id_str = callback.data.split(":", 1)
-        wh_id = int(wh_id_str)
-    except Exception:
-        await callback.message.answer("Ошибка: неверный ID склада.")
+        await warehouse_catalog.ensure_loaded()
+    except Exception as e:
+        logger.error("Error loading /warehouses: %s", e)
+        await callback.answer("Не удалось обновить список складов.", show_alert=True)
         return
 
+    await callback.answer()
+    await clear_all_ui(callback.message, state)
+
     # ================================================================
-    # 2) ДОСТАЁМ ИМЯ СКЛАДА ИЗ FSM
+    # 1) ДОСТАЁМ ИМЯ СКЛАДА ИЗ СПРАВОЧНИКА
     # ================================================================
-    data = await state.get_data()
-    name_map = data.get("wh_map", {})  # словарь {id: name}
-
-    warehouse_name = name_map.get(wh_id)
+    warehouse_name = warehouse_catalog.name(callback_args.warehouse_id)
     if not warehouse_name:
         await callback.message.answer("Ошибка: склад не найден. Попробуй снова.")
         return
@@ -5461,10 +5409,10 @@ async def on_slot_warehouse(callback: CallbackQuery, state: FSMContext) -> None:
     # сохраняем склад
     await state.update_data(warehouse=warehouse_name)
 
-    print("WAREHOUSE SAVED:", warehouse_name)
+    logger.debug("Warehouse saved: %s", warehouse_name)
 
     # ================================================================
-    # 3) ПОКАЗЫВАЕМ ШАГ «ТИП ПОСТАВКИ»
+    # 2) ПОКАЗЫВАЕМ ШАГ «ТИП ПОСТАВКИ»
     # ================================================================
     kb = InlineKeyboardMarkup(
         inline_keyboard=[
@@ -5909,16 +5857,8 @@ async def on_slot_confirm(callback: CallbackQuery, state: FSMContext) -> None:
     telegram_id = callback.from_user.id
 
     # 1) Получаем user_id через backend
-    try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            resp = await client.get(
-                f"{BACKEND_URL}/users/get-id",
-                params={"telegram_id": telegram_id}
-            )
-            resp.raise_for_status()
-            user_id = resp.json().get("user_id")
-    except Exception as e:
-        print("Error calling /users/get-id:", e)
+    user_id = await _get_user_id(telegram_id)
+    if user_id is None:
         await callback.message.answer("Ошибка получения user_id. Попробуй позже.")
         return
 
@@ -5966,21 +5906,16 @@ async def on_slot_confirm(callback: CallbackQuery, state: FSMContext) -> None:
         "user_id": user_id,
     }
 
-    print("\n===== SLOT SEARCH PAYLOAD =====")
-    print(json.dumps(payload, ensure_ascii=False, indent=2))
-    print("================================\n")
+    logger.debug("/slots/search payload", extra={"payload": payload})
 
     loading_msg = await callback.message.answer("Идет поиск слотов, подождите...")
     await add_ui_message(state, loading_msg.message_id)
 
     # 4) Отправка запроса
     try:
-        async with httpx.AsyncClient(timeout=20.0) as client:
-            resp = await client.post(f"{BACKEND_URL}/slots/search", json=payload)
-            resp.raise_for_status()
-            result = resp.json()
+        result = await backend.create_slot_search(payload)
     except Exception as e:
-        print("Error calling /slots/search:", e)
+        logger.error("Error calling /slots/search: %s", e)
         try:
             await loading_msg.edit_text("Ошибка создания задачи на поиск слота.")
         except Exception:
@@ -6045,13 +5980,61 @@ async def on_slot_view_page(callback: CallbackQuery, state: FSMContext) -> None:
     try:
         await callback.message.edit_text(text, reply_markup=kb)
     except Exception as e:
-        print("Error updating slots page:", e)
+        logger.error("Error updating slots page: %s", e)
         msg = await callback.message.answer(text, reply_markup=kb)
         await add_ui_message(state, msg.message_id)
 
     await callback.answer()
 
 
+def _supplies_load_text(status: dict) -> str:
+    if status.get("status") == "done":
+        result = status.get("result") or {}
+        return (
+            "✔️ Автобронирование выполнено!\n\n"
+            f"Склад: {result.get('warehouse')}\n"
+            f"Тип поставки: {result.get('supply_type')}\n"
+            f"Файл: {result.get('file_saved')}\n"
+            f"Выбранная дата: {result.get('chosen_date')}"
+        )
+    if status.get("status") == "failed":
+        return "Ошибка при создании поставки."
+
+    lines = ["⏳ Выполняю автобронирование… Подожди немного."]
+    progress = status.get("progress")
+    if progress is not None:
+        lines.append(f"Готово: {progress}%")
+    if status.get("stage"):
+        lines.append(status["stage"])
+    return "\n".join(lines)
+
+
+async def _update_supplies_load_message(bot: Bot, chat_id: int, message_id: int, status: dict) -> None:
+    """
+    Обновляет сообщение о ходе /supplies/load. Если пользователь уже ушёл
+    с экрана и сообщение удалено, итог присылаем новым сообщением.
+    """
+    final = status.get("status") in RemoteJobTracker.FINAL_STATUSES
+    if status.get("status") == "failed":
+        logger.error("Error /supplies/load: %s", status.get("error"))
+
+    kb = None
+    if final:
+        kb = InlineKeyboardMarkup(
+            inline_keyboard=[
+                [InlineKeyboardButton(text="🏠 Главное меню", callback_data="menu_main")]
+            ]
+        )
+
+    text = _supplies_load_text(status)
+    try:
+        await bot.edit_message_text(text, chat_id=chat_id, message_id=message_id, reply_markup=kb)
+    except Exception:
+        if final:
+            with outbound_priority(PRIORITY_BULK):
+                await bot.send_message(chat_id, text, reply_markup=kb)
+
+
 async def on_autobook_load(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
     await clear_all_ui(callback.message, state)
@@ -6066,67 +6049,82 @@ async def on_autobook_load(callback: CallbackQuery, state: FSMContext):
         return
 
     # Получаем user_id через backend
-    try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            r = await client.get(
-                f"{BACKEND_URL}/users/get-id",
-                params={"telegram_id": telegram_id}
-            )
-            r.raise_for_status()
-            user_id = r.json().get("user_id")
-    except Exception:
+    user_id = await _get_user_id(telegram_id)
+    if user_id is None:
         await callback.message.answer("Не удалось получить user_id.")
         return
 
-    # Показываем сообщение о загрузке
+    track_key = (user_id, request_id)
+    if supplies_load_tracker.is_tracking(track_key):
+        msg = await callback.message.answer("⏳ Автобронирование по этой задаче уже выполняется.")
+        await add_ui_message(state, msg.message_id)
+        return
+
+    # Показываем сообщение о загрузке; дальше его редактирует трекер
     loading_msg = await callback.message.answer("⏳ Выполняю автобронирование… Подожди немного.")
     await add_ui_message(state, loading_msg.message_id)
 
-    # Выполняем POST /supplies/load
+    # Ставим /supplies/load в очередь backend-а и не держим хендлер до конца загрузки
+    on_update = partial(_update_supplies_load_message, callback.bot, loading_msg.chat.id, loading_msg.message_id)
     try:
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            resp = await client.post(
-                f"{BACKEND_URL}/supplies/load",
-                params={"user_id": user_id, "request_id": request_id, "debug": False}
-            )
-            resp.raise_for_status()
-            result = resp.json()
+        job = await backend.supplies_load_submit(user_id, request_id, debug=False)
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code not in (404, 405):
+            logger.error("Error /supplies/load/jobs: %s", e)
+            msg = await callback.message.answer("Ошибка при создании поставки.")
+            await add_ui_message(state, msg.message_id)
+            return
+
+        # backend без очереди задач: старый синхронный вызов, но уже в фоне
+        supplies_load_tracker.run(
+            track_key,
+            partial(backend.supplies_load, user_id, request_id, debug=False),
+            on_update,
+        )
+        return
     except Exception as e:
-        print("Error /supplies/load:", e)
+        logger.error("Error /supplies/load/jobs: %s", e)
         msg = await callback.message.answer("Ошибка при создании поставки.")
         await add_ui_message(state, msg.message_id)
         return
 
-    # Готовим ответ
-    text = (
-        "✔️ Автобронирование выполнено!\n\n"
-        f"Склад: {result.get('warehouse')}\n"
-        f"Тип поставки: {result.get('supply_type')}\n"
-        f"Файл: {result.get('file_saved')}\n"
-        f"Выбранная дата: {result.get('chosen_date')}"
-    )
+    supplies_load_tracker.track(track_key, partial(backend.supplies_load_status, job["job_id"]), on_update)
 
-    kb = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [InlineKeyboardButton(text="🏠 Главное меню", callback_data="menu_main")]
-        ]
+
+def build_dispatcher() -> Dispatcher:
+    """
+    Собирает диспетчер: FSM-хранилище, middleware и все хендлеры.
+    Вынесено из main(), чтобы нагрузочный стенд (bench.py) и replay.py гоняли тот же граф.
+    """
+    storage = build_fsm_storage(
+        FSM_STORAGE,
+        redis_url=FSM_REDIS_URL,
+        sqlite_path=FSM_SQLITE_PATH,
+        state_ttl=FSM_STATE_TTL,
     )
+    dp = Dispatcher(storage=storage)
 
-    msg = await callback.message.answer(text, reply_markup=kb)
-    await add_ui_message(state, msg.message_id)
+    # Поля корреляции логов: update_id/telegram_id на апдейт, имя — на хендлер
+    dp.update.outer_middleware(LogContextMiddleware())
+    dp.message.middleware(LogContextMiddleware())
+    dp.callback_query.middleware(LogContextMiddleware())
 
+    # Метрики снаружи FSM-сессии, чтобы в латентность попадал коммит
+    dp.message.middleware(HandlerMetricsMiddleware())
+    dp.callback_query.middleware(HandlerMetricsMiddleware())
 
-async def main() -> None:
-    """
-    Точка входа для бота.
-    """
-    if not BOT_TOKEN:
-        raise RuntimeError(f"BOT_TOKEN is not set or empty. Current value: {BOT_TOKEN!r}")
+    # FSM пишется в хранилище один раз по завершении хендлера
+    dp.message.middleware(FSMSessionMiddleware(keep_on_rollback=UI_MESSAGE_KEYS))
+    dp.callback_query.middleware(FSMSessionMiddleware(keep_on_rollback=UI_MESSAGE_KEYS))
 
-    bot = Bot(BOT_TOKEN)
-    dp = Dispatcher(storage=MemoryStorage())
+    # Экран «сервис занят», если за апдейт был сброшен вызов backend-а
+    dp.message.middleware(AdmissionMiddleware(on_backend_busy))
+    dp.callback_query.middleware(AdmissionMiddleware(on_backend_busy))
 
-    # Регистрация хендлеров
+    # Регистрация хендлеров: callback-и идут через один роутер с поиском
+    # по точному callback_data или самому длинному префиксу; кнопки с
+    # аргументами (typed) роутер разбирает сам и отдаёт в callback_args
+    callbacks = CallbackRouter(invalid=on_invalid_callback)
     dp.message.register(cmd_start, CommandStart())
     dp.message.register(wb_auth_command_handler, Command("wb_auth"))
     dp.message.register(cmd_wb_status, Command("wb_status"))
@@ -6139,145 +6137,186 @@ async def main() -> None:
     dp.message.register(wb_auth_code_step, WbAuthState.wait_code)
     dp.message.register(on_slot_period_manual_input, SlotSearchState.period_days)
     dp.message.register(on_autobook_period_manual_input, AutoBookNewState.period_days)
-    dp.callback_query.register(on_slot_cancel_callback, F.data.startswith("slot_cancel:"))
-    dp.callback_query.register(on_slot_restart_callback, F.data.startswith("slot_restart:"))
-    dp.callback_query.register(on_slot_delete, F.data.startswith("slot_delete:"))
-    dp.callback_query.register(on_slot_warehouse, F.data.startswith("slot_wh:"))
-    dp.callback_query.register(on_slot_warehouse, F.data.startswith("slot_wh_id:"))
-    dp.callback_query.register(on_slot_supply, F.data.startswith("slot_supply:"))
-    dp.callback_query.register(on_slot_coef, F.data.startswith("slot_coef:"))
-    dp.callback_query.register(on_slot_logistics, F.data.startswith("slot_log:"))
-    dp.callback_query.register(on_slot_period, F.data.startswith("slot_period:"))
-    dp.callback_query.register(on_slot_lead, F.data.startswith("slot_lead:"))
-    dp.callback_query.register(on_slot_week, F.data.startswith("slot_week:"))
-    dp.callback_query.register(on_slot_confirm, F.data == "slot_confirm:create")
-    dp.callback_query.register(on_slot_view_open, F.data.startswith("slot_view_open:"))
-    dp.callback_query.register(on_slot_view_page, F.data.startswith("slot_view_page:"))
-    dp.callback_query.register(on_slot_week, F.data.startswith("slot_day:"))
-    dp.callback_query.register(on_slot_tasks_page, F.data.startswith("slot_tasks_page:"))
-    dp.callback_query.register(on_slot_tasks_main_menu, F.data == "slot_tasks_main_menu")
-    dp.callback_query.register(on_slot_task_open, F.data.startswith("slot_task_open:"))
-    dp.callback_query.register(on_slot_tasks_back_to_list, F.data == "slot_tasks_back_to_list")
-    dp.callback_query.register(on_slot_back, F.data.startswith("slot_back:"))
-    dp.callback_query.register(menu_moves_callback, F.data == "menu_moves")
-    dp.callback_query.register(moves_page_callback, F.data.startswith("moves_page:"))
-    dp.callback_query.register(moves_open_callback, F.data.startswith("moves_open:"))
-    dp.callback_query.register(moves_stop_callback, F.data.startswith("moves_stop:"))
-    dp.callback_query.register(moves_start_callback, F.data.startswith("moves_start:"))
-    dp.callback_query.register(moves_delete_placeholder, F.data == "moves_delete_not_implemented")
-    dp.callback_query.register(moves_create_callback, F.data == "moves_create")
-    dp.callback_query.register(moves_choose_qty, F.data.startswith("moves_qty:"))
-    dp.callback_query.register(moves_confirm_callback, F.data == "moves_confirm")
-    dp.callback_query.register(moves_back_qty, F.data == "moves_back_qty")
-    dp.callback_query.register(moves_back_to, F.data == "moves_back_to")
-    dp.callback_query.register(moves_back_from, F.data == "moves_back_from")
-    dp.callback_query.register(moves_back_articles, F.data == "moves_back_articles")
-    dp.callback_query.register(moves_choose_account, F.data.startswith("moves_acc:"))
-    dp.callback_query.register(moves_choose_article, F.data.startswith("moves_art:"))
-    dp.callback_query.register(moves_back_account, F.data == "moves_back_account")
-    dp.callback_query.register(moves_back_article, F.data == "moves_back_article")
-    dp.callback_query.register(moves_choose_from, F.data.startswith("moves_from:"))
-    dp.callback_query.register(moves_choose_to, F.data.startswith("moves_to:"))
-    dp.callback_query.register(on_autobook_task_chosen, F.data.startswith("autobook_task:"))
-    dp.callback_query.register(on_autobook_wh_page, F.data.startswith("autobook_wh_page:"))
-    dp.callback_query.register(on_autobook_warehouse, F.data.startswith("autobook_wh_id:"))
-    dp.callback_query.register(on_autobook_wh_done, F.data == "autobook_wh_done")
-    dp.callback_query.register(on_autobook_supply, F.data.startswith("autobook_supply:"))
-    dp.callback_query.register(on_autobook_coef, F.data.startswith("autobook_coef:"))
-    dp.callback_query.register(on_autobook_logistics, F.data.startswith("autobook_log:"))
-    dp.callback_query.register(on_autobook_period, F.data.startswith("autobook_period:"))
-    dp.callback_query.register(on_autobook_lead, F.data.startswith("autobook_lead:"))
-    dp.callback_query.register(on_autobook_week, F.data.startswith("autobook_day:"))
-    dp.callback_query.register(on_autobook_back, F.data.startswith("autobook_back:"))
-    dp.callback_query.register(on_autobook_from_search, F.data.startswith("autobook_from_search:"))
-    dp.callback_query.register(on_autobook_choose_account, F.data.startswith("autobook_choose_account:"))
-    dp.callback_query.register(on_autobook_choose_draft, F.data.startswith("autobook_choose_draft:"))
-    dp.callback_query.register(on_autobook_start, F.data.startswith("autobook_start:"))
-    dp.callback_query.register(on_autobook_stop, F.data.startswith("autobook_stop:"))
-    dp.callback_query.register(on_autobook_open, F.data.startswith("autobook_open:"))
-    dp.callback_query.register(on_autobook_back_to_list, F.data == "autobook_back_to_list")
-    dp.callback_query.register(on_autobook_main_menu, F.data == "autobook_main_menu")
-    dp.callback_query.register(on_autobook_page, F.data.startswith("autobook_page:"))
-    dp.callback_query.register(on_autobook_delete, F.data.startswith("autobook_delete:"))
-    dp.callback_query.register(on_autobook_show_accounts, F.data == "autobook_show_accounts")
-    dp.callback_query.register(on_autobook_transit, F.data.startswith("autobook_transit:"))
-    dp.callback_query.register(on_autobook_confirm, F.data == "autobook_confirm")
-    dp.callback_query.register(on_slot_cancel_callback, F.data.startswith("slot_cancel:"))
-    dp.callback_query.register(on_slot_restart_callback, F.data.startswith("slot_restart:"))
-    dp.callback_query.register(on_slot_delete, F.data.startswith("slot_delete:"))
-    dp.callback_query.register(on_autobook_task_chosen, F.data.startswith("autobook_task:"))
-    dp.callback_query.register(on_autobook_from_search, F.data.startswith("autobook_from_search:"))
+    callbacks.typed(SlotCancel, on_slot_cancel_callback)
+    callbacks.typed(SlotRestart, on_slot_restart_callback)
+    callbacks.typed(SlotDelete, on_slot_delete)
+    callbacks.typed(SlotWarehouse, on_slot_warehouse)
+    callbacks.prefix("slot_supply:", on_slot_supply)
+    callbacks.prefix("slot_coef:", on_slot_coef)
+    callbacks.prefix("slot_log:", on_slot_logistics)
+    callbacks.prefix("slot_period:", on_slot_period)
+    callbacks.prefix("slot_lead:", on_slot_lead)
+    callbacks.prefix("slot_week:", on_slot_week)
+    callbacks.exact("slot_confirm:create", on_slot_confirm)
+    callbacks.prefix("slot_view_open:", on_slot_view_open)
+    callbacks.prefix("slot_view_page:", on_slot_view_page)
+    callbacks.prefix("slot_day:", on_slot_week)
+    callbacks.typed(SlotTasksPage, on_slot_tasks_page)
+    callbacks.exact("slot_tasks_main_menu", on_slot_tasks_main_menu)
+    callbacks.typed(SlotTaskOpen, on_slot_task_open)
+    callbacks.exact("slot_tasks_back_to_list", on_slot_tasks_back_to_list)
+    callbacks.prefix("slot_back:", on_slot_back)
+    callbacks.exact("menu_moves", menu_moves_callback)
+    callbacks.typed(MovesPage, moves_page_callback)
+    callbacks.typed(MovesOpen, moves_open_callback)
+    callbacks.typed(MovesStop, moves_stop_callback)
+    callbacks.typed(MovesStart, moves_start_callback)
+    callbacks.exact("moves_delete_not_implemented", moves_delete_placeholder)
+    callbacks.exact("moves_create", moves_create_callback)
+    callbacks.typed(MovesQty, moves_choose_qty)
+    callbacks.exact("moves_confirm", moves_confirm_callback)
+    callbacks.exact("moves_back_qty", moves_back_qty)
+    callbacks.exact("moves_back_to", moves_back_to)
+    callbacks.exact("moves_back_from", moves_back_from)
+    callbacks.exact("moves_back_articles", moves_back_articles)
+    callbacks.typed(MovesAccount, moves_choose_account)
+    callbacks.typed(MovesArticle, moves_choose_article)
+    callbacks.exact("moves_back_account", moves_back_account)
+    callbacks.exact("moves_back_article", moves_back_article)
+    callbacks.typed(MovesFrom, moves_choose_from)
+    callbacks.typed(MovesTo, moves_choose_to)
+    callbacks.prefix("autobook_task:", on_autobook_task_chosen)
+    callbacks.typed(AutobookWarehousePage, on_autobook_wh_page)
+    callbacks.typed(AutobookWarehouse, on_autobook_warehouse)
+    callbacks.exact("autobook_wh_done", on_autobook_wh_done)
+    callbacks.prefix("autobook_supply:", on_autobook_supply)
+    callbacks.prefix("autobook_coef:", on_autobook_coef)
+    callbacks.prefix("autobook_log:", on_autobook_logistics)
+    callbacks.prefix("autobook_period:", on_autobook_period)
+    callbacks.prefix("autobook_lead:", on_autobook_lead)
+    callbacks.prefix("autobook_day:", on_autobook_week)
+    callbacks.prefix("autobook_back:", on_autobook_back)
+    callbacks.typed(AutobookFromSearch, on_autobook_from_search)
+    callbacks.typed(AutobookChooseAccount, on_autobook_choose_account)
+    callbacks.typed(AutobookChooseDraft, on_autobook_choose_draft)
+    callbacks.typed(AutobookStart, on_autobook_start)
+    callbacks.typed(AutobookStop, on_autobook_stop)
+    callbacks.typed(AutobookOpen, on_autobook_open)
+    callbacks.exact("autobook_back_to_list", on_autobook_back_to_list)
+    callbacks.exact("autobook_main_menu", on_autobook_main_menu)
+    callbacks.typed(AutobookPage, on_autobook_page)
+    callbacks.typed(AutobookDelete, on_autobook_delete)
+    callbacks.exact("autobook_show_accounts", on_autobook_show_accounts)
+    callbacks.typed(AutobookTransit, on_autobook_transit)
+    callbacks.exact("autobook_confirm", on_autobook_confirm)
     dp.message.register(autobook_choose_account_step, AutoBookState.choose_account)
-    dp.callback_query.register(on_autobook_choose_account, F.data.startswith("autobook_choose_account:"))
-    dp.callback_query.register(on_autobook_choose_draft, F.data.startswith("autobook_choose_draft:"))
-    dp.callback_query.register(on_autobook_start, F.data.startswith("autobook_start:"))
-    dp.callback_query.register(on_autobook_stop, F.data.startswith("autobook_stop:"))
-    dp.callback_query.register(on_autobook_open, F.data.startswith("autobook_open:"))
-    dp.callback_query.register(on_autobook_back_to_list, F.data == "autobook_back_to_list")
-    dp.callback_query.register(on_autobook_main_menu, F.data == "autobook_main_menu")
-    dp.callback_query.register(on_autobook_page, F.data.startswith("autobook_page:"))
-    dp.callback_query.register(on_autobook_delete, F.data.startswith("autobook_delete:"))
-    dp.callback_query.register(on_autobook_show_accounts, F.data == "autobook_show_accounts")
-    dp.callback_query.register(on_autobook_transit, F.data.startswith("autobook_transit:"))
-    dp.callback_query.register(on_autobook_confirm, F.data == "autobook_confirm")
-    dp.callback_query.register(on_slot_tasks_page, F.data.startswith("slot_tasks_page:"))
-    dp.callback_query.register(on_slot_tasks_main_menu, F.data == "slot_tasks_main_menu")
-    dp.callback_query.register(on_slot_task_open, F.data.startswith("slot_task_open:"))
-    dp.callback_query.register(on_slot_tasks_back_to_list, F.data == "slot_tasks_back_to_list")
-    dp.callback_query.register(on_slot_auto, F.data.startswith("slot_auto_"))
-    dp.callback_query.register(on_menu_slot_tasks, F.data == "menu_slot_tasks")
-    dp.callback_query.register(on_slot_back, F.data.startswith("slot_back:"))
-    dp.callback_query.register(menu_search_callback, F.data == "menu_search")
-    dp.callback_query.register(menu_tasks_callback, F.data == "menu_tasks")
-    dp.callback_query.register(tasks_history_search_callback, F.data == "tasks_history_search")
-    dp.callback_query.register(tasks_history_autobook_callback, F.data == "tasks_history_autobook")
-    dp.callback_query.register(
-        tasks_history_slot_search_filter_callback,
-        F.data.startswith("tasks_history_slot_search_filter:"),
-    )
-    dp.callback_query.register(
-        tasks_history_slot_search_open_callback,
-        F.data.startswith("tasks_history_slot_search_open:"),
+    callbacks.typed(SlotAuto, on_slot_auto)
+    callbacks.exact("menu_slot_tasks", on_menu_slot_tasks)
+    callbacks.exact("menu_search", menu_search_callback)
+    callbacks.exact("menu_tasks", menu_tasks_callback)
+    callbacks.exact("tasks_history_search", tasks_history_search_callback)
+    callbacks.exact("tasks_history_autobook", tasks_history_autobook_callback)
+    callbacks.typed(TasksHistoryFilter, tasks_history_slot_search_filter_callback)
+    callbacks.typed(TasksHistorySearchOpen, tasks_history_slot_search_open_callback)
+    callbacks.typed(TasksHistorySearchCancel, tasks_history_slot_search_cancel_callback)
+    callbacks.typed(TasksHistoryAutobookOpen, tasks_history_autobook_open_callback)
+    callbacks.typed(TasksHistorySearchPage, tasks_history_page_callback)
+    callbacks.typed(TasksHistoryAutobookPage, tasks_history_page_callback)
+    callbacks.exact("menu_autobook", menu_autobook_new_callback)
+    callbacks.exact("autobook_menu:list", autobook_menu_list_callback)
+    callbacks.exact("autobook_menu:create", autobook_menu_create_callback)
+    callbacks.typed(AutobookAccountsPage, on_autobook_accounts_page)
+    callbacks.exact("autobook_new_refresh", on_autobook_new_refresh)
+    callbacks.typed(AutobookNewAccount, on_autobook_new_account)
+    callbacks.typed(AutobookDraftsPage, on_autobook_drafts_page)
+    callbacks.exact("autobook_new_manual", on_autobook_new_manual)
+    callbacks.prefix("autobook_new_search:", on_autobook_new_search)
+    callbacks.typed(AutobookRequestsPage, on_autobook_requests_page)
+    callbacks.typed(AutobookNewDraft, on_autobook_new_draft)
+    callbacks.typed(AutobookNewRequest, on_autobook_new_request)
+    callbacks.exact("autobook_new_confirm", on_autobook_new_confirm)
+    callbacks.exact("autobook_new_cancel", on_autobook_new_cancel)
+    callbacks.exact("autobook_new_retry", on_autobook_new_retry)
+    callbacks.exact("menu_auth", menu_auth_callback)
+    callbacks.exact("menu_status", menu_status_callback)
+    callbacks.exact("menu_logout", menu_logout_callback)
+    callbacks.exact("menu_help", menu_help_callback)
+    callbacks.exact("menu_main", menu_main_callback)
+    callbacks.typed(WarehousePage, on_warehouse_page)
+    callbacks.prefix("autobook_load:", on_autobook_load)
+    callbacks.setup(dp.callback_query)
+    logger.info(
+        "Callback router: %(exact_routes)s exact, %(prefix_routes)s prefix, %(typed_routes)s typed routes",
+        callbacks.stats(),
     )
-    dp.callback_query.register(
-        tasks_history_slot_search_cancel_callback,
-        F.data.startswith("tasks_history_slot_search_cancel:"),
-    )
-    dp.callback_query.register(
-        tasks_history_autobook_open_callback,
-        F.data.startswith("tasks_history_auto_booking_open:"),
-    )
-    dp.callback_query.register(
-        tasks_history_page_callback, F.data.startswith("tasks_history_slot_search_page:")
-    )
-    dp.callback_query.register(
-        tasks_history_page_callback, F.data.startswith("tasks_history_auto_booking_page:")
+
+    return dp
+
+
+def register_jobs(bot: Bot) -> None:
+    job_queue.register(
+        "wb_autobooking",
+        _run_wb_autobooking_job,
+        on_success=partial(_notify_autobooking_done, bot),
+        on_failure=partial(_notify_autobooking_failed, bot),
     )
-    dp.callback_query.register(menu_autobook_new_callback, F.data == "menu_autobook")
-    dp.callback_query.register(autobook_menu_list_callback, F.data == "autobook_menu:list")
-    dp.callback_query.register(autobook_menu_create_callback, F.data == "autobook_menu:create")
-    dp.callback_query.register(on_autobook_accounts_page, F.data.startswith("autobook_accounts_page:"))
-    dp.callback_query.register(on_autobook_new_refresh, F.data == "autobook_new_refresh")
-    dp.callback_query.register(on_autobook_new_account, F.data.startswith("autobook_new_account:"))
-    dp.callback_query.register(on_autobook_drafts_page, F.data.startswith("autobook_drafts_page:"))
-    dp.callback_query.register(on_autobook_new_manual, F.data == "autobook_new_manual")
-    dp.callback_query.register(on_autobook_new_search, F.data.startswith("autobook_new_search:"))
-    dp.callback_query.register(on_autobook_requests_page, F.data.startswith("autobook_requests_page:"))
-    dp.callback_query.register(on_autobook_new_draft, F.data.startswith("autobook_new_draft:"))
-    dp.callback_query.register(on_autobook_new_request, F.data.startswith("autobook_new_request:"))
-    dp.callback_query.register(on_autobook_new_confirm, F.data == "autobook_new_confirm")
-    dp.callback_query.register(on_autobook_new_cancel, F.data == "autobook_new_cancel")
-    dp.callback_query.register(on_autobook_new_retry, F.data == "autobook_new_retry")
-    dp.callback_query.register(menu_auth_callback, F.data == "menu_auth")
-    dp.callback_query.register(menu_status_callback, F.data == "menu_status")
-    dp.callback_query.register(menu_logout_callback, F.data == "menu_logout")
-    dp.callback_query.register(menu_help_callback, F.data == "menu_help")
-    dp.callback_query.register(menu_main_callback, F.data == "menu_main")
-    dp.callback_query.register(on_warehouse_page, F.data.startswith("wh_page:"))
-    dp.callback_query.register(on_autobook_load, F.data.startswith("autobook_load:"))
-
-
-    await dp.start_polling(bot)
+
+
+async def main() -> None:
+    """
+    Точка входа для бота.
+    """
+    if not BOT_TOKEN:
+        raise RuntimeError(f"BOT_TOKEN is not set or empty. Current value: {BOT_TOKEN!r}")
+    if BOT_MODE == "webhook" and not WEBHOOK_SECRET:
+        raise RuntimeError("WEBHOOK_SECRET must be set in webhook mode")
+
+    setup_logging(LOG_LEVEL, debug_sample_rate=LOG_DEBUG_SAMPLE_RATE, queue_size=LOG_QUEUE_SIZE)
+
+    bot = Bot(BOT_TOKEN)
+    bot.session.middleware(shed_guard)
+    bot.session.middleware(outbound_scheduler)
+    dp = build_dispatcher()
+    register_jobs(bot)
+    if update_recorder is not None:
+        update_recorder.start()
+        dp.update.outer_middleware(update_recorder)
+
+    await backend.open()
+    await job_queue.start()
+    metrics_runner = None
+    if METRICS_PORT:
+        metrics_runner = await start_metrics_server(METRICS_HOST, METRICS_PORT)
+
+    # Порядок остановки: сначала то, что ещё может писать в FSM, backend
+    # и Telegram, в конце — /metrics, чтобы последний скрейп увидел итог
+    lifecycle.attach(dp)
+    lifecycle.on_drain("job queue", job_queue.stop)
+    lifecycle.on_drain("supplies load tracker", supplies_load_tracker.stop)
+    lifecycle.on_shutdown("warehouse refresh", warehouse_catalog.stop_refresh)
+    lifecycle.on_shutdown("backend client", backend.aclose)
+    lifecycle.on_shutdown("bot session", bot.session.close)
+    if metrics_runner is not None:
+        lifecycle.on_shutdown("metrics server", metrics_runner.cleanup)
+    lifecycle.install_signal_handlers()
+    try:
+        try:
+            await warehouse_catalog.load()
+        except Exception as e:
+            # не критично: справочник догрузится при первом открытии визарда
+            logger.warning("Error preloading warehouses catalog: %s", e)
+        warehouse_catalog.start_refresh()
+        if BOT_MODE == "webhook":
+            await run_webhook(
+                dp,
+                bot,
+                host=WEBHOOK_HOST,
+                port=WEBHOOK_PORT,
+                path=WEBHOOK_PATH,
+                url=WEBHOOK_URL,
+                secret_token=WEBHOOK_SECRET,
+                max_concurrency=WEBHOOK_MAX_CONCURRENCY,
+                max_pending=WEBHOOK_MAX_PENDING,
+                spawn=lifecycle.spawn,
+                stop=lifecycle.stopping,
+            )
+        else:
+            await lifecycle.serve_polling(dp, bot)
+    finally:
+        await lifecycle.shutdown()
+        if update_recorder is not None:
+            update_recorder.close()
+        shutdown_logging()
 
 
 if __name__ == "__main__":
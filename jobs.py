@@ -0,0 +1,538 @@
+"""
+Персистентная очередь фоновых задач бота.
+
+Задачи лежат в SQLite, поэтому переживают рестарт: при старте всё, что
+было в работе, возвращается в очередь. Ключ задачи — ключ идемпотентности:
+повторная постановка с тем же ключом не создаёт дубль, а backend получает
+его в заголовке Idempotency-Key и может отсечь повторную обработку,
+если ответ до нас не дошёл.
+
+RemoteJobTracker — для задач, которые выполняет сам backend: бот только
+опрашивает их статус в фоне.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable
+
+import httpx
+
+from admission import BackendBusy
+from circuit import CircuitOpen
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+logger = logging.getLogger(__name__)
+
+
+def idempotency_key(kind: str, payload: dict) -> str:
+    """
+    Ключ по содержимому задачи — на случай, если вызывающий свой не передал.
+    """
+    raw = json.dumps([kind, payload], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def is_retryable(exc: Exception) -> bool:
+    """
+    Повторяем сетевые ошибки, таймауты, 429 и 5xx, а также отказ в допуске
+    к перегруженному backend-у и разомкнутую цепь эндпоинта; прочие 4xx —
+    окончательный отказ.
+    """
+    if isinstance(exc, httpx.HTTPStatusError):
+        status = exc.response.status_code
+        return status == 429 or status >= 500
+    return isinstance(exc, (httpx.TransportError, asyncio.TimeoutError, BackendBusy, CircuitOpen))
+
+
+def retry_after(exc: Exception) -> float:
+    """
+    Сколько секунд ошибка сама просит подождать до повтора (0 — без подсказки).
+    """
+    return max(0.0, getattr(exc, "retry_after", 0.0) or 0.0)
+
+
+class Job:
+    __slots__ = ("key", "kind", "payload", "status", "attempts", "last_error", "result")
+
+    def __init__(
+        self,
+        key: str,
+        kind: str,
+        payload: dict,
+        status: str,
+        attempts: int,
+        last_error: str | None = None,
+        result: Any = None,
+    ) -> None:
+        self.key = key
+        self.kind = kind
+        self.payload = payload
+        self.status = status
+        self.attempts = attempts
+        self.last_error = last_error
+        self.result = result
+
+    @classmethod
+    def from_row(cls, row: tuple) -> "Job":
+        key, kind, payload, status, attempts, last_error, result = row
+        return cls(
+            key,
+            kind,
+            json.loads(payload),
+            status,
+            attempts,
+            last_error,
+            json.loads(result) if result else None,
+        )
+
+
+JobHandler = Callable[[Job], Awaitable[Any]]
+JobCallback = Callable[[Job], Awaitable[None]]
+
+_COLUMNS = "key, kind, payload, status, attempts, last_error, result"
+
+
+class JobStore:
+    """
+    Таблица задач в SQLite. Все обращения идут через один поток, поэтому
+    выборка и захват задачи не пересекаются между воркерами.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="jobs-sqlite")
+        self._conn: sqlite3.Connection | None = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " key TEXT PRIMARY KEY,"
+                " kind TEXT NOT NULL,"
+                " payload TEXT NOT NULL,"
+                " status TEXT NOT NULL,"
+                " attempts INTEGER NOT NULL DEFAULT 0,"
+                " next_run_at REAL NOT NULL,"
+                " last_error TEXT,"
+                " result TEXT,"
+                " updated_at REAL NOT NULL"
+                ")"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_due ON jobs (status, next_run_at)")
+            self._conn = conn
+        return self._conn
+
+    async def _run(self, fn, *args: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    def _enqueue_sync(self, key: str, kind: str, payload: str) -> tuple[Job, bool]:
+        conn = self._connection()
+        now = time.time()
+        row = conn.execute(f"SELECT {_COLUMNS} FROM jobs WHERE key = ?", (key,)).fetchone()
+        if row is not None and row[3] != FAILED:
+            return Job.from_row(row), False
+        conn.execute(
+            "INSERT INTO jobs (key, kind, payload, status, attempts, next_run_at, updated_at)"
+            " VALUES (?, ?, ?, ?, 0, ?, ?)"
+            " ON CONFLICT(key) DO UPDATE SET"
+            "  payload = excluded.payload, status = excluded.status, attempts = 0,"
+            "  next_run_at = excluded.next_run_at, last_error = NULL, result = NULL,"
+            "  updated_at = excluded.updated_at",
+            (key, kind, payload, PENDING, now, now),
+        )
+        return Job(key, kind, json.loads(payload), PENDING, 0), True
+
+    def _claim_sync(self) -> tuple[Job | None, float | None]:
+        """
+        Захватывает ближайшую готовую задачу; иначе возвращает время следующей.
+        """
+        conn = self._connection()
+        now = time.time()
+        row = conn.execute(
+            f"SELECT {_COLUMNS} FROM jobs WHERE status = ? AND next_run_at <= ?"
+            " ORDER BY next_run_at LIMIT 1",
+            (PENDING, now),
+        ).fetchone()
+        if row is None:
+            nxt = conn.execute(
+                "SELECT MIN(next_run_at) FROM jobs WHERE status = ?", (PENDING,)
+            ).fetchone()[0]
+            return None, nxt
+        conn.execute(
+            "UPDATE jobs SET status = ?, attempts = attempts + 1, updated_at = ? WHERE key = ?",
+            (RUNNING, now, row[0]),
+        )
+        job = Job.from_row(row)
+        job.status = RUNNING
+        job.attempts += 1
+        return job, None
+
+    def _finish_sync(self, key: str, status: str, result: str | None, error: str | None, next_run_at: float) -> None:
+        self._connection().execute(
+            "UPDATE jobs SET status = ?, result = ?, last_error = ?, next_run_at = ?, updated_at = ?"
+            " WHERE key = ?",
+            (status, result, error, next_run_at, time.time(), key),
+        )
+
+    def _recover_sync(self, purge_before: float) -> int:
+        conn = self._connection()
+        conn.execute(
+            "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?", (DONE, FAILED, purge_before)
+        )
+        cur = conn.execute(
+            "UPDATE jobs SET status = ?, updated_at = ? WHERE status = ?", (PENDING, time.time(), RUNNING)
+        )
+        return cur.rowcount
+
+    def _counts_sync(self) -> dict[str, int]:
+        rows = self._connection().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+    def _close_sync(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def enqueue(self, key: str, kind: str, payload: dict) -> tuple[Job, bool]:
+        return await self._run(self._enqueue_sync, key, kind, json.dumps(payload, ensure_ascii=False))
+
+    async def claim(self) -> tuple[Job | None, float | None]:
+        return await self._run(self._claim_sync)
+
+    async def finish(
+        self,
+        key: str,
+        status: str,
+        *,
+        result: Any = None,
+        error: str | None = None,
+        next_run_at: float = 0.0,
+    ) -> None:
+        raw = None if result is None else json.dumps(result, ensure_ascii=False, default=str)
+        await self._run(self._finish_sync, key, status, raw, error, next_run_at)
+
+    async def recover(self, purge_before: float) -> int:
+        return await self._run(self._recover_sync, purge_before)
+
+    async def counts(self) -> dict[str, int]:
+        return await self._run(self._counts_sync)
+
+    async def close(self) -> None:
+        await self._run(self._close_sync)
+        self._executor.shutdown(wait=True)
+
+
+class JobQueue:
+    """
+    Пул воркеров поверх JobStore.
+
+    Одновременно выполняется не больше workers задач. Ошибку, которую
+    is_retryable считает временной, повторяем с экспоненциальной задержкой
+    и джиттером (но не раньше её retry_after) до max_attempts попыток; по
+    завершении вызываем on_success или on_failure, зарегистрированные для
+    вида задачи.
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        *,
+        workers: int = 4,
+        max_attempts: int = 5,
+        backoff_base: float = 2.0,
+        backoff_max: float = 300.0,
+        retention: float = 7 * 24 * 3600,
+    ) -> None:
+        self.store = store
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retention = retention
+        self._handlers: dict[str, tuple[JobHandler, JobCallback | None, JobCallback | None]] = {}
+        self._wakeup = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+        self._stopping = False
+
+    def register(
+        self,
+        kind: str,
+        handler: JobHandler,
+        *,
+        on_success: JobCallback | None = None,
+        on_failure: JobCallback | None = None,
+    ) -> None:
+        self._handlers[kind] = (handler, on_success, on_failure)
+
+    async def submit(self, kind: str, payload: dict, *, key: str | None = None) -> tuple[Job, bool]:
+        """
+        Ставит задачу в очередь. Возвращает (задача, создана ли новая):
+        с уже известным ключом вернётся существующая задача, если она не упала.
+        """
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind: {kind!r}")
+        job, created = await self.store.enqueue(key or idempotency_key(kind, payload), kind, payload)
+        if created:
+            self._wakeup.set()
+        return job, created
+
+    async def start(self) -> None:
+        self._stopping = False
+        recovered = await self.store.recover(time.time() - self.retention)
+        if recovered:
+            logger.info("Job queue: requeued %s interrupted jobs", recovered)
+        for i in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker(), name=f"job-worker-{i}"))
+
+    async def stop(self, timeout: float = 0.0) -> None:
+        """
+        Останавливает воркеры: новые задачи не берутся, начатым даётся
+        до timeout секунд, после чего они отменяются.
+        """
+        self._stopping = True
+        self._wakeup.set()
+        if self._tasks and timeout > 0:
+            await asyncio.wait(self._tasks, timeout=timeout)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+        # прерванные задачи останутся в статусе running и вернутся в очередь при старте
+        await self.store.close()
+
+    def _backoff(self, attempts: int) -> float:
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (attempts - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    async def _worker(self) -> None:
+        while True:
+            # сбрасываем до выборки: постановка во время claim() не потеряется
+            self._wakeup.clear()
+            if self._stopping:
+                return
+            try:
+                job, next_run_at = await self.store.claim()
+            except Exception as e:
+                logger.error("Job queue: error claiming job: %s", e)
+                await asyncio.sleep(1.0)
+                continue
+
+            if job is None:
+                timeout = None if next_run_at is None else max(0.0, next_run_at - time.time())
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            # в очереди могут быть ещё задачи — будим соседей
+            self._wakeup.set()
+            await self._run_job(job)
+
+    async def _run_job(self, job: Job) -> None:
+        handler, on_success, on_failure = self._handlers.get(job.kind, (None, None, None))
+        if handler is None:
+            await self.store.finish(job.key, FAILED, error=f"unknown job kind {job.kind!r}")
+            return
+
+        try:
+            job.result = await handler(job)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            job.last_error = str(e) or type(e).__name__
+            if is_retryable(e) and job.attempts < self.max_attempts:
+                delay = max(self._backoff(job.attempts), retry_after(e))
+                logger.warning(
+                    "Job %s %s: attempt %s failed (%s), retry in %.1fs",
+                    job.kind,
+                    job.key,
+                    job.attempts,
+                    job.last_error,
+                    delay,
+                )
+                await self.store.finish(job.key, PENDING, error=job.last_error, next_run_at=time.time() + delay)
+                self._wakeup.set()
+                return
+            job.status = FAILED
+            await self.store.finish(job.key, FAILED, error=job.last_error)
+            callback = on_failure
+        else:
+            job.status = DONE
+            await self.store.finish(job.key, DONE, result=job.result)
+            callback = on_success
+
+        if callback is not None:
+            try:
+                await callback(job)
+            except Exception as e:
+                logger.error("Job %s %s: error in completion callback: %s", job.kind, job.key, e)
+
+    async def stats(self) -> dict[str, Any]:
+        return {"workers": len(self._tasks), **(await self.store.counts())}
+
+
+class RemoteJobTracker:
+    """
+    Отслеживает долгие задачи, которые выполняет сам backend.
+
+    Хендлер ставит задачу в backend и сразу освобождается, а трекер в фоне
+    опрашивает её статус с нарастающим интервалом и вызывает on_update при
+    каждом изменении статуса, прогресса или этапа. Опрос заканчивается на
+    статусе done/failed, по таймауту или после max_poll_errors ошибок подряд.
+
+    run() — для backend-ов без очереди задач: один блокирующий вызов в фоне.
+    Такие вызовы держат соединение минутами, поэтому у них свой лимит
+    max_concurrent_runs и они не занимают места коротких опросов.
+    """
+
+    FINAL_STATUSES = ("done", "failed")
+
+    def __init__(
+        self,
+        *,
+        poll_interval: float = 2.0,
+        max_poll_interval: float = 10.0,
+        timeout: float = 900.0,
+        max_poll_errors: int = 5,
+        max_concurrent_polls: int = 20,
+        max_concurrent_runs: int = 5,
+    ) -> None:
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.timeout = timeout
+        self.max_poll_errors = max_poll_errors
+        self._poll_semaphore = asyncio.Semaphore(max_concurrent_polls)
+        self._run_semaphore = asyncio.Semaphore(max_concurrent_runs)
+        self._tasks: dict[Any, asyncio.Task] = {}
+        self._stopping = asyncio.Event()
+
+    def is_tracking(self, key: Any) -> bool:
+        return key in self._tasks
+
+    def track(
+        self,
+        key: Any,
+        poll: Callable[[], Awaitable[dict]],
+        on_update: Callable[[dict], Awaitable[None]],
+    ) -> bool:
+        """
+        Запускает отслеживание; False, если задача с таким ключом уже отслеживается.
+        """
+        return self._start(key, self._track(poll, on_update))
+
+    def run(
+        self,
+        key: Any,
+        call: Callable[[], Awaitable[Any]],
+        on_update: Callable[[dict], Awaitable[None]],
+    ) -> bool:
+        """
+        Выполняет call в фоне и сообщает итог в on_update как статус
+        done (с result) или failed; False, если ключ уже отслеживается.
+        """
+        return self._start(key, self._run(call, on_update))
+
+    def _start(self, key: Any, coro: Awaitable[None]) -> bool:
+        if key in self._tasks:
+            coro.close()
+            return False
+        task = asyncio.create_task(coro)
+        self._tasks[key] = task
+        task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        return True
+
+    @staticmethod
+    async def _notify(on_update: Callable[[dict], Awaitable[None]], status: dict) -> None:
+        try:
+            await on_update(status)
+        except Exception as e:
+            logger.error("Error in remote job update callback: %s", e)
+
+    async def _run(
+        self,
+        call: Callable[[], Awaitable[Any]],
+        on_update: Callable[[dict], Awaitable[None]],
+    ) -> None:
+        try:
+            async with self._run_semaphore:
+                result = await call()
+        except Exception as e:
+            status = {"status": "failed", "error": str(e) or type(e).__name__}
+        else:
+            status = {"status": "done", "result": result}
+        await self._notify(on_update, status)
+
+    async def _track(
+        self,
+        poll: Callable[[], Awaitable[dict]],
+        on_update: Callable[[dict], Awaitable[None]],
+    ) -> None:
+        deadline = time.monotonic() + self.timeout
+        interval = self.poll_interval
+        errors = 0
+        last_seen = None
+
+        while not self._stopping.is_set():
+            try:
+                async with self._poll_semaphore:
+                    status = await poll()
+                errors = 0
+            except Exception as e:
+                errors += 1
+                if errors < self.max_poll_errors:
+                    status = None
+                else:
+                    status = {"status": "failed", "error": str(e) or type(e).__name__}
+
+            if status is not None:
+                seen = (status.get("status"), status.get("progress"), status.get("stage"))
+                final = status.get("status") in self.FINAL_STATUSES
+                if seen != last_seen or final:
+                    last_seen = seen
+                    await self._notify(on_update, status)
+                if final:
+                    return
+
+            if time.monotonic() >= deadline:
+                await self._notify(on_update, {"status": "failed", "error": "timeout"})
+                return
+
+            try:
+                await asyncio.wait_for(self._stopping.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+            interval = min(self.max_poll_interval, interval * 1.5)
+
+    async def stop(self, timeout: float = 0.0) -> None:
+        """
+        Останавливает отслеживание: новые опросы не начинаются, начатые
+        опросы и синхронные вызовы дорабатывают до timeout секунд, после
+        чего отменяются. Сама задача продолжает выполняться в backend-е.
+        """
+        self._stopping.set()
+        tasks = list(self._tasks.values())
+        if tasks and timeout > 0:
+            await asyncio.wait(tasks, timeout=timeout)
+        unfinished = [task for task in tasks if not task.done()]
+        if unfinished:
+            logger.warning("Remote job tracker: cancelling %s unfinished calls", len(unfinished))
+        for task in unfinished:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict[str, int]:
+        return {"tracked_jobs": len(self._tasks)}
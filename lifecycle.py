@@ -0,0 +1,178 @@
+"""
+Плавная остановка бота.
+
+По SIGTERM/SIGINT процесс перестаёт принимать апдейты (polling или
+webhook останавливает main()), дожидается апдейтов, которые уже в
+обработке, и фоновых задач, запущенных через spawn(), — но не дольше
+drain_timeout. Затем по порядку выполняет шаги остановки: дренаж очереди
+задач, закрытие FSM-хранилища, HTTP-клиента backend, сессии бота и т.п.
+Всё, что не успело к дедлайну, отменяется и попадает в лог.
+
+Второй сигнал обрывает ожидание сразу — на случай зависшего хендлера.
+"""
+import asyncio
+import logging
+import signal
+import time
+from typing import Any, Awaitable, Callable, Coroutine
+
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.types import TelegramObject
+
+logger = logging.getLogger(__name__)
+
+ShutdownStep = Callable[[], Awaitable[Any]]
+DrainStep = Callable[[float], Awaitable[Any]]
+
+
+class Lifecycle(BaseMiddleware):
+    """
+    Outer-middleware на dp.update считает апдейты в обработке; spawn()
+    запускает фоновые задачи, которых надо дождаться при остановке.
+    """
+
+    def __init__(self, *, drain_timeout: float = 25.0, step_timeout: float = 10.0) -> None:
+        self.drain_timeout = drain_timeout
+        self.step_timeout = step_timeout
+        self.stopping = asyncio.Event()
+        self._forced = asyncio.Event()
+        self._updates: set[asyncio.Task] = set()
+        self._tasks: set[asyncio.Task] = set()
+        self._drain_steps: list[tuple[str, DrainStep]] = []
+        self._steps: list[tuple[str, ShutdownStep]] = []
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        task = asyncio.current_task()
+        self._updates.add(task)
+        try:
+            return await handler(event, data)
+        finally:
+            self._updates.discard(task)
+
+    def attach(self, dp: Dispatcher) -> None:
+        """
+        Вешает учёт апдейтов на диспетчер и забирает себе закрытие FSM.
+
+        Dispatcher закрывает хранилище сразу по остановке polling-а, когда
+        принятые апдейты ещё дорабатывают и коммитят FSM, поэтому fsm.close
+        снимается с dp.shutdown и выполняется шагом после дренажа.
+        """
+        dp.update.outer_middleware(self)
+        dp.shutdown.handlers[:] = [h for h in dp.shutdown.handlers if h.callback != dp.fsm.close]
+        self.on_shutdown("fsm storage", dp.fsm.close)
+
+    def spawn(self, coro: Coroutine[Any, Any, Any], *, name: str | None = None) -> asyncio.Task:
+        """
+        Фоновая задача, которую остановка дождётся (до дедлайна).
+        """
+        task = asyncio.create_task(coro, name=name)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def on_drain(self, name: str, step: DrainStep) -> None:
+        """
+        Шаг, которому передаётся остаток времени до дедлайна (очередь задач).
+        """
+        self._drain_steps.append((name, step))
+
+    def on_shutdown(self, name: str, step: ShutdownStep) -> None:
+        self._steps.append((name, step))
+
+    def request_stop(self) -> None:
+        if self.stopping.is_set():
+            logger.warning("Second stop signal: not waiting for in-flight work any more")
+            self._forced.set()
+            return
+        logger.info(
+            "Stopping: %s updates and %s background tasks in flight",
+            len(self._updates),
+            len(self._tasks),
+        )
+        self.stopping.set()
+
+    def install_signal_handlers(self) -> None:
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(sig, self.request_stop)
+            except (NotImplementedError, RuntimeError):
+                # Windows и не главный поток: остаётся KeyboardInterrupt
+                pass
+
+    async def serve_polling(self, dp: Dispatcher, *bots: Any, **kwargs: Any) -> None:
+        """
+        start_polling до сигнала остановки. Сигналы и закрытие сессии бота
+        берёт на себя Lifecycle, а не aiogram.
+        """
+        polling = asyncio.create_task(
+            dp.start_polling(*bots, handle_signals=False, close_bot_session=False, **kwargs)
+        )
+        stop = asyncio.create_task(self.stopping.wait())
+        try:
+            await asyncio.wait({polling, stop}, return_when=asyncio.FIRST_COMPLETED)
+            if not polling.done():
+                await dp.stop_polling()
+            await polling
+        finally:
+            stop.cancel()
+
+    async def shutdown(self) -> None:
+        """
+        Дренаж и шаги остановки. Вызывается один раз из finally в main().
+        """
+        if not self.stopping.is_set():
+            self.stopping.set()
+        started = time.monotonic()
+        deadline = started + self.drain_timeout
+
+        leftover = await self._wait_in_flight(deadline)
+        if leftover:
+            logger.warning("Drain deadline reached, cancelling %s unfinished tasks", len(leftover))
+            for task in leftover:
+                task.cancel()
+            await asyncio.gather(*leftover, return_exceptions=True)
+
+        for name, step in self._drain_steps:
+            remaining = 0.0 if self._forced.is_set() else max(0.0, deadline - time.monotonic())
+            await self._run_step(name, step(remaining), remaining + self.step_timeout)
+        for name, step in self._steps:
+            await self._run_step(name, step(), self.step_timeout)
+
+        logger.info(
+            "Shutdown complete in %.1fs, %s tasks cancelled",
+            time.monotonic() - started,
+            len(leftover),
+        )
+
+    async def _wait_in_flight(self, deadline: float) -> set[asyncio.Task]:
+        forced = asyncio.create_task(self._forced.wait())
+        try:
+            while True:
+                # апдейты во время дренажа ещё могут запускать фоновые задачи
+                pending = self._updates | self._tasks
+                timeout = deadline - time.monotonic()
+                if not pending or timeout <= 0 or forced.done():
+                    return pending
+                await asyncio.wait(pending | {forced}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            forced.cancel()
+
+    async def _run_step(self, name: str, step: Awaitable[Any], timeout: float) -> None:
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(step, timeout)
+        except asyncio.TimeoutError:
+            logger.error("Shutdown step %s timed out after %.1fs", name, timeout)
+        except Exception as e:
+            logger.error("Shutdown step %s failed: %s", name, e)
+        else:
+            logger.debug("Shutdown step %s took %.3fs", name, time.monotonic() - started)
+
+    def stats(self) -> dict[str, int]:
+        return {"updates_in_flight": len(self._updates), "background_tasks": len(self._tasks)}
@@ -0,0 +1,189 @@
+"""
+Структурированные логи бота: JSON-строки из фоновой очереди.
+
+Хендлеры пишут через обычный logging, но запись только кладётся в
+ограниченную очередь (QueueHandler), а форматирование в JSON и вывод
+в stdout делает отдельный поток (QueueListener), так что event loop на
+логах не блокируется. При переполнении очереди записи отбрасываются
+и считаются.
+
+В каждую запись добавляются поля корреляции из contextvars: update_id,
+telegram_id и handler — их выставляет LogContextMiddleware. DEBUG-записи
+можно сэмплировать, чтобы отладочные дампы не забивали вывод.
+"""
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import time
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+update_id_var: contextvars.ContextVar[int | None] = contextvars.ContextVar("update_id", default=None)
+telegram_id_var: contextvars.ContextVar[int | None] = contextvars.ContextVar("telegram_id", default=None)
+handler_var: contextvars.ContextVar[str | None] = contextvars.ContextVar("handler", default=None)
+
+# Стандартные атрибуты LogRecord — всё остальное считается полями из extra
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+
+class ContextFilter(logging.Filter):
+    """
+    Проставляет поля корреляции и сэмплирует DEBUG. Работает в вызывающем
+    потоке, пока contextvars ещё видны.
+    """
+
+    def __init__(self, debug_sample_rate: float = 1.0) -> None:
+        super().__init__()
+        self.debug_sample_rate = debug_sample_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno <= logging.DEBUG and self.debug_sample_rate < 1.0:
+            if random.random() >= self.debug_sample_rate:
+                return False
+        record.update_id = update_id_var.get()
+        record.telegram_id = telegram_id_var.get()
+        record.handler = handler_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Одна запись — одна JSON-строка. Длинные строковые поля обрезаются,
+    чтобы в лог не уезжали целые payload-ы.
+    """
+
+    def __init__(self, max_field_chars: int = 2000) -> None:
+        super().__init__()
+        self.max_field_chars = max_field_chars
+
+    def _clip(self, value: Any) -> Any:
+        if not isinstance(value, (str, int, float, bool, type(None))):
+            value = json.dumps(value, ensure_ascii=False, default=str)
+        if isinstance(value, str) and len(value) > self.max_field_chars:
+            return value[: self.max_field_chars] + f"...(+{len(value) - self.max_field_chars})"
+        return value
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: dict[str, Any] = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created))
+            + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": self._clip(record.getMessage()),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and value is not None:
+                entry[key] = self._clip(value)
+        if record.exc_info:
+            entry["exc"] = self._clip(self.formatException(record.exc_info))
+        elif record.exc_text:
+            entry["exc"] = self._clip(record.exc_text)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler, который не ждёт место в очереди, а отбрасывает запись.
+    """
+
+    def __init__(self, log_queue: queue.Queue) -> None:
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # сообщение подставляем здесь (аргументы могут измениться после вызова),
+        # а JSON собирает уже поток слушателя
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener: logging.handlers.QueueListener | None = None
+_queue_handler: DroppingQueueHandler | None = None
+
+
+def setup_logging(
+    level: str = "INFO",
+    *,
+    debug_sample_rate: float = 1.0,
+    queue_size: int = 10000,
+    max_field_chars: int = 2000,
+) -> None:
+    """
+    Переключает корневой логгер на очередь с JSON-выводом в stdout.
+    """
+    global _listener, _queue_handler
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter(max_field_chars=max_field_chars))
+
+    log_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    _queue_handler = DroppingQueueHandler(log_queue)
+    _queue_handler.addFilter(ContextFilter(debug_sample_rate))
+
+    root = logging.getLogger()
+    root.handlers[:] = [_queue_handler]
+    root.setLevel(level.upper())
+
+    _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=False)
+    _listener.start()
+
+
+def shutdown_logging() -> None:
+    """
+    Дописывает очередь и останавливает поток вывода.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def dropped_records() -> int:
+    return _queue_handler.dropped if _queue_handler is not None else 0
+
+
+class LogContextMiddleware(BaseMiddleware):
+    """
+    Выставляет поля корреляции логов на время обработки апдейта.
+
+    Как outer-middleware на dp.update заполняет update_id и telegram_id,
+    как inner-middleware на роутерах событий — имя хендлера.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        tokens = []
+        if isinstance(event, Update):
+            tokens.append((update_id_var, update_id_var.set(event.update_id)))
+            user = data.get("event_from_user")
+            if user is not None:
+                tokens.append((telegram_id_var, telegram_id_var.set(user.id)))
+        handler_obj = data.get("handler")
+        if handler_obj is not None:
+            name = getattr(handler_obj.callback, "__name__", None)
+            tokens.append((handler_var, handler_var.set(name)))
+        try:
+            return await handler(event, data)
+        finally:
+            for var, token in reversed(tokens):
+                var.reset(token)
@@ -0,0 +1,411 @@
+"""
+Метрики бота в текстовом формате Prometheus.
+
+Небольшой реестр без внешних зависимостей: счётчики, гистограммы,
+гейджи и гейджи-коллбэки, которые считаются в момент скрейпа (размеры
+кэшей, очередей и т.п.), а также счётчики-коллбэки для накопительных
+значений, которые ведут сами компоненты. Отдаётся HTTP-эндпоинтом /metrics.
+"""
+import bisect
+import logging
+import time
+from typing import Any, Awaitable, Callable, Iterable
+
+from aiohttp import web
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+from callback_codec import codec as callback_codec
+
+LabelValues = tuple[str, ...]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+logger = logging.getLogger(__name__)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+
+    def _key(self, labels: tuple) -> LabelValues:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name}: expected labels {self.labelnames}, got {labels}")
+        return tuple(str(v) for v in labels)
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()) -> None:
+        super().__init__(name, help_text, labelnames)
+        self._values: dict[LabelValues, float] = {}
+
+    def inc(self, *labels: Any, amount: float = 1) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, *labels: Any) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> Iterable[str]:
+        for key, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()) -> None:
+        super().__init__(name, help_text, labelnames)
+        self._values: dict[LabelValues, float] = {}
+
+    def set(self, *labels: Any, value: float) -> None:
+        self._values[self._key(labels)] = value
+
+    def inc(self, *labels: Any, amount: float = 1) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, *labels: Any, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def samples(self) -> Iterable[str]:
+        for key, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class CallbackGauge(_Metric):
+    """
+    Гейдж, значения которого берутся из fn() в момент скрейпа:
+    fn возвращает {кортеж значений меток: число}.
+    """
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        fn: Callable[[], dict[LabelValues, float]],
+        labelnames: tuple[str, ...] = (),
+    ) -> None:
+        super().__init__(name, help_text, labelnames)
+        self._fn = fn
+
+    def samples(self) -> Iterable[str]:
+        try:
+            values = self._fn()
+        except Exception as e:
+            logger.error("Error collecting metric %s: %s", self.name, e)
+            return
+        for key, value in values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class CallbackCounter(CallbackGauge):
+    """
+    Счётчик, значения которого берутся из fn() в момент скрейпа: для
+    накопительных значений, которые компонент считает сам. В отличие от
+    гейджа, rate()/increase() корректно переживают сброс при рестарте.
+    """
+
+    kind = "counter"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        fn: Callable[[], dict[LabelValues, float]],
+        labelnames: tuple[str, ...] = (),
+    ) -> None:
+        if not name.endswith("_total"):
+            raise ValueError(f"Counter name {name!r} must end with _total")
+        super().__init__(name, help_text, fn, labelnames)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [счётчики по бакетам (не накопительные) + переполнение, sum, count]
+        self._values: dict[LabelValues, list] = {}
+
+    def observe(self, *labels: Any, value: float) -> None:
+        key = self._key(labels)
+        entry = self._values.get(key)
+        if entry is None:
+            entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def quantile(self, q: float, *labels: Any) -> float | None:
+        """
+        Оценка квантиля по бакетам (верхняя граница бакета, как в histogram_quantile).
+        """
+        entry = self._values.get(self._key(labels))
+        if entry is None or not entry[2]:
+            return None
+        rank = q * entry[2]
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), entry[0]):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def samples(self) -> Iterable[str]:
+        for key, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {count}"
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, _Metric] = {}
+
+    def _add(self, metric: _Metric) -> Any:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        return self._add(Counter(name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()) -> Gauge:
+        return self._add(Gauge(name, help_text, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._add(Histogram(name, help_text, labelnames, buckets))
+
+    def callback_gauge(
+        self,
+        name: str,
+        help_text: str,
+        fn: Callable[[], dict[LabelValues, float]],
+        labelnames: tuple[str, ...] = (),
+    ) -> CallbackGauge:
+        return self._add(CallbackGauge(name, help_text, fn, labelnames))
+
+    def callback_counter(
+        self,
+        name: str,
+        help_text: str,
+        fn: Callable[[], dict[LabelValues, float]],
+        labelnames: tuple[str, ...] = (),
+    ) -> CallbackCounter:
+        return self._add(CallbackCounter(name, help_text, fn, labelnames))
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+registry = Registry()
+
+handler_duration = registry.histogram(
+    "bot_handler_duration_seconds",
+    "Handler latency, including FSM commit",
+    ("handler", "route"),
+)
+handler_errors = registry.counter(
+    "bot_handler_errors_total",
+    "Exceptions raised by handlers",
+    ("handler", "route", "exception"),
+)
+handler_in_flight = registry.gauge(
+    "bot_handler_in_flight",
+    "Handlers currently running",
+    ("handler",),
+)
+callback_dispatch_duration = registry.histogram(
+    "bot_callback_dispatch_seconds",
+    "Time to find the handler and decode callback_data in the callback router",
+    ("match",),
+    buckets=(1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 1e-3),
+)
+callback_unrouted = registry.counter(
+    "bot_callback_unrouted_total",
+    "Callbacks whose callback_data matched no route or failed to decode",
+    ("route",),
+)
+
+
+class BackendMetrics:
+    """
+    Метрики вызовов backend-а для BackendClient(instrumentation=...).
+    """
+
+    QUANTILES = (0.5, 0.9, 0.99)
+
+    def __init__(self, reg: Registry) -> None:
+        labels = ("method", "endpoint")
+        self.duration = reg.histogram(
+            "backend_request_duration_seconds", "Backend call latency", labels
+        )
+        self.responses = reg.counter(
+            "backend_responses_total",
+            "Backend calls by outcome: HTTP status, timeout or error",
+            labels + ("status",),
+        )
+        self.request_bytes = reg.counter(
+            "backend_request_bytes_total", "Request body bytes sent to the backend", labels
+        )
+        self.response_bytes = reg.counter(
+            "backend_response_bytes_total", "Response body bytes received from the backend", labels
+        )
+        self.retries = reg.counter("backend_retries_total", "Repeated backend calls", labels)
+        self.hedges = reg.counter(
+            "backend_hedged_requests_total",
+            "Hedged reads by result: won (the hedge answered first), lost or failed",
+            labels + ("result",),
+        )
+        reg.callback_gauge(
+            "backend_request_duration_quantile_seconds",
+            "Backend latency quantiles estimated from the histogram buckets",
+            self._quantiles,
+            labels + ("quantile",),
+        )
+
+    def observe(
+        self,
+        method: str,
+        endpoint: str,
+        status: str,
+        duration: float,
+        request_bytes: int,
+        response_bytes: int,
+    ) -> None:
+        self.duration.observe(method, endpoint, value=duration)
+        self.responses.inc(method, endpoint, status)
+        if request_bytes:
+            self.request_bytes.inc(method, endpoint, amount=request_bytes)
+        if response_bytes:
+            self.response_bytes.inc(method, endpoint, amount=response_bytes)
+
+    def retry(self, method: str, endpoint: str) -> None:
+        self.retries.inc(method, endpoint)
+
+    def hedge(self, method: str, endpoint: str, result: str) -> None:
+        self.hedges.inc(method, endpoint, result)
+
+    def _quantiles(self) -> dict[LabelValues, float]:
+        values = {}
+        for key in list(self.duration._values):
+            for q in self.QUANTILES:
+                values[key + (str(q),)] = self.duration.quantile(q, *key)
+        return values
+
+
+backend_metrics = BackendMetrics(registry)
+
+
+def event_route(event: TelegramObject) -> str:
+    """
+    Метка маршрута: префикс callback_data до ':' (для компактной — имя по
+    opcode) или команда сообщения. Аргументы (id задач, страницы)
+    отбрасываются, чтобы не раздувать число серий.
+    """
+    if isinstance(event, CallbackQuery):
+        return "cb:" + callback_codec.route(event.data or "")
+    if isinstance(event, Message):
+        text = event.text or ""
+        if text.startswith("/"):
+            return text.split(maxsplit=1)[0].split("@", 1)[0]
+        return "message"
+    return type(event).__name__
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """
+    Inner-middleware: время выполнения, ошибки и число одновременно
+    работающих хендлеров. Регистрировать раньше FSMSessionMiddleware,
+    чтобы в латентность попадал и коммит FSM.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        handler_obj = data.get("handler")
+        name = getattr(getattr(handler_obj, "callback", None), "__name__", "unknown")
+        route = event_route(event)
+
+        handler_in_flight.inc(name)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            handler_errors.inc(name, route, type(e).__name__)
+            raise
+        finally:
+            handler_duration.observe(name, route, value=time.perf_counter() - started)
+            handler_in_flight.dec(name)
+
+
+async def start_metrics_server(host: str, port: int, reg: Registry = registry) -> web.AppRunner:
+    """
+    Поднимает отдельный HTTP-сервер с /metrics; остановка — runner.cleanup().
+    """
+
+    async def metrics(request: web.Request) -> web.Response:
+        return web.Response(text=reg.render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host=host, port=port).start()
+    return runner
@@ -0,0 +1,44 @@
+"""
+Middleware диспетчера бота.
+"""
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.fsm.context import FSMContext
+from aiogram.types import TelegramObject
+
+from storage import StateSession
+
+
+class FSMSessionMiddleware(BaseMiddleware):
+    """
+    Подменяет FSMContext хендлера на буферизованный StateSession.
+
+    Хендлер читает и пишет FSM в памяти; после успешного завершения
+    изменения коммитятся в хранилище, при исключении — отбрасываются
+    (кроме ключей keep_on_rollback, см. StateSession).
+    Регистрируется как inner-middleware, то есть после фильтров.
+    """
+
+    def __init__(self, keep_on_rollback: tuple[str, ...] = ()) -> None:
+        self.keep_on_rollback = keep_on_rollback
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        state: FSMContext | None = data.get("state")
+        if state is None:
+            return await handler(event, data)
+
+        session = StateSession(state.storage, keep_on_rollback=self.keep_on_rollback)
+        data["state"] = FSMContext(storage=session, key=state.key)
+        try:
+            result = await handler(event, data)
+        except BaseException:
+            await session.rollback()
+            raise
+        await session.commit()
+        return result
@@ -0,0 +1,258 @@
+"""
+Исходящий планировщик запросов к Telegram Bot API.
+
+Telegram ограничивает частоту отправки: порядка 30 сообщений в секунду на
+бота в целом и около одного сообщения в секунду в один чат (в группах —
+20 в минуту). При превышении приходит 429 с retry_after, и весь чат
+замирает на это время. OutboundScheduler встаёт в цепочку request-middleware
+сессии Bot и выпускает запросы так, чтобы в лимиты не упираться:
+
+* глобальное token bucket на все запросы с chat_id, выдаётся по приоритету;
+* token bucket на чат для отправки новых сообщений, порядок внутри чата — FIFO;
+* на 429 чат ставится на паузу на retry_after, запрос повторяется сам.
+"""
+import asyncio
+import contextvars
+import heapq
+import itertools
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import DeleteMessage, DeleteMessages, Response, TelegramMethod
+
+# Чем меньше число, тем раньше запрос получит токен глобального лимита
+PRIORITY_INTERACTIVE = 0  # ответы на действия пользователя
+PRIORITY_CLEANUP = 1  # удаление старых экранов
+PRIORITY_BULK = 2  # фоновые уведомления и рассылки
+
+_priority_override: contextvars.ContextVar[int | None] = contextvars.ContextVar(
+    "outbound_priority", default=None
+)
+
+
+@contextmanager
+def outbound_priority(priority: int) -> Iterator[None]:
+    """
+    Задаёт приоритет исходящих запросов внутри блока (и в задачах, созданных в нём).
+    """
+    token = _priority_override.set(priority)
+    try:
+        yield
+    finally:
+        _priority_override.reset(token)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self.tokens = capacity
+        self.updated_at = clock()
+
+    def _refill(self) -> float:
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        return now
+
+    def try_acquire(self) -> float:
+        """
+        Забирает токен и возвращает 0, либо возвращает, сколько секунд ждать.
+        """
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def refund(self) -> None:
+        """
+        Возвращает неиспользованный токен, не переполняя ведро.
+        """
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+    def full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+
+class _ChatLane:
+    __slots__ = ("bucket", "lock", "waiters", "paused_until")
+
+    def __init__(self, bucket: TokenBucket) -> None:
+        self.bucket = bucket
+        self.lock = asyncio.Lock()
+        self.waiters = 0
+        self.paused_until = 0.0
+
+
+class OutboundScheduler(BaseRequestMiddleware):
+    """
+    Request-middleware сессии Bot: держит исходящие запросы в лимитах Telegram.
+
+    Запросы без chat_id (answerCallbackQuery, getMe, setWebhook и т.п.)
+    проходят без очереди. Методы send*/copy*/forward* дополнительно ждут
+    токен своего чата. Приоритет по умолчанию зависит от метода, его можно
+    переопределить через outbound_priority().
+    """
+
+    PRUNE_EVERY = 1000
+
+    def __init__(
+        self,
+        *,
+        global_rate: float = 30.0,
+        global_burst: float = 30.0,
+        private_chat_rate: float = 1.0,
+        group_chat_rate: float = 20 / 60,
+        chat_burst: float = 5.0,
+        max_retries: int = 3,
+    ) -> None:
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.private_chat_rate = private_chat_rate
+        self.group_chat_rate = group_chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+
+        self._lanes: dict[int | str, _ChatLane] = {}
+        self._queue: list[tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._arbiter: asyncio.Task | None = None
+        self._acquired = 0
+
+        self.sent = 0
+        self.retry_after_hits = 0
+        self.max_queue_depth = 0
+
+    # --- классификация ---
+
+    @staticmethod
+    def _is_send(method: TelegramMethod) -> bool:
+        name = method.__api_method__
+        return name.startswith(("send", "copy", "forward"))
+
+    @staticmethod
+    def _priority(method: TelegramMethod) -> int:
+        override = _priority_override.get()
+        if override is not None:
+            return override
+        if isinstance(method, (DeleteMessage, DeleteMessages)):
+            return PRIORITY_CLEANUP
+        return PRIORITY_INTERACTIVE
+
+    # --- лимит на чат ---
+
+    def _lane(self, chat_id: int | str) -> _ChatLane:
+        lane = self._lanes.get(chat_id)
+        if lane is None:
+            is_group = isinstance(chat_id, str) or chat_id < 0
+            rate = self.group_chat_rate if is_group else self.private_chat_rate
+            lane = self._lanes[chat_id] = _ChatLane(TokenBucket(rate, self.chat_burst))
+        return lane
+
+    def _prune_lanes(self) -> None:
+        now = time.monotonic()
+        idle = [
+            chat_id
+            for chat_id, lane in self._lanes.items()
+            if lane.waiters == 0 and lane.paused_until <= now and lane.bucket.full()
+        ]
+        for chat_id in idle:
+            del self._lanes[chat_id]
+
+    async def _acquire_chat(self, lane: _ChatLane, *, take_token: bool) -> None:
+        while True:
+            delay = lane.paused_until - time.monotonic()
+            if delay <= 0 and take_token:
+                delay = lane.bucket.try_acquire()
+            if delay <= 0:
+                return
+            await asyncio.sleep(delay)
+
+    # --- глобальный лимит ---
+
+    async def _acquire_global(self, priority: int) -> None:
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._seq), future))
+        self.max_queue_depth = max(self.max_queue_depth, len(self._queue))
+        if self._arbiter is None or self._arbiter.done():
+            self._arbiter = asyncio.create_task(self._run_arbiter())
+        await future
+
+    async def _run_arbiter(self) -> None:
+        while self._queue:
+            delay = self.global_bucket.try_acquire()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            while self._queue:
+                _, _, future = heapq.heappop(self._queue)
+                if not future.done():
+                    future.set_result(None)
+                    break
+            else:
+                # токен достался отменённым ожидающим — вернём его
+                self.global_bucket.refund()
+
+    # --- middleware ---
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType,
+        bot: Bot,
+        method: TelegramMethod,
+    ) -> Response:
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            return await make_request(bot, method)
+
+        self._acquired += 1
+        if self._acquired % self.PRUNE_EVERY == 0:
+            self._prune_lanes()
+
+        lane = self._lane(chat_id)
+        priority = self._priority(method)
+        take_chat_token = self._is_send(method)
+        attempt = 0
+        while True:
+            lane.waiters += 1
+            try:
+                async with lane.lock:
+                    await self._acquire_chat(lane, take_token=take_chat_token)
+                    await self._acquire_global(priority)
+            finally:
+                lane.waiters -= 1
+
+            try:
+                response = await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self.retry_after_hits += 1
+                lane.paused_until = max(lane.paused_until, time.monotonic() + e.retry_after)
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                continue
+            self.sent += 1
+            return response
+
+    def stats(self) -> dict[str, Any]:
+        by_priority: dict[int, int] = {}
+        for priority, _, future in self._queue:
+            if not future.done():
+                by_priority[priority] = by_priority.get(priority, 0) + 1
+        now = time.monotonic()
+        return {
+            "global_queue_depth": sum(by_priority.values()),
+            "global_queue_by_priority": by_priority,
+            "max_global_queue_depth": self.max_queue_depth,
+            "chat_waiters": sum(lane.waiters for lane in self._lanes.values()),
+            "chats_tracked": len(self._lanes),
+            "chats_paused": sum(1 for lane in self._lanes.values() if lane.paused_until > now),
+            "sent": self.sent,
+            "retry_after_hits": self.retry_after_hits,
+        }
@@ -0,0 +1,571 @@
+"""
+Запись потока апдейтов в проде и его воспроизведение для поиска регрессий.
+
+Запись (UPDATE_RECORD_PATH в .env): каждый входящий апдейт и каждый ответ
+backend-а пишется строкой JSONL. Идентификаторы пользователей и чатов
+заменяются стабильными псевдонимами (HMAC с солью UPDATE_RECORD_SALT),
+имена и телефоны маскируются, в свободном тексте цифры и буквы
+заменяются с сохранением формы — команды и callback_data остаются как есть.
+Пишет фоновый поток через ограниченную очередь, как и логи (logs.py).
+
+Воспроизведение: апдейты из записи скармливаются диспетчеру из
+front.build_dispatcher() с ускорением --speed (0 — без пауз), с сохранением
+порядка внутри каждого пользователя. Backend подменяется транспортом,
+который отдаёт записанные ответы того же апдейта, Telegram — эмулятором
+в процессе (fake_telegram.py, без HTTP).
+
+    python replay.py run recording.jsonl --speed 20 --json after.json
+    python replay.py compare before.json after.json
+
+compare сравнивает латентность по маршрутам, число вызовов backend-а и
+аллокации и завершается с кодом 1, если что-то ухудшилось сильнее порога.
+"""
+import argparse
+import asyncio
+import collections
+import hashlib
+import hmac
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Awaitable, Callable
+
+import httpx
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import TelegramMethod
+from aiogram.types import TelegramObject, Update
+
+from backend import endpoint_label
+from callback_codec import codec as callback_codec
+from logs import DroppingQueueHandler, update_id_var
+
+# объекты апдейта, описывающие пользователя или чат
+_PERSON_KEYS = {"from", "chat", "user", "sender_chat", "forward_from", "forward_from_chat"}
+_PERSON_TEXT_KEYS = {"first_name", "last_name", "username", "title", "bio"}
+# поля запросов и ответов backend-а
+_ID_KEYS = {"telegram_id", "telegram_chat_id", "chat_id"}
+_SECRET_KEYS = {
+    "username", "first_name", "last_name", "name", "seller_name", "author",
+    "phone", "phone_number", "inn", "email", "code", "session_id",
+}
+_FREE_TEXT_KEYS = {"text", "caption"}
+_WORD = re.compile(r"[^\W\d_]")
+
+
+class Anonymizer:
+    """
+    Детерминированная анонимизация: одно и то же значение всегда даёт один
+    и тот же псевдоним, поэтому связи между апдейтами и вызовами backend-а
+    (telegram_id в запросе = from.id в апдейте) сохраняются.
+    """
+
+    def __init__(self, salt: str | None = None) -> None:
+        self._key = (salt or os.urandom(16).hex()).encode()
+
+    def _digest(self, value: Any) -> str:
+        return hmac.new(self._key, str(value).encode(), hashlib.sha256).hexdigest()
+
+    def user_id(self, value: int) -> int:
+        pseudonym = 10**9 + int(self._digest(value)[:12], 16) % 10**9
+        return -pseudonym if value < 0 else pseudonym
+
+    def secret(self, value: str) -> str:
+        return "anon-" + self._digest(value)[:8]
+
+    def free_text(self, text: str) -> str:
+        # команды оставляем, остальное маскируем с сохранением формы:
+        # номер телефона останется номером, код — кодом
+        if text.startswith("/"):
+            return text.split(maxsplit=1)[0]
+        return _WORD.sub("x", re.sub(r"\d", "5", text))
+
+    def update(self, obj: Any, key: str | None = None) -> Any:
+        if isinstance(obj, dict):
+            result = {}
+            for k, v in obj.items():
+                if k in _PERSON_KEYS and isinstance(v, dict):
+                    result[k] = self._person(v)
+                elif k == "chat_instance":
+                    result[k] = self.secret(v)
+                else:
+                    result[k] = self.update(v, k)
+            return result
+        if isinstance(obj, list):
+            return [self.update(v, key) for v in obj]
+        if isinstance(obj, str) and key in _FREE_TEXT_KEYS:
+            return self.free_text(obj)
+        if isinstance(obj, str) and key in _SECRET_KEYS:
+            return self.secret(obj)
+        return obj
+
+    def _person(self, obj: dict) -> dict:
+        result = self.update({k: v for k, v in obj.items() if k not in _PERSON_TEXT_KEYS and k != "id"})
+        if "id" in obj:
+            result["id"] = self.user_id(obj["id"])
+        for k in _PERSON_TEXT_KEYS & obj.keys():
+            result[k] = self.secret(obj[k])
+        return result
+
+    def payload(self, obj: Any, key: str | None = None) -> Any:
+        if isinstance(obj, dict):
+            return {k: self.payload(v, k) for k, v in obj.items()}
+        if isinstance(obj, list):
+            return [self.payload(v, key) for v in obj]
+        if key in _ID_KEYS and isinstance(obj, int) and not isinstance(obj, bool):
+            return self.user_id(obj)
+        if key in _ID_KEYS and isinstance(obj, str) and obj.lstrip("-").isdigit():
+            return str(self.user_id(int(obj)))
+        if key in _SECRET_KEYS and isinstance(obj, str):
+            return self.secret(obj)
+        return obj
+
+
+class UpdateRecorder(BaseMiddleware):
+    """
+    Outer-middleware на dp.update и recorder для BackendClient одновременно.
+
+    Каждое событие — строка JSONL c полем t (секунды от старта записи):
+    {"kind": "update", "update": ...} или {"kind": "backend", "update_id",
+    "method", "path", "params", "status", "duration", "body"}. Вызовы
+    backend-а вне апдейта (фоновые задачи) пишутся с update_id = null.
+    """
+
+    def __init__(self, path: str, *, salt: str | None = None, queue_size: int = 10000) -> None:
+        self.path = path
+        self.anonymizer = Anonymizer(salt)
+        self.queue_size = queue_size
+        self._started = time.monotonic()
+        self._handler: DroppingQueueHandler | None = None
+        self._listener: logging.handlers.QueueListener | None = None
+        self._file: logging.FileHandler | None = None
+        self._logger = logging.getLogger("replay.recording")
+        self._logger.propagate = False
+        self._logger.setLevel(logging.INFO)
+
+    def start(self) -> None:
+        self._file = logging.FileHandler(self.path, encoding="utf-8")
+        record_queue: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        self._handler = DroppingQueueHandler(record_queue)
+        self._listener = logging.handlers.QueueListener(record_queue, self._file)
+        self._logger.addHandler(self._handler)
+        self._listener.start()
+        self._started = time.monotonic()
+
+    def close(self) -> None:
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+        if self._handler is not None:
+            self._logger.removeHandler(self._handler)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    @property
+    def dropped(self) -> int:
+        return self._handler.dropped if self._handler is not None else 0
+
+    def _write(self, event: dict) -> None:
+        if self._handler is None:
+            return
+        event["t"] = round(time.monotonic() - self._started, 4)
+        self._logger.info(json.dumps(event, ensure_ascii=False, default=str))
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        if isinstance(event, Update):
+            try:
+                raw = event.model_dump(mode="json", exclude_none=True, by_alias=True)
+                self._write({"kind": "update", "update": self.anonymizer.update(raw)})
+            except Exception as e:
+                logging.getLogger(__name__).warning("Failed to record update: %s", e)
+        return await handler(event, data)
+
+    def backend_call(
+        self,
+        method: str,
+        path: str,
+        params: Any,
+        status: str,
+        duration: float,
+        body: bytes | None,
+    ) -> None:
+        parsed: Any = None
+        if body:
+            try:
+                parsed = json.loads(body)
+            except ValueError:
+                parsed = body.decode("utf-8", "replace")
+        self._write(
+            {
+                "kind": "backend",
+                "update_id": update_id_var.get(),
+                "method": method,
+                "path": path,
+                "params": self.anonymizer.payload(params) if params else None,
+                "status": status,
+                "duration": round(duration, 4),
+                "body": self.anonymizer.payload(parsed),
+            }
+        )
+
+
+def load_recording(path: str) -> list[dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class ReplayBackend:
+    """
+    Отдаёт записанные ответы backend-а через httpx.MockTransport.
+
+    Ответ ищется среди вызовов того же апдейта (update_id из contextvar
+    logs.update_id_var) с тем же методом и шаблоном пути, по порядку.
+    Если такого нет (новая версия ходит в backend иначе, или вызов из
+    фоновой задачи), отдаётся последний записанный ответ эндпоинта,
+    а если эндпоинт не встречался — 404.
+    """
+
+    def __init__(self, events: list[dict], *, latency_scale: float = 0.0) -> None:
+        self.latency_scale = latency_scale
+        self._by_update: dict[tuple, collections.deque] = collections.defaultdict(collections.deque)
+        self._latest: dict[tuple, dict] = {}
+        for event in events:
+            if event.get("kind") != "backend":
+                continue
+            endpoint = (event["method"], endpoint_label(event["path"]))
+            self._by_update[(event.get("update_id"),) + endpoint].append(event)
+            self._latest[endpoint] = event
+        self.calls: collections.Counter[str] = collections.Counter()
+        self.unmatched: collections.Counter[str] = collections.Counter()
+
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handle)
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        endpoint = (request.method, endpoint_label(request.url.path))
+        label = " ".join(endpoint)
+        self.calls[label] += 1
+
+        recorded = self._by_update.get((update_id_var.get(),) + endpoint)
+        if recorded:
+            event = recorded.popleft()
+        else:
+            event = self._latest.get(endpoint)
+            self.unmatched[label] += 1
+            if event is None:
+                return httpx.Response(404, json={"detail": "not recorded"}, request=request)
+
+        if self.latency_scale and event.get("duration"):
+            await asyncio.sleep(event["duration"] * self.latency_scale)
+
+        status = event["status"]
+        if status == "timeout":
+            raise httpx.ReadTimeout("recorded timeout", request=request)
+        if status == "error":
+            raise httpx.ConnectError("recorded error", request=request)
+        body = event.get("body")
+        if body is None:
+            return httpx.Response(int(status), request=request)
+        if isinstance(body, str):
+            return httpx.Response(int(status), text=body, request=request)
+        return httpx.Response(int(status), json=body, request=request)
+
+
+class ReplaySession(BaseSession):
+    """
+    Сессия бота без сети: запросы к Bot API исполняет FakeTelegram
+    в том же процессе, ответ разбирается штатным check_response.
+    """
+
+    def __init__(self, telegram: Any) -> None:
+        super().__init__()
+        self.telegram = telegram
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: int | None = None) -> Any:
+        files: dict = {}
+        params = {}
+        for key, value in method.model_dump(warnings=False).items():
+            value = self.prepare_value(value, bot=bot, files=files)
+            if value:
+                params[key] = value
+        content = json.dumps(self.telegram.call(method.__api_method__, params))
+        response = self.check_response(bot=bot, method=method, status_code=200, content=content)
+        return response.result
+
+    async def stream_content(self, url: str, headers: dict | None = None, timeout: int = 30,
+                             chunk_size: int = 65536, raise_for_status: bool = True):
+        raise NotImplementedError("ReplaySession does not download files")
+        yield b""  # pragma: no cover
+
+    async def close(self) -> None:
+        pass
+
+
+def update_route(update: dict) -> str:
+    """
+    Та же метка маршрута, что metrics.event_route, но по сырому апдейту.
+    """
+    if "callback_query" in update:
+        return "cb:" + callback_codec.route(update["callback_query"].get("data") or "")
+    message = update.get("message")
+    if message is not None:
+        text = message.get("text") or ""
+        if text.startswith("/"):
+            return text.split(maxsplit=1)[0].split("@", 1)[0]
+        return "message"
+    return next((k for k in update if k != "update_id"), "unknown")
+
+
+def update_user(update: dict) -> int | None:
+    for value in update.values():
+        if isinstance(value, dict) and isinstance(value.get("from"), dict):
+            return value["from"].get("id")
+    return None
+
+
+async def replay(
+    path: str,
+    *,
+    speed: float = 0.0,
+    latency_scale: float = 0.0,
+    trace_allocations: bool = True,
+    top_allocations: int = 15,
+    jobs_timeout: float = 30.0,
+) -> dict:
+    from bench import configure_env, max_rss_mb, percentile, wait_jobs
+    from fake_telegram import FakeTelegram
+
+    events = load_recording(path)
+    updates = [e for e in events if e.get("kind") == "update"]
+    mock = ReplayBackend(events, latency_scale=latency_scale)
+
+    workdir = tempfile.TemporaryDirectory(prefix="replay-")
+    configure_env("http://backend.replay", workdir.name)
+    os.environ.pop("UPDATE_RECORD_PATH", None)
+    import front
+
+    front.setup_logging(front.LOG_LEVEL, queue_size=front.LOG_QUEUE_SIZE)
+    front.backend.transport = mock.transport()
+    telegram = FakeTelegram(strict=False)
+    bot = Bot(front.BOT_TOKEN, session=ReplaySession(telegram))
+    bot.session.middleware(front.shed_guard)
+    dp = front.build_dispatcher()
+    front.register_jobs(bot)
+
+    latencies: dict[str, list[float]] = collections.defaultdict(list)
+    errors: collections.Counter[str] = collections.Counter()
+    await front.backend.open()
+    await front.job_queue.start()
+    try:
+        try:
+            await front.warehouse_catalog.load()
+        except Exception as e:
+            logging.getLogger(__name__).warning("Error preloading warehouses catalog: %s", e)
+
+        async def feed(update: dict, previous: asyncio.Task | None) -> None:
+            if previous is not None:
+                await asyncio.gather(previous, return_exceptions=True)
+            route = update_route(update)
+            started = time.perf_counter()
+            try:
+                await dp.feed_raw_update(bot, update)
+            except Exception as e:
+                errors[f"{route}: {type(e).__name__}"] += 1
+            finally:
+                latencies[route].append(time.perf_counter() - started)
+
+        if trace_allocations:
+            tracemalloc.start()
+            before = tracemalloc.take_snapshot()
+        rss_before = max_rss_mb()
+        started = time.perf_counter()
+        last_by_user: dict[int | None, asyncio.Task] = {}
+        tasks = []
+        for event in updates:
+            if speed:
+                delay = event["t"] / speed - (time.perf_counter() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            user = update_user(event["update"])
+            task = asyncio.create_task(feed(event["update"], last_by_user.get(user)))
+            last_by_user[user] = task
+            tasks.append(task)
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+        # фоновые задачи (автобронь) тоже ходят в backend — дожидаемся их
+        jobs = await wait_jobs(front, jobs_timeout)
+
+        allocations = None
+        if trace_allocations:
+            after = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            diff = after.compare_to(before, "lineno")
+            allocations = {
+                "peak_mb": round(peak / (1024 * 1024), 2),
+                "retained_mb": round(sum(s.size_diff for s in diff) / (1024 * 1024), 2),
+                "retained_blocks": sum(s.count_diff for s in diff),
+                "top": [
+                    {
+                        "where": f"{s.traceback[0].filename}:{s.traceback[0].lineno}",
+                        "size_kb": round(s.size_diff / 1024, 1),
+                        "blocks": s.count_diff,
+                    }
+                    for s in diff[:top_allocations]
+                ],
+            }
+    finally:
+        await front.supplies_load_tracker.stop()
+        await front.job_queue.stop()
+        await front.backend.aclose()
+        await bot.session.close()
+        await dp.storage.close()
+        front.shutdown_logging()
+        workdir.cleanup()
+
+    all_latencies = sorted(itertools.chain.from_iterable(latencies.values()))
+    routes = {}
+    for route, values in sorted(latencies.items()):
+        values.sort()
+        routes[route] = {
+            "count": len(values),
+            "p50_ms": round(percentile(values, 0.5) * 1000, 2),
+            "p99_ms": round(percentile(values, 0.99) * 1000, 2),
+            "max_ms": round(values[-1] * 1000, 2),
+        }
+    return {
+        "recording": path,
+        "speed": speed,
+        "updates": len(all_latencies),
+        "elapsed_s": round(elapsed, 3),
+        "updates_per_s": round(len(all_latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(all_latencies, 0.5) * 1000, 2),
+        "p99_ms": round(percentile(all_latencies, 0.99) * 1000, 2),
+        "errors": dict(errors),
+        "routes": routes,
+        "backend_calls": dict(mock.calls),
+        "backend_unmatched": dict(mock.unmatched),
+        "telegram_calls": dict(telegram.calls),
+        "jobs": jobs,
+        "allocations": allocations,
+        "rss_growth_mb": round(max_rss_mb() - rss_before, 1),
+    }
+
+
+def compare(before: dict, after: dict, *, threshold: float = 0.2, min_count: int = 20) -> list[str]:
+    """
+    Возвращает список регрессий: латентность (общая и по маршрутам с
+    достаточным числом апдейтов) и пик аллокаций выросли больше чем на
+    threshold, любой эндпоинт backend-а стали вызывать чаще.
+    """
+    regressions = []
+
+    def check(name: str, old: float | None, new: float | None) -> None:
+        if old and new is not None and new > old * (1 + threshold):
+            regressions.append(f"{name}: {old} -> {new} (+{(new / old - 1) * 100:.0f}%)")
+
+    check("p50_ms", before["p50_ms"], after["p50_ms"])
+    check("p99_ms", before["p99_ms"], after["p99_ms"])
+    for route, old in before["routes"].items():
+        new = after["routes"].get(route)
+        if new and old["count"] >= min_count and new["count"] >= min_count:
+            check(f"{route} p99_ms", old["p99_ms"], new["p99_ms"])
+    for endpoint in sorted(set(before["backend_calls"]) | set(after["backend_calls"])):
+        old_calls = before["backend_calls"].get(endpoint, 0)
+        new_calls = after["backend_calls"].get(endpoint, 0)
+        if new_calls > old_calls:
+            regressions.append(f"backend {endpoint}: {old_calls} -> {new_calls} calls")
+    if before.get("allocations") and after.get("allocations"):
+        check("allocations peak_mb", before["allocations"]["peak_mb"], after["allocations"]["peak_mb"])
+    return regressions
+
+
+def print_report(result: dict) -> None:
+    print(
+        f"{result['recording']}: {result['updates']} updates in {result['elapsed_s']}s "
+        f"-> {result['updates_per_s']} updates/s (speed={result['speed'] or 'max'})\n"
+        f"latency p50={result['p50_ms']}ms p99={result['p99_ms']}ms errors={result['errors']}"
+    )
+    print(f"\n{'route':<32}{'count':>8}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for route, row in result["routes"].items():
+        print(f"{route:<32}{row['count']:>8}{row['p50_ms']:>10}{row['p99_ms']:>10}{row['max_ms']:>10}")
+    print(f"\nbackend calls: {result['backend_calls']}")
+    if result["backend_unmatched"]:
+        print(f"backend calls without a recorded response of the same update: {result['backend_unmatched']}")
+    print(f"telegram calls: {result['telegram_calls']}")
+    allocations = result["allocations"]
+    if allocations:
+        print(
+            f"\nallocations: peak={allocations['peak_mb']}MB retained={allocations['retained_mb']}MB "
+            f"({allocations['retained_blocks']} blocks)"
+        )
+        for row in allocations["top"]:
+            print(f"  {row['size_kb']:>10} KB {row['blocks']:>8}  {row['where']}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="проиграть запись")
+    run_parser.add_argument("recording")
+    run_parser.add_argument("--speed", type=float, default=0.0, help="ускорение относительно записи; 0 — без пауз")
+    run_parser.add_argument(
+        "--backend-latency",
+        type=float,
+        default=0.0,
+        help="доля записанной латентности backend-а, которую воспроизводить (1 — как в записи)",
+    )
+    run_parser.add_argument("--no-tracemalloc", action="store_true", help="не считать аллокации")
+    run_parser.add_argument("--json", dest="json_path", help="сохранить результат для compare")
+
+    compare_parser = commands.add_parser("compare", help="сравнить два результата run --json")
+    compare_parser.add_argument("before")
+    compare_parser.add_argument("after")
+    compare_parser.add_argument("--threshold", type=float, default=0.2, help="допустимый рост, доля")
+    compare_parser.add_argument("--min-count", type=int, default=20, help="минимум апдейтов маршрута")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        result = asyncio.run(
+            replay(
+                args.recording,
+                speed=args.speed,
+                latency_scale=args.backend_latency,
+                trace_allocations=not args.no_tracemalloc,
+            )
+        )
+        print_report(result)
+        if args.json_path:
+            with open(args.json_path, "w", encoding="utf-8") as f:
+                json.dump(result, f, ensure_ascii=False, indent=2)
+        return
+
+    with open(args.before, encoding="utf-8") as f:
+        before = json.load(f)
+    with open(args.after, encoding="utf-8") as f:
+        after = json.load(f)
+    regressions = compare(before, after, threshold=args.threshold, min_count=args.min_count)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    if not regressions:
+        print("no regressions")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Маршрутизация callback-ов по callback_data без линейного перебора фильтров.
+
+Вместо сотни хендлеров с F.data.startswith(...) / F.data == ... на
+dp.callback_query регистрируется один, а нужный хендлер ищется по
+точному совпадению (dict) или по самому длинному префиксу (trie).
+Повторная регистрация того же маршрута — ошибка при старте.
+
+Кнопки с аргументами регистрируются через typed(): компактная
+callback_data (callback_codec.py) и старая строка "prefix:args"
+разбираются здесь один раз, а хендлер получает готовый объект в
+callback_args. Неразборчивые и устаревшие кнопки уходят в хендлер
+invalid, а не в хендлер маршрута.
+
+Найденный хендлер подставляется в data["handler"], поэтому middleware
+(метрики, логи) видят настоящее имя хендлера, а не диспетчер.
+"""
+import time
+from typing import Any, Callable, NamedTuple
+
+from aiogram.dispatcher.event.handler import HandlerObject
+from aiogram.dispatcher.event.telegram import TelegramEventObserver
+from aiogram.types import CallbackQuery
+
+from callback_codec import MARK, CallbackCodec, codec as default_codec
+from metrics import callback_dispatch_duration, callback_unrouted
+
+_HANDLER = object()  # ключ узла trie, под которым лежит маршрут префикса
+UNKNOWN_ROUTE = "~unknown"  # метка bot_callback_unrouted_total для строк без маршрута
+
+
+class _Route(NamedTuple):
+    handler: HandlerObject
+    prefix: str
+    args_type: type | None = None
+
+
+class Resolved(NamedTuple):
+    handler: HandlerObject | None
+    match: str  # exact, prefix, packed, invalid или miss
+    args: Any = None
+
+
+class CallbackRouter:
+    def __init__(
+        self,
+        codec: CallbackCodec = default_codec,
+        invalid: Callable[..., Any] | None = None,
+    ) -> None:
+        self.codec = codec
+        self._exact: dict[str, HandlerObject] = {}
+        self._trie: dict[Any, Any] = {}
+        self._typed: dict[type, HandlerObject] = {}
+        self._prefixes = 0
+        self._invalid = HandlerObject(callback=invalid) if invalid is not None else None
+
+    def exact(self, data: str, handler: Callable[..., Any]) -> None:
+        if data in self._exact:
+            raise ValueError(
+                f"callback_data {data!r} is already routed to {self._exact[data].callback.__name__}"
+            )
+        self._exact[data] = HandlerObject(callback=handler)
+
+    def prefix(self, prefix: str, handler: Callable[..., Any]) -> None:
+        self._add_prefix(_Route(HandlerObject(callback=handler), prefix))
+
+    def typed(self, args_type: type, handler: Callable[..., Any]) -> None:
+        """
+        Маршрут кнопки с аргументами: по opcode компактной строки и по
+        legacy-префиксу старой. Хендлер получает args_type в callback_args.
+        """
+        if args_type in self._typed:
+            raise ValueError(
+                f"{args_type.__name__} is already routed to {self._typed[args_type].callback.__name__}"
+            )
+        spec = self.codec.spec(args_type)
+        handler_obj = HandlerObject(callback=handler)
+        self._typed[args_type] = handler_obj
+        self._add_prefix(_Route(handler_obj, spec.legacy, args_type))
+
+    def _add_prefix(self, route: _Route) -> None:
+        if not route.prefix:
+            raise ValueError("Empty callback prefix")
+        if route.prefix.startswith(MARK):
+            raise ValueError(f"callback prefix {route.prefix!r} collides with packed callback_data")
+        node = self._trie
+        for char in route.prefix:
+            node = node.setdefault(char, {})
+        if _HANDLER in node:
+            raise ValueError(
+                f"callback prefix {route.prefix!r} is already routed to "
+                f"{node[_HANDLER].handler.callback.__name__}"
+            )
+        node[_HANDLER] = route
+        self._prefixes += 1
+
+    def resolve(self, data: str) -> Resolved:
+        """
+        Хендлер для callback_data, вид совпадения и разобранные аргументы.
+        """
+        if data.startswith(MARK):
+            try:
+                args = self.codec.unpack(data)
+            except ValueError:
+                return Resolved(None, "invalid")
+            handler = self._typed.get(type(args))
+            return Resolved(handler, "packed", args) if handler is not None else Resolved(None, "miss")
+
+        handler = self._exact.get(data)
+        if handler is not None:
+            return Resolved(handler, "exact")
+        node = self._trie
+        route = None
+        for char in data:
+            node = node.get(char)
+            if node is None:
+                break
+            route = node.get(_HANDLER, route)
+        if route is None:
+            return Resolved(None, "miss")
+        if route.args_type is None:
+            return Resolved(route.handler, "prefix")
+        try:
+            args = self.codec.parse_legacy(route.args_type, data[len(route.prefix):])
+        except ValueError:
+            return Resolved(None, "invalid")
+        return Resolved(route.handler, "prefix", args)
+
+    def setup(self, observer: TelegramEventObserver) -> None:
+        observer.register(self._dispatch, self._route)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "exact_routes": len(self._exact),
+            "prefix_routes": self._prefixes,
+            "typed_routes": len(self._typed),
+        }
+
+    async def _route(self, callback: CallbackQuery) -> dict[str, Any] | bool:
+        data = callback.data or ""
+        started = time.perf_counter()
+        resolved = self.resolve(data)
+        callback_dispatch_duration.observe(resolved.match, value=time.perf_counter() - started)
+        if resolved.handler is None:
+            # ни с чем не совпавшая строка — одна метка на все, иначе каждая
+            # устаревшая кнопка с id заводит свою серию
+            label = UNKNOWN_ROUTE if resolved.match == "miss" else self.codec.route(data)
+            callback_unrouted.inc("cb:" + label)
+            if resolved.match == "invalid" and self._invalid is not None:
+                return {"handler": self._invalid}
+            return False
+        if resolved.args is None:
+            return {"handler": resolved.handler}
+        return {"handler": resolved.handler, "callback_args": resolved.args}
+
+    async def _dispatch(self, callback: CallbackQuery, **kwargs: Any) -> Any:
+        return await kwargs["handler"].call(callback, **kwargs)
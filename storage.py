@@ -0,0 +1,307 @@
+"""
+Постоянные FSM-хранилища для aiogram.
+
+MemoryStorage теряет состояние визардов, wh_map, страницы истории и
+ui_message_ids при каждом рестарте и не даёт запустить бота в нескольких
+процессах. Здесь два BaseStorage:
+
+* RedisFSMStorage — поверх любого сервера с Redis-протоколом, для
+  нескольких реплик (нужен пакет redis);
+* SQLiteFSMStorage — файл SQLite в режиме WAL для одной машины.
+
+StateSession копит изменения FSM за один апдейт и сбрасывает их разом
+(см. middlewares.FSMSessionMiddleware).
+
+Данные FSM сериализуются pickle: это быстрее json и сохраняет set-ы,
+которые визарды кладут в состояние. Хранилище должно быть доверенным —
+писать в него может только сам бот.
+"""
+import asyncio
+import pickle
+import sqlite3
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+
+def dumps_data(data: Mapping[str, Any]) -> bytes:
+    return pickle.dumps(dict(data), protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def loads_data(raw: bytes | None) -> dict[str, Any]:
+    if not raw:
+        return {}
+    return pickle.loads(raw)
+
+
+def _state_name(state: StateType) -> str | None:
+    if state is None:
+        return None
+    return state.state if isinstance(state, State) else str(state)
+
+
+class RedisFSMStorage(BaseStorage):
+    """
+    FSM-хранилище в Redis (или совместимом сервере: KeyDB, Dragonfly, Valkey).
+    Состояние и данные лежат в отдельных ключах, как в aiogram.RedisStorage,
+    но данные хранятся в бинарном виде.
+    """
+
+    def __init__(
+        self,
+        redis: Any,
+        *,
+        prefix: str = "fsm",
+        state_ttl: int | None = None,
+        data_ttl: int | None = None,
+    ) -> None:
+        self.redis = redis
+        self.key_builder = DefaultKeyBuilder(prefix=prefix, with_bot_id=True)
+        self.state_ttl = state_ttl
+        self.data_ttl = data_ttl
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs: Any) -> "RedisFSMStorage":
+        try:
+            from redis.asyncio import Redis
+        except ImportError as e:
+            raise RuntimeError("FSM_STORAGE=redis requires the redis package (pip install redis)") from e
+        return cls(Redis.from_url(url), **kwargs)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        redis_key = self.key_builder.build(key, "state")
+        name = _state_name(state)
+        if name is None:
+            await self.redis.delete(redis_key)
+        else:
+            await self.redis.set(redis_key, name, ex=self.state_ttl)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        value = await self.redis.get(self.key_builder.build(key, "state"))
+        if isinstance(value, bytes):
+            return value.decode("utf-8")
+        return value
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        redis_key = self.key_builder.build(key, "data")
+        if not data:
+            await self.redis.delete(redis_key)
+            return
+        await self.redis.set(redis_key, dumps_data(data), ex=self.data_ttl)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        return loads_data(await self.redis.get(self.key_builder.build(key, "data")))
+
+    async def close(self) -> None:
+        await self.redis.aclose()
+
+
+class SQLiteFSMStorage(BaseStorage):
+    """
+    FSM-хранилище в файле SQLite (WAL) для запуска на одной машине.
+
+    sqlite3 синхронный, поэтому все обращения идут через один выделенный
+    поток: event loop не блокируется, а запись в файл остаётся строго
+    последовательной.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fsm-sqlite")
+        self._conn: sqlite3.Connection | None = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS fsm ("
+                " key TEXT PRIMARY KEY,"
+                " state TEXT,"
+                " data BLOB"
+                ")"
+            )
+            self._conn = conn
+        return self._conn
+
+    async def _run(self, fn, *args: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    def _set_state_sync(self, key: str, state: str | None) -> None:
+        self._connection().execute(
+            "INSERT INTO fsm (key, state) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET state = excluded.state",
+            (key, state),
+        )
+
+    def _get_state_sync(self, key: str) -> str | None:
+        row = self._connection().execute("SELECT state FROM fsm WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_data_sync(self, key: str, data: bytes | None) -> None:
+        self._connection().execute(
+            "INSERT INTO fsm (key, data) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET data = excluded.data",
+            (key, data),
+        )
+
+    def _get_data_sync(self, key: str) -> bytes | None:
+        row = self._connection().execute("SELECT data FROM fsm WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _close_sync(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await self._run(self._set_state_sync, self.key_builder.build(key), _state_name(state))
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        return await self._run(self._get_state_sync, self.key_builder.build(key))
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        raw = dumps_data(data) if data else None
+        await self._run(self._set_data_sync, self.key_builder.build(key), raw)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        return loads_data(await self._run(self._get_data_sync, self.key_builder.build(key)))
+
+    async def close(self) -> None:
+        await self._run(self._close_sync)
+        self._executor.shutdown(wait=True)
+
+
+class _SessionEntry:
+    __slots__ = ("state", "state_loaded", "state_dirty", "data", "owned", "dirty", "replaced")
+
+    def __init__(self) -> None:
+        self.state: str | None = None
+        self.state_loaded = False
+        self.state_dirty = False
+        self.data: dict[str, Any] | None = None
+        self.owned = False  # data уже скопирована и её можно менять
+        self.dirty: set[str] = set()
+        self.replaced = False
+
+
+class StateSession(BaseStorage):
+    """
+    Буфер FSM на время обработки одного апдейта.
+
+    Первое чтение ключа идёт в настоящее хранилище, дальше все get/set/update
+    работают с буфером в памяти; копия словаря делается только при первой
+    записи. commit() пишет изменения одним заходом: состояние — если его
+    меняли, данные — только ключи, переданные в update_data, через
+    update_data хранилища, чтобы не затереть то, что за это время записал
+    другой апдейт того же пользователя. Полная перезапись (set_data, clear)
+    отправляется как есть.
+
+    rollback() выбрасывает буфер, кроме ключей keep_on_rollback: в них
+    лежат id сообщений, которые уже отправлены или уже удаляются в фоне,
+    и откат вернул бы в учёт сообщения, которых больше нет.
+    """
+
+    def __init__(self, storage: BaseStorage, *, keep_on_rollback: tuple[str, ...] = ()) -> None:
+        self.storage = storage
+        self.keep_on_rollback = keep_on_rollback
+        self._entries: dict[StorageKey, _SessionEntry] = {}
+
+    def _entry(self, key: StorageKey) -> _SessionEntry:
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = _SessionEntry()
+        return entry
+
+    async def _load_data(self, key: StorageKey, entry: _SessionEntry) -> dict[str, Any]:
+        if entry.data is None:
+            entry.data = await self.storage.get_data(key)
+        return entry.data
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        entry = self._entry(key)
+        entry.state = _state_name(state)
+        entry.state_loaded = True
+        entry.state_dirty = True
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        entry = self._entry(key)
+        if not entry.state_loaded:
+            entry.state = await self.storage.get_state(key)
+            entry.state_loaded = True
+        return entry.state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        entry = self._entry(key)
+        entry.data = dict(data)
+        entry.owned = True
+        entry.replaced = True
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        return (await self._load_data(key, self._entry(key))).copy()
+
+    async def update_data(self, key: StorageKey, data: Mapping[str, Any]) -> dict[str, Any]:
+        entry = self._entry(key)
+        current = await self._load_data(key, entry)
+        if not entry.owned:
+            current = entry.data = dict(current)
+            entry.owned = True
+        current.update(data)
+        entry.dirty.update(data)
+        return current.copy()
+
+    async def _flush(self, key: StorageKey, entry: _SessionEntry, fields: set[str]) -> None:
+        if entry.replaced:
+            await self.storage.set_data(key, entry.data)
+        elif fields:
+            await self.storage.update_data(key, {k: entry.data[k] for k in fields})
+
+    async def commit(self) -> None:
+        entries, self._entries = self._entries, {}
+        for key, entry in entries.items():
+            if entry.state_dirty:
+                await self.storage.set_state(key, entry.state)
+            await self._flush(key, entry, entry.dirty)
+
+    async def rollback(self) -> None:
+        entries, self._entries = self._entries, {}
+        if not self.keep_on_rollback:
+            return
+        for key, entry in entries.items():
+            fields = entry.dirty.intersection(self.keep_on_rollback)
+            if fields:
+                entry.replaced = False
+                await self._flush(key, entry, fields)
+
+    async def close(self) -> None:
+        # закрывает настоящее хранилище сам Dispatcher
+        pass
+
+
+def build_fsm_storage(
+    kind: str,
+    *,
+    redis_url: str | None = None,
+    sqlite_path: str | None = None,
+    state_ttl: int | None = None,
+) -> BaseStorage:
+    """
+    Собирает FSM-хранилище по настройке FSM_STORAGE: memory, redis или sqlite.
+    """
+    kind = (kind or "memory").lower()
+    if kind == "memory":
+        return MemoryStorage()
+    if kind == "redis":
+        if not redis_url:
+            raise RuntimeError("FSM_STORAGE=redis requires FSM_REDIS_URL")
+        return RedisFSMStorage.from_url(redis_url, state_ttl=state_ttl, data_ttl=state_ttl)
+    if kind == "sqlite":
+        return SQLiteFSMStorage(sqlite_path or "fsm.sqlite3")
+    raise RuntimeError(f"Unknown FSM_STORAGE value: {kind!r}")
@@ -0,0 +1,187 @@
+import asyncio
+import os
+import subprocess
+import sys
+
+import pytest
+from aiogram.methods import AnswerCallbackQuery, DeleteMessage, SendMessage
+
+from admission import (
+    HEAVY,
+    READ,
+    WRITE,
+    AdmissionController,
+    AdmissionMiddleware,
+    BackendBusy,
+    EndpointClass,
+    ShedGuard,
+    note_shed,
+    split_limit,
+)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _controller(limit: int = 1, queue: int = 1, queue_timeout: float = 0.05) -> AdmissionController:
+    return AdmissionController(
+        [
+            EndpointClass(READ, 0, limit, queue, queue_timeout, 0.01),
+            EndpointClass(WRITE, 1, limit, queue, queue_timeout, 0.01),
+            EndpointClass(HEAVY, 2, limit, queue, queue_timeout, 0.01),
+        ],
+        total_limit=3 * limit,
+    )
+
+
+def test_class_limits_must_fit_total_limit():
+    with pytest.raises(ValueError):
+        AdmissionController(
+            [
+                EndpointClass(READ, 0, 2, 1, 1.0, 0.1),
+                EndpointClass(WRITE, 1, 2, 1, 1.0, 0.1),
+                EndpointClass(HEAVY, 2, 2, 1, 1.0, 0.1),
+            ],
+            total_limit=5,
+        )
+
+
+@pytest.mark.parametrize("total", [3, 7, 50, 100])
+def test_default_class_limits_fit_the_pool(total):
+    limits = split_limit(total)
+    assert sum(limits.values()) <= total
+    assert min(limits.values()) >= 1
+    controller = AdmissionController(
+        [EndpointClass(name, 0, limit, 10, 1.0, 0.1) for name, limit in limits.items()],
+        total_limit=total,
+    )
+    assert set(controller.stats()) == {READ, WRITE, HEAVY}
+
+
+def test_pool_smaller_than_class_count_is_rejected():
+    with pytest.raises(ValueError):
+        split_limit(2)
+
+
+def test_bot_starts_with_a_smaller_connection_pool(tmp_path):
+    env = dict(os.environ, BOT_TOKEN="x", BACKEND_MAX_CONNECTIONS="10", PYTHONPATH=ROOT)
+    for name in ("BACKEND_READ_LIMIT", "BACKEND_WRITE_LIMIT", "BACKEND_HEAVY_LIMIT"):
+        env.pop(name, None)
+    code = "import front; print(front.BACKEND_READ_LIMIT, front.BACKEND_WRITE_LIMIT, front.BACKEND_HEAVY_LIMIT)"
+    result = subprocess.run([sys.executable, "-c", code], cwd=tmp_path, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split() == ["5", "3", "2"]
+
+
+def test_full_queue_is_shed_immediately():
+    async def main():
+        controller = _controller(queue_timeout=1.0)
+        await controller.acquire(READ)
+        waiter = asyncio.create_task(controller.acquire(READ))
+        await asyncio.sleep(0)
+        with pytest.raises(BackendBusy) as exc:
+            await controller.acquire(READ)
+        controller.release(READ)
+        await waiter
+        controller.release(READ)
+        return exc.value, controller.stats()[READ]
+
+    exc, stats = asyncio.run(main())
+    assert exc.reason == "full" and exc.retry_after > 0
+    assert stats["shed"] == {"queue_full": 1, "deadline": 0}
+    assert stats["in_flight"] == 0
+
+
+def test_waiter_is_shed_after_queue_deadline():
+    async def main():
+        controller = _controller()
+        await controller.acquire(READ)
+        with pytest.raises(BackendBusy) as exc:
+            await controller.acquire(READ)
+        return exc.value, controller.stats()[READ]
+
+    exc, stats = asyncio.run(main())
+    assert exc.reason == "deadline"
+    assert stats["shed"]["deadline"] == 1
+    assert stats["queued"] == 0
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def main():
+        controller = _controller(queue_timeout=1.0)
+        await controller.acquire(READ)
+        waiter = asyncio.create_task(controller.acquire(READ))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        queued = controller.stats()[READ]["queued"]
+        controller.release(READ)
+        # место не ушло отменённому ожидающему
+        await asyncio.wait_for(controller.acquire(READ), 0.1)
+        return queued
+
+    assert asyncio.run(main()) == 0
+
+
+def test_slot_is_released_when_caller_is_cancelled():
+    async def main():
+        controller = _controller()
+        entered = asyncio.Event()
+
+        async def call():
+            async with controller.slot("GET", "/wb/auth/status"):
+                entered.set()
+                await asyncio.sleep(10)
+
+        task = asyncio.create_task(call())
+        await entered.wait()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return controller.stats()[READ]["in_flight"]
+
+    assert asyncio.run(main()) == 0
+
+
+def test_shed_update_shows_only_the_busy_screen():
+    sent = []
+    screens = []
+    guard = ShedGuard()
+
+    async def make_request(bot, method):
+        sent.append(type(method).__name__)
+
+    async def handler(event, data):
+        await guard(make_request, None, AnswerCallbackQuery(callback_query_id="1"))
+        try:
+            note_shed(BackendBusy(READ, "full", 1.0))
+            raise BackendBusy(READ, "full", 1.0)
+        except Exception:
+            # обычный экран ошибки хендлера
+            await guard(make_request, None, DeleteMessage(chat_id=1, message_id=1))
+            await guard(make_request, None, SendMessage(chat_id=1, text="Ошибка"))
+
+    async def on_busy(event, data):
+        screens.append("busy")
+        await guard(make_request, None, SendMessage(chat_id=1, text="busy"))
+
+    asyncio.run(AdmissionMiddleware(on_busy)(handler, object(), {}))
+    assert screens == ["busy"]
+    assert sent == ["AnswerCallbackQuery", "DeleteMessage", "SendMessage"]
+
+
+def test_background_task_of_shed_update_is_not_guarded():
+    sent = []
+    guard = ShedGuard()
+
+    async def make_request(bot, method):
+        sent.append(method.text)
+
+    async def handler(event, data):
+        note_shed(BackendBusy(READ, "full"))
+        task = asyncio.create_task(guard(make_request, None, SendMessage(chat_id=1, text="later")))
+        await asyncio.gather(task, return_exceptions=True)
+
+    async def on_busy(event, data):
+        pass
+
+    asyncio.run(AdmissionMiddleware(on_busy)(handler, object(), {}))
+    assert sent == ["later"]
@@ -0,0 +1,181 @@
+import asyncio
+
+import httpx
+import pytest
+
+from backend import BackendClient, LatencyWindow, RequestPolicy
+
+# без повторов, чтобы считать ровно upstream-запросы
+NO_RETRIES = {("GET", "/wb/auth/status"): RequestPolicy(read=5.0, total=5.0)}
+
+
+def _client(handler) -> BackendClient:
+    return BackendClient("http://backend", transport=httpx.MockTransport(handler), policies=NO_RETRIES)
+
+
+def test_identical_gets_share_one_upstream_request():
+    calls = []
+
+    async def handler(request):
+        calls.append(request.url.path)
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, json={"authorized": True})
+
+    async def main():
+        client = _client(handler)
+        await client.open()
+        results = await asyncio.gather(*(client.wb_auth_status(1) for _ in range(10)))
+        await client.aclose()
+        return client, results
+
+    client, results = asyncio.run(main())
+    assert calls == ["/wb/auth/status"]
+    assert results == [{"authorized": True}] * 10
+    assert client.coalescing_stats() == {"upstream_gets": 1, "coalesced_gets": 9, "inflight_gets": 0}
+
+
+def test_leader_failure_is_delivered_to_every_follower():
+    async def handler(request):
+        await asyncio.sleep(0.05)
+        raise httpx.ConnectError("down", request=request)
+
+    async def main():
+        client = _client(handler)
+        await client.open()
+        results = await asyncio.gather(*(client.wb_auth_status(1) for _ in range(5)), return_exceptions=True)
+        await client.aclose()
+        return results
+
+    results = asyncio.run(main())
+    assert all(isinstance(r, httpx.ConnectError) for r in results)
+
+
+def test_cancelled_leader_does_not_cancel_followers():
+    calls = []
+
+    async def handler(request):
+        calls.append(request.url.path)
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, json={"authorized": False})
+
+    async def main():
+        client = _client(handler)
+        await client.open()
+        leader = asyncio.create_task(client.wb_auth_status(1))
+        await asyncio.sleep(0.01)
+        followers = [asyncio.create_task(client.wb_auth_status(1)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        results = await asyncio.gather(*followers)
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        await client.aclose()
+        return results
+
+    results = asyncio.run(main())
+    assert results == [{"authorized": False}] * 3
+    assert calls == ["/wb/auth/status"]
+
+
+def test_upstream_request_is_cancelled_when_nobody_waits():
+    async def main():
+        entered = asyncio.Event()
+        finished = []
+
+        async def handler(request):
+            entered.set()
+            await asyncio.sleep(1)
+            finished.append(True)
+            return httpx.Response(200, json={})
+
+        client = _client(handler)
+        await client.open()
+        callers = [asyncio.create_task(client.wb_auth_status(1)) for _ in range(2)]
+        await entered.wait()
+        for caller in callers:
+            caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        # отмена доходит до upstream-запроса за несколько итераций цикла
+        await asyncio.sleep(0.01)
+        stats = client.coalescing_stats()
+        await client.aclose()
+        return finished, stats
+
+    finished, stats = asyncio.run(main())
+    assert finished == []
+    assert stats["inflight_gets"] == 0
+
+
+class _Trickle(httpx.AsyncByteStream):
+    """
+    Тело ответа приходит по байту: read-таймаут на каждый кусок не срабатывает.
+    """
+
+    async def __aiter__(self):
+        for _ in range(50):
+            await asyncio.sleep(0.02)
+            yield b" "
+
+
+def test_total_deadline_cuts_a_trickling_response():
+    policies = {("GET", "/wb/auth/status"): RequestPolicy(read=5.0, total=0.2)}
+
+    async def handler(request):
+        return httpx.Response(200, stream=_Trickle())
+
+    async def main():
+        client = BackendClient("http://backend", transport=httpx.MockTransport(handler), policies=policies)
+        await client.open()
+        started = asyncio.get_running_loop().time()
+        with pytest.raises(httpx.TimeoutException):
+            await client.request_with_retries("GET", "/wb/auth/status", params={"telegram_id": 1})
+        elapsed = asyncio.get_running_loop().time() - started
+        await client.aclose()
+        return elapsed
+
+    assert asyncio.run(main()) < 0.5
+
+
+def test_hedge_is_not_counted_as_retry():
+    retries = []
+    calls = []
+
+    class Instrumentation:
+        def retry(self, method, endpoint):
+            retries.append(endpoint)
+
+        def observe(self, *args):
+            pass
+
+        def hedge(self, *args):
+            pass
+
+    policies = {("GET", "/requests/history"): RequestPolicy(read=5.0, total=5.0, retries=1, hedge=True)}
+
+    async def handler(request):
+        calls.append(request.url.path)
+        if len(calls) == 1:
+            return httpx.Response(503)
+        if len(calls) == 2:
+            await asyncio.sleep(0.5)
+        return httpx.Response(200, json=[])
+
+    async def main():
+        client = BackendClient(
+            "http://backend",
+            transport=httpx.MockTransport(handler),
+            policies=policies,
+            instrumentation=Instrumentation(),
+            hedge_percentile=0.95,
+        )
+        window = client._latencies[("GET", "/requests/history")] = LatencyWindow()
+        for _ in range(window.min_samples):
+            window.observe(0.01)
+        await client.open()
+        resp = await client.request_with_retries("GET", "/requests/history")
+        await client.aclose()
+        return resp.status_code
+
+    assert asyncio.run(main()) == 200
+    assert len(calls) == 3  # первая попытка, повтор и hedge повтора
+    assert retries == ["/requests/history"]
@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+from cache import LRUCache, TTLCache, WarehouseCatalog
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert "b" not in cache
+    assert cache.get("a") == 1 and cache.get("c") == 3
+
+
+def test_ttl_cache_expires_entries():
+    clock = Clock()
+    cache = TTLCache(10, ttl=5, clock=clock)
+    cache.set("k", "v")
+    clock.now = 4.9
+    assert cache.get("k") == "v"
+    clock.now = 5.0
+    assert cache.get("k") is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_ttl_cache_respects_byte_budget():
+    cache = TTLCache(10, ttl=60, max_bytes=10, sizeof=len)
+    cache.set("a", "xxxx")
+    cache.set("b", "yyyy")
+    cache.set("c", "zzzz")
+    assert "a" not in cache._data
+    assert cache.total_bytes == 8
+    cache.set("big", "x" * 11)
+    assert "big" not in cache._data
+
+
+def _catalog(fetch, **kwargs):
+    return WarehouseCatalog(fetch, fetch_limit=2, **kwargs)
+
+
+def test_catalog_concurrent_cold_start_loads_once():
+    calls = []
+
+    async def fetch(page, limit):
+        calls.append(page)
+        await asyncio.sleep(0.01)
+        items = [{"id": page * 2 + 1, "name": f"w{page}a"}, {"id": page * 2 + 2, "name": f"w{page}b"}]
+        return {"items": items, "pages": 2}
+
+    async def main():
+        catalog = _catalog(fetch)
+        await asyncio.gather(*(catalog.ensure_loaded() for _ in range(20)))
+        return catalog
+
+    catalog = asyncio.run(main())
+    assert calls == [0, 1]
+    assert len(catalog) == 4
+    assert catalog.name(3) == "w1a"
+
+
+def test_catalog_backs_off_after_failed_load():
+    calls = []
+
+    async def fetch(page, limit):
+        calls.append(page)
+        raise RuntimeError("backend down")
+
+    async def main(backoff):
+        catalog = _catalog(fetch, failure_backoff=backoff)
+        for _ in range(5):
+            with pytest.raises(RuntimeError):
+                await catalog.ensure_loaded()
+
+    asyncio.run(main(60))
+    assert len(calls) == 1
+
+    calls.clear()
+    asyncio.run(main(0))
+    assert len(calls) == 5
@@ -0,0 +1,91 @@
+from typing import NamedTuple
+
+import pytest
+
+from callback_codec import MARK, MAX_CALLBACK_DATA, CallbackCodec, MovesAccount, SlotTaskOpen, codec
+
+
+def _codec() -> CallbackCodec:
+    local = CallbackCodec()
+
+    @local.register(0x01, "item_open:")
+    class ItemOpen(NamedTuple):
+        item_id: int
+        name: str
+
+    return local
+
+
+def test_round_trip_keeps_values():
+    for args in (SlotTaskOpen(0), SlotTaskOpen(-1), SlotTaskOpen(2**40), MovesAccount("акк 1:ИП")):
+        data = codec.pack(args)
+        assert data.startswith(MARK)
+        assert codec.unpack(data) == args
+
+
+def test_every_registered_button_fits_with_large_ids():
+    for spec in codec._by_type.values():
+        values = [2**53 if kind is int else "x" * 20 for _, kind in spec.fields]
+        assert len(codec.pack(spec.args_type(*values)).encode()) <= MAX_CALLBACK_DATA
+
+
+def test_pack_refuses_callback_data_over_64_bytes():
+    with pytest.raises(ValueError):
+        codec.pack(MovesAccount("x" * 60))
+
+
+def test_other_version_is_rejected():
+    with pytest.raises(ValueError):
+        CallbackCodec(version=2).unpack(codec.pack(SlotTaskOpen(5)))
+
+
+@pytest.mark.parametrize("data", ["~", "~AQ", "~Af8", "~ARGA", "not packed"])
+def test_malformed_data_raises_value_error(data):
+    with pytest.raises(ValueError):
+        codec.unpack(data)
+
+
+def test_trailing_bytes_are_rejected():
+    local = _codec()
+    packed = local.pack(local._by_opcode[1].args_type(1, "ab"))
+    # тот же opcode, но полей меньше: лишние байты в хвосте
+    short = CallbackCodec()
+
+    @short.register(0x01, "item_open:")
+    class ItemOpen(NamedTuple):
+        item_id: int
+
+    with pytest.raises(ValueError):
+        short.unpack(packed)
+
+
+def test_parse_legacy_string():
+    local = _codec()
+    args_type = local._by_opcode[1].args_type
+    assert local.parse_legacy(args_type, "7:name:with:colons") == args_type(7, "name:with:colons")
+    with pytest.raises(ValueError):
+        local.parse_legacy(args_type, "7")
+    with pytest.raises(ValueError):
+        local.parse_legacy(args_type, "x:name")
+
+
+def test_expand_and_route_for_packed_and_legacy():
+    data = codec.pack(SlotTaskOpen(42))
+    assert codec.expand(data) == "slot_task_open:42"
+    assert codec.route(data) == "slot_task_open"
+    assert codec.route("slot_task_open:42") == "slot_task_open"
+    assert codec.route("~!!!!") == "~invalid"
+
+
+def test_duplicate_opcode_is_rejected():
+    local = _codec()
+    with pytest.raises(ValueError):
+
+        @local.register(0x01, "other:")
+        class Other(NamedTuple):
+            value: int
+
+
+def test_route_of_legacy_button_without_colon_drops_the_id():
+    assert codec.route("slot_auto_123") == "slot_auto"
+    assert codec.route("slot_auto_456") == "slot_auto"
@@ -0,0 +1,97 @@
+import pytest
+
+from circuit import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpen
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _breaker(clock: Clock) -> CircuitBreaker:
+    return CircuitBreaker("/wb/overview", window=10, min_calls=4, failure_rate=0.5, cooldown=5, clock=clock)
+
+
+def _fail(breaker: CircuitBreaker, times: int) -> None:
+    for _ in range(times):
+        breaker.record(False, breaker.allow())
+
+
+def test_opens_when_failure_rate_reached():
+    breaker = _breaker(Clock())
+    breaker.record(True, breaker.allow())
+    _fail(breaker, 2)
+    assert breaker.state == CLOSED  # меньше min_calls
+    _fail(breaker, 1)
+    assert breaker.state == OPEN
+    assert breaker.opened == 1
+
+
+def test_old_failures_leave_the_window():
+    clock = Clock()
+    breaker = _breaker(clock)
+    _fail(breaker, 3)
+    clock.now = 11
+    for _ in range(3):
+        breaker.record(True, breaker.allow())
+    _fail(breaker, 1)
+    assert breaker.state == CLOSED
+
+
+def test_client_errors_are_not_counted():
+    breaker = _breaker(Clock())
+    for _ in range(10):
+        breaker.record(None, breaker.allow())
+    assert breaker.state == CLOSED
+
+
+def test_open_circuit_rejects_with_remaining_cooldown():
+    clock = Clock()
+    breaker = _breaker(clock)
+    _fail(breaker, 4)
+    clock.now = 2
+    with pytest.raises(CircuitOpen) as exc:
+        breaker.allow()
+    assert exc.value.retry_after == pytest.approx(3)
+    assert breaker.rejected == 1
+
+
+def test_successful_probe_closes_circuit():
+    clock = Clock()
+    breaker = _breaker(clock)
+    _fail(breaker, 4)
+    clock.now = 5
+    probe = breaker.allow()
+    assert probe and breaker.state == HALF_OPEN
+    # второй вызов ждёт исхода пробного
+    with pytest.raises(CircuitOpen):
+        breaker.allow()
+    breaker.record(True, probe)
+    assert breaker.state == CLOSED
+    assert breaker.allow() is False
+
+
+def test_failed_probe_reopens_circuit():
+    clock = Clock()
+    breaker = _breaker(clock)
+    _fail(breaker, 4)
+    clock.now = 5
+    breaker.record(False, breaker.allow())
+    assert breaker.state == OPEN and breaker.opened == 2
+    clock.now = 9
+    with pytest.raises(CircuitOpen) as exc:
+        breaker.allow()
+    assert exc.value.retry_after == pytest.approx(1)
+
+
+def test_cancelled_probe_frees_the_probe_slot():
+    clock = Clock()
+    breaker = _breaker(clock)
+    _fail(breaker, 4)
+    clock.now = 5
+    breaker.record(None, breaker.allow())
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow() is True
@@ -0,0 +1,231 @@
+import asyncio
+import time
+
+import httpx
+
+from circuit import CircuitOpen
+from jobs import DONE, FAILED, PENDING, JobQueue, JobStore, RemoteJobTracker
+
+
+def _queue(tmp_path, **kwargs) -> JobQueue:
+    kwargs.setdefault("workers", 1)
+    kwargs.setdefault("backoff_base", 0.01)
+    return JobQueue(JobStore(str(tmp_path / "jobs.sqlite3")), **kwargs)
+
+
+def _server_error() -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "http://backend/wb/autobooking")
+    return httpx.HTTPStatusError("boom", request=request, response=httpx.Response(503, request=request))
+
+
+async def _run_until(queue: JobQueue, finished: asyncio.Event) -> None:
+    await queue.start()
+    try:
+        await asyncio.wait_for(finished.wait(), 5)
+    finally:
+        await queue.stop()
+
+
+def test_retryable_error_is_retried_until_success(tmp_path):
+    attempts = []
+    finished = asyncio.Event()
+
+    async def handler(job):
+        attempts.append(job.attempts)
+        if len(attempts) < 3:
+            raise _server_error()
+        return {"ok": True}
+
+    async def on_success(job):
+        finished.set()
+
+    async def main():
+        queue = _queue(tmp_path)
+        queue.register("test", handler, on_success=on_success)
+        job, created = await queue.submit("test", {"x": 1}, key="k")
+        assert created and job.status == PENDING
+        await _run_until(queue, finished)
+
+    asyncio.run(main())
+    assert attempts == [1, 2, 3]
+
+
+def test_client_error_fails_without_retry(tmp_path):
+    attempts = []
+    failed = []
+    finished = asyncio.Event()
+
+    async def handler(job):
+        attempts.append(job.attempts)
+        raise ValueError("bad payload")
+
+    async def on_failure(job):
+        failed.append(job.last_error)
+        finished.set()
+
+    async def main():
+        queue = _queue(tmp_path)
+        queue.register("test", handler, on_failure=on_failure)
+        await queue.submit("test", {"x": 1}, key="k")
+        await _run_until(queue, finished)
+
+    asyncio.run(main())
+    assert attempts == [1]
+    assert failed == ["bad payload"]
+
+
+def test_retries_stop_at_max_attempts(tmp_path):
+    attempts = []
+    finished = asyncio.Event()
+
+    async def handler(job):
+        attempts.append(job.attempts)
+        raise httpx.ConnectError("down")
+
+    async def on_failure(job):
+        finished.set()
+
+    async def main():
+        queue = _queue(tmp_path, max_attempts=2)
+        queue.register("test", handler, on_failure=on_failure)
+        await queue.submit("test", {"x": 1}, key="k")
+        await _run_until(queue, finished)
+
+    asyncio.run(main())
+    assert attempts == [1, 2]
+
+
+def test_same_key_returns_existing_job(tmp_path):
+    async def handler(job):
+        return None
+
+    async def main():
+        queue = _queue(tmp_path)
+        queue.register("test", handler)
+        first, created_first = await queue.submit("test", {"x": 1}, key="k")
+        second, created_second = await queue.submit("test", {"x": 2}, key="k")
+        await queue.store.close()
+        return created_first, created_second, second
+
+    created_first, created_second, second = asyncio.run(main())
+    assert created_first and not created_second
+    assert second.payload == {"x": 1}
+
+
+def test_done_job_is_not_rerun_but_failed_job_is(tmp_path):
+    async def handler(job):
+        return None
+
+    async def main():
+        queue = _queue(tmp_path)
+        queue.register("test", handler)
+        await queue.submit("test", {}, key="done")
+        await queue.store.finish("done", DONE)
+        await queue.submit("test", {}, key="failed")
+        await queue.store.finish("failed", FAILED, error="boom")
+        done, done_created = await queue.submit("test", {}, key="done")
+        failed, failed_created = await queue.submit("test", {}, key="failed")
+        await queue.store.close()
+        return done, done_created, failed, failed_created
+
+    done, done_created, failed, failed_created = asyncio.run(main())
+    assert not done_created and done.status == DONE
+    assert failed_created and failed.status == PENDING
+
+
+def test_missing_key_falls_back_to_payload_hash(tmp_path):
+    async def handler(job):
+        return None
+
+    async def main():
+        queue = _queue(tmp_path)
+        queue.register("test", handler)
+        first, _ = await queue.submit("test", {"a": 1, "b": 2})
+        second, created = await queue.submit("test", {"b": 2, "a": 1})
+        await queue.store.close()
+        return first.key, second.key, created
+
+    first_key, second_key, created = asyncio.run(main())
+    assert first_key == second_key
+    assert not created
+
+
+def test_blocking_runs_do_not_take_poll_slots():
+    updates = {}
+
+    async def main():
+        tracker = RemoteJobTracker(poll_interval=0.01, max_concurrent_polls=1, max_concurrent_runs=1)
+        release = asyncio.Event()
+
+        async def slow_call():
+            await release.wait()
+            return {"created": 1}
+
+        async def poll():
+            return {"status": "done"}
+
+        def on_update(key):
+            async def callback(status):
+                updates.setdefault(key, []).append(status["status"])
+
+            return callback
+
+        assert tracker.run("slow", slow_call, on_update("slow"))
+        assert not tracker.run("slow", slow_call, on_update("slow"))
+        assert tracker.track("poll", poll, on_update("poll"))
+        await asyncio.sleep(0.05)
+        # опрос прошёл, пока синхронный вызов ещё держит своё место
+        assert updates == {"poll": ["done"]}
+        release.set()
+        await asyncio.sleep(0.01)
+        await tracker.stop()
+
+    asyncio.run(main())
+    assert updates == {"poll": ["done"], "slow": ["done"]}
+
+
+def test_stop_lets_in_flight_poll_finish():
+    updates = []
+
+    async def main():
+        tracker = RemoteJobTracker(poll_interval=60)
+        started = asyncio.Event()
+
+        async def poll():
+            started.set()
+            await asyncio.sleep(0.05)
+            return {"status": "done"}
+
+        async def on_update(status):
+            updates.append(status["status"])
+
+        tracker.track("job", poll, on_update)
+        await started.wait()
+        await tracker.stop(timeout=1.0)
+        return tracker.stats()
+
+    assert asyncio.run(main()) == {"tracked_jobs": 0}
+    assert updates == ["done"]
+
+
+def test_open_circuit_retry_waits_for_cooldown(tmp_path):
+    started = []
+    finished = asyncio.Event()
+
+    async def handler(job):
+        started.append(time.monotonic())
+        if len(started) == 1:
+            raise CircuitOpen("/wb/autobooking", 0.2)
+
+    async def on_success(job):
+        finished.set()
+
+    async def main():
+        queue = _queue(tmp_path)
+        queue.register("test", handler, on_success=on_success)
+        await queue.submit("test", {}, key="k")
+        await _run_until(queue, finished)
+
+    asyncio.run(main())
+    assert len(started) == 2
+    assert started[1] - started[0] >= 0.2
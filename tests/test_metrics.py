@@ -0,0 +1,18 @@
+import pytest
+
+from metrics import Registry
+
+
+def test_callback_counter_is_exported_as_counter():
+    reg = Registry()
+    reg.callback_counter("jobs_shed_total", "Shed jobs", lambda: {("read",): 3}, ("class",))
+    assert reg.render() == (
+        "# HELP jobs_shed_total Shed jobs\n"
+        "# TYPE jobs_shed_total counter\n"
+        'jobs_shed_total{class="read"} 3\n'
+    )
+
+
+def test_callback_counter_requires_total_suffix():
+    with pytest.raises(ValueError):
+        Registry().callback_counter("jobs_shed", "Shed jobs", lambda: {})
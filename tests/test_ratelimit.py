@@ -0,0 +1,30 @@
+from ratelimit import TokenBucket
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_refund_does_not_exceed_capacity():
+    clock = Clock()
+    bucket = TokenBucket(rate=1, capacity=2, clock=clock)
+    assert bucket.try_acquire() == 0
+    clock.now = 10  # за это время ведро снова наполнилось
+    bucket.try_acquire()
+    bucket.refund()
+    bucket.refund()
+    assert bucket.tokens == 2
+    assert bucket.full()
+
+
+def test_bucket_waits_when_empty():
+    clock = Clock()
+    bucket = TokenBucket(rate=2, capacity=1, clock=clock)
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() == 0.5
+    clock.now = 0.5
+    assert bucket.try_acquire() == 0
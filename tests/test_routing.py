@@ -0,0 +1,125 @@
+import asyncio
+from typing import NamedTuple
+
+import pytest
+from aiogram.types import CallbackQuery, User
+
+from callback_codec import CallbackCodec
+from metrics import callback_unrouted
+from routing import UNKNOWN_ROUTE, CallbackRouter
+
+local_codec = CallbackCodec()
+
+
+@local_codec.register(0x01, "task_open:")
+class TaskOpen(NamedTuple):
+    task_id: int
+
+
+async def on_menu(callback):
+    pass
+
+
+async def on_task(callback):
+    pass
+
+
+async def on_task_list(callback):
+    pass
+
+
+async def on_task_open(callback, callback_args):
+    pass
+
+
+async def on_invalid(callback):
+    pass
+
+
+def _router() -> CallbackRouter:
+    router = CallbackRouter(local_codec, invalid=on_invalid)
+    router.exact("menu_main", on_menu)
+    router.prefix("task_", on_task)
+    router.prefix("task_list", on_task_list)
+    router.typed(TaskOpen, on_task_open)
+    return router
+
+
+def _callback(data: str) -> CallbackQuery:
+    return CallbackQuery(id="1", from_user=User(id=1, is_bot=False, first_name="a"), chat_instance="1", data=data)
+
+
+def test_exact_match_wins_over_prefix():
+    router = _router()
+    router.exact("task_x", on_menu)
+    resolved = router.resolve("task_x")
+    assert resolved.match == "exact" and resolved.handler.callback is on_menu
+
+
+def test_longest_prefix_is_chosen():
+    router = _router()
+    assert router.resolve("task_list:3").handler.callback is on_task_list
+    assert router.resolve("task_other").handler.callback is on_task
+    assert router.resolve("tas").match == "miss"
+
+
+def test_typed_route_accepts_packed_and_legacy_data():
+    router = _router()
+    packed = router.resolve(local_codec.pack(TaskOpen(7)))
+    legacy = router.resolve("task_open:7")
+    assert packed.match == "packed" and legacy.match == "prefix"
+    assert packed.handler.callback is legacy.handler.callback is on_task_open
+    assert packed.args == legacy.args == TaskOpen(7)
+
+
+def test_undecodable_data_is_invalid_not_routed():
+    router = _router()
+    assert router.resolve("task_open:abc").match == "invalid"
+    assert router.resolve("~garbage").match == "invalid"
+
+
+def test_duplicate_routes_are_rejected():
+    router = _router()
+    with pytest.raises(ValueError):
+        router.exact("menu_main", on_task)
+    with pytest.raises(ValueError):
+        router.prefix("task_", on_menu)
+    with pytest.raises(ValueError):
+        router.typed(TaskOpen, on_menu)
+    with pytest.raises(ValueError):
+        router.prefix("~x", on_menu)
+
+
+def test_route_filter_passes_handler_and_args():
+    router = _router()
+
+    async def main():
+        return (
+            await router._route(_callback("menu_main")),
+            await router._route(_callback("task_open:9")),
+            await router._route(_callback("task_open:x")),
+            await router._route(_callback("unknown")),
+        )
+
+    exact, typed, invalid, miss = asyncio.run(main())
+    assert exact["handler"].callback is on_menu and "callback_args" not in exact
+    assert typed["callback_args"] == TaskOpen(9)
+    assert invalid["handler"].callback is on_invalid
+    assert miss is False
+
+
+def test_stats_count_routes():
+    assert _router().stats() == {"exact_routes": 1, "prefix_routes": 3, "typed_routes": 1}
+
+
+def test_unmatched_callbacks_share_one_unrouted_label():
+    router = _router()
+    before = callback_unrouted.get("cb:" + UNKNOWN_ROUTE)
+
+    async def main():
+        for data in ("old_button_1", "old_button_2", "stale:3"):
+            await router._route(_callback(data))
+
+    asyncio.run(main())
+    assert callback_unrouted.get("cb:" + UNKNOWN_ROUTE) - before == 3
+    assert callback_unrouted.get("cb:old_button_1") == 0
@@ -0,0 +1,124 @@
+import asyncio
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from storage import StateSession
+
+KEY = StorageKey(bot_id=1, chat_id=1, user_id=1)
+
+
+class CountingStorage(MemoryStorage):
+    """
+    Считает обращения к хранилищу; вложенные вызовы (update_data внутри
+    MemoryStorage идёт через get_data/set_data) не считаются.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.calls: list[str] = []
+        self._depth = 0
+
+    async def _count(self, name, call):
+        if not self._depth:
+            self.calls.append(name)
+        self._depth += 1
+        try:
+            return await call
+        finally:
+            self._depth -= 1
+
+    async def get_data(self, key):
+        return await self._count("get_data", super().get_data(key))
+
+    async def set_data(self, key, data):
+        await self._count("set_data", super().set_data(key, data))
+
+    async def update_data(self, key, data):
+        return await self._count("update_data", super().update_data(key, data))
+
+
+def test_commit_writes_only_changed_keys():
+    async def main():
+        storage = CountingStorage()
+        await storage.set_data(KEY, {"a": 1, "b": 1})
+        session = StateSession(storage)
+        await session.update_data(KEY, {"a": 2})
+        # другой апдейт того же пользователя успел записать b
+        await storage.update_data(KEY, {"b": 2})
+        storage.calls.clear()
+        await session.commit()
+        return list(storage.calls), await storage.get_data(KEY)
+
+    calls, data = asyncio.run(main())
+    assert data == {"a": 2, "b": 2}
+    assert calls == ["update_data"]
+
+
+def test_reads_go_to_storage_once():
+    async def main():
+        storage = CountingStorage()
+        await storage.set_data(KEY, {"a": 1})
+        storage.calls.clear()
+        session = StateSession(storage)
+        for _ in range(3):
+            await session.get_data(KEY)
+        await session.update_data(KEY, {"a": 2})
+        await session.commit()
+        return storage.calls
+
+    assert asyncio.run(main()) == ["get_data", "update_data"]
+
+
+def test_read_only_session_writes_nothing():
+    async def main():
+        storage = CountingStorage()
+        session = StateSession(storage)
+        await session.get_data(KEY)
+        await session.get_state(KEY)
+        storage.calls.clear()
+        await session.commit()
+        return storage.calls
+
+    assert asyncio.run(main()) == []
+
+
+def test_set_data_replaces_everything():
+    async def main():
+        storage = MemoryStorage()
+        await storage.set_data(KEY, {"a": 1, "b": 1})
+        session = StateSession(storage)
+        await session.set_data(KEY, {"c": 1})
+        await session.commit()
+        return await storage.get_data(KEY)
+
+    assert asyncio.run(main()) == {"c": 1}
+
+
+def test_rollback_keeps_only_message_tracking_keys():
+    async def main():
+        storage = MemoryStorage()
+        await storage.set_data(KEY, {"step": 1, "ui_message_ids": [10, 11]})
+        session = StateSession(storage, keep_on_rollback=("ui_message_ids",))
+        await session.set_state(KEY, "Form:name")
+        # сообщения уже удаляются в фоне, учёт очищен
+        await session.update_data(KEY, {"step": 2, "ui_message_ids": []})
+        await session.rollback()
+        return await storage.get_state(KEY), await storage.get_data(KEY)
+
+    state, data = asyncio.run(main())
+    assert state is None
+    assert data == {"step": 1, "ui_message_ids": []}
+
+
+def test_update_does_not_touch_storage_dict_before_commit():
+    async def main():
+        storage = MemoryStorage()
+        await storage.set_data(KEY, {"a": 1})
+        session = StateSession(storage)
+        await session.update_data(KEY, {"a": 2})
+        before = await storage.get_data(KEY)
+        await session.rollback()
+        return before, await storage.get_data(KEY)
+
+    assert asyncio.run(main()) == ({"a": 1}, {"a": 1})
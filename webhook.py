@@ -0,0 +1,152 @@
+"""
+Режим webhook: встроенный aiohttp-сервер принимает апдейты Telegram по HTTP.
+
+В отличие от long polling, апдейты приходят сами, а несколько реплик бота
+можно поставить за балансировщик (FSM при этом должен жить в общем
+хранилище, см. storage.py).
+"""
+import asyncio
+import logging
+from typing import Any, Callable, Coroutine
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+logger = logging.getLogger(__name__)
+
+
+class BoundedRequestHandler(SimpleRequestHandler):
+    """
+    Обработчик webhook-а: проверяет секрет, сразу отвечает Telegram 200
+    и обрабатывает апдейт в фоне. Без секрета любой, кто знает URL, мог бы
+    слать боту поддельные апдейты, поэтому он обязателен.
+
+    Одновременно в хендлерах находится не больше max_concurrency апдейтов,
+    остальные ждут семафора. Если ожидающих больше max_pending, отвечаем
+    503 — Telegram повторит доставку позже, а процесс не раздувает очередь.
+
+    Фоновые задачи апдейтов запускаются через spawn (Lifecycle.spawn), чтобы
+    остановка дождалась и тех, что уже получили 200, но ещё ждут семафора:
+    Telegram их повторно не пришлёт.
+    """
+
+    def __init__(
+        self,
+        dispatcher: Dispatcher,
+        bot: Bot,
+        *,
+        secret_token: str,
+        max_concurrency: int = 100,
+        max_pending: int = 1000,
+        spawn: Callable[[Coroutine[Any, Any, Any]], asyncio.Task] = asyncio.create_task,
+        **data: Any,
+    ) -> None:
+        if not secret_token:
+            raise ValueError("webhook secret_token is required")
+        super().__init__(
+            dispatcher=dispatcher,
+            bot=bot,
+            handle_in_background=True,
+            secret_token=secret_token,
+            **data,
+        )
+        self.max_pending = max_pending
+        self.spawn = spawn
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.rejected_updates = 0
+
+    async def _background_feed_update(self, bot: Bot, update: dict[str, Any]) -> None:
+        async with self._semaphore:
+            try:
+                result = await self.dispatcher.feed_raw_update(bot=bot, update=update, **self.data)
+                if isinstance(result, TelegramMethod):
+                    await self.dispatcher.silent_call_request(bot=bot, result=result)
+            except Exception:
+                logger.exception("Error processing webhook update")
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        if len(self._background_feed_update_tasks) >= self.max_pending:
+            self.rejected_updates += 1
+            return web.Response(status=503, text="Busy")
+        update = await request.json(loads=bot.session.json_loads)
+        task = self.spawn(self._background_feed_update(bot=bot, update=update))
+        self._background_feed_update_tasks.add(task)
+        task.add_done_callback(self._background_feed_update_tasks.discard)
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    async def close(self) -> None:
+        # принятые апдейты дорабатывают, а сессию бота закрывает Lifecycle
+        # (lifecycle.py) — с дедлайном и после фоновых задач
+        pass
+
+    def stats(self) -> dict:
+        return {
+            "pending_updates": len(self._background_feed_update_tasks),
+            "rejected_updates": self.rejected_updates,
+        }
+
+
+async def run_webhook(
+    dp: Dispatcher,
+    bot: Bot,
+    *,
+    host: str,
+    port: int,
+    path: str,
+    url: str | None = None,
+    secret_token: str,
+    max_concurrency: int = 100,
+    max_pending: int = 1000,
+    spawn: Callable[[Coroutine[Any, Any, Any]], asyncio.Task] = asyncio.create_task,
+    stop: asyncio.Event | None = None,
+) -> None:
+    """
+    Поднимает HTTP-сервер webhook-а и работает до stop (или до отмены).
+    По выходе сервер перестаёт принимать запросы — Telegram отправит
+    апдейты повторно, — а уже принятые дорабатывают в фоне.
+
+    secret_token обязателен: Telegram передаёт его в заголовке каждого
+    запроса, апдейты без него отклоняются. У всех реплик он должен совпадать.
+
+    Если задан url, при старте регистрирует webhook в Telegram. С несколькими
+    репликами достаточно задать url одной из них; при остановке webhook не
+    снимается, чтобы не оборвать доставку остальным.
+    """
+    app = web.Application()
+    handler = BoundedRequestHandler(
+        dp,
+        bot,
+        secret_token=secret_token,
+        max_concurrency=max_concurrency,
+        max_pending=max_pending,
+        spawn=spawn,
+    )
+    handler.register(app, path=path)
+
+    async def healthz(request: web.Request) -> web.Response:
+        return web.json_response({"status": "ok", **handler.stats()})
+
+    app.router.add_get("/healthz", healthz)
+    setup_application(app, dp, bot=bot)
+
+    if url:
+        async def set_webhook(app: web.Application) -> None:
+            await bot.set_webhook(
+                url=url,
+                secret_token=secret_token,
+                allowed_updates=dp.resolve_used_update_types(),
+            )
+
+        app.on_startup.append(set_webhook)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host=host, port=port)
+    try:
+        await site.start()
+        logger.info("Webhook server listening on %s:%s%s", host, port, path)
+        await (stop or asyncio.Event()).wait()
+    finally:
+        await runner.cleanup()